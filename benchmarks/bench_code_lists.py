@@ -0,0 +1,32 @@
+"""
+throughput of codelist resolution against a local xrepository stand-in with a fixed latency per request, so the
+results do not depend on the network (every codelist needs two requests)
+"""
+import pytest
+
+from ozg.xdatenfelder import fim_code_lists
+from ozg.xdatenfelder.fim_code_lists import CodeListCache, prefetch_code_lists
+from ozg.xdatenfelder.xrepository_server import XRepositoryServer
+from .synthetic import code_list_urn
+
+CODE_LISTS = 32
+LATENCY = 0.02
+
+
+@pytest.fixture(scope="module")
+def xrepository():
+    server = XRepositoryServer({code_list_urn(index): (f"{code_list_urn(index)}_1",
+                                                       [(str(key), f"Eintrag {key}") for key in range(50)])
+                                for index in range(CODE_LISTS)}, latency=LATENCY)
+    with server:
+        previous = fim_code_lists.set_xrepository_api(server.api)
+        yield server
+        fim_code_lists.set_xrepository_api(previous)
+
+
+@pytest.mark.parametrize("max_workers", [1, 8, 32])
+def test_prefetch_code_lists(benchmark, xrepository, max_workers):
+    urns = [code_list_urn(index) for index in range(CODE_LISTS)]
+    code_lists = benchmark.pedantic(lambda: prefetch_code_lists(urns, cache=CodeListCache(), max_workers=max_workers),
+                                    rounds=3)
+    assert all(code_list.version for code_list in code_lists.values())
@@ -0,0 +1,74 @@
+"""
+benchmarks for parsing and schema generation, run with
+
+    pytest benchmarks --benchmark-autosave
+
+results are stored in .benchmarks/ and can be compared between releases with --benchmark-compare
+"""
+import pytest
+
+from ozg.xdatenfelder.parallel import ParallelFIMParser
+from ozg.xdatenfelder.parser import FIMParser
+from ozg.xdatenfelder.scan import scan_header
+
+
+def test_parser_init(benchmark, synthetic_schema, backend, code_list_cache):
+    parser = benchmark(FIMParser, synthetic_schema, code_list_cache=code_list_cache, backend=backend)
+    assert len(parser.form) > 0
+
+
+def test_parse_structure(benchmark, synthetic_schema, backend, code_list_cache):
+    parser = FIMParser(synthetic_schema, code_list_cache=code_list_cache, backend=backend)
+    benchmark(parser._parse_structure)
+    assert len(parser.form) > 0
+
+
+def test_to_json(benchmark, synthetic_schema, code_list_cache):
+    parser = FIMParser(synthetic_schema, code_list_cache=code_list_cache)
+
+    def setup():
+        # to_json is cached on the parser, so every round starts without any cached schema
+        parser.invalidate()
+
+    schema = benchmark.pedantic(lambda: parser.to_json, setup=setup, rounds=20)
+    assert len(schema["$defs"]) > 0
+
+
+def test_to_json_cached(benchmark, synthetic_schema, code_list_cache):
+    parser = FIMParser(synthetic_schema, code_list_cache=code_list_cache)
+    parser.to_json
+    benchmark(lambda: parser.to_json)
+
+
+def test_to_json_bytes(benchmark, synthetic_schema, code_list_cache):
+    parser = FIMParser(synthetic_schema, code_list_cache=code_list_cache)
+    parser.to_json
+
+    def setup():
+        # only the encoding is measured, the schema itself stays cached
+        parser._json_bytes = None
+
+    data = benchmark.pedantic(parser.to_json_bytes, setup=setup, rounds=20)
+    assert len(data) > 0
+
+
+def test_first_section_lazy(benchmark, synthetic_schema, backend, code_list_cache):
+    # time to the first page of a paginated form: parse lazily and render only the first group
+    def first_section():
+        parser = FIMParser(synthetic_schema, code_list_cache=code_list_cache, backend=backend, lazy=True)
+        return parser.section_json(parser.form[0].id)
+
+    section = benchmark(first_section)
+    assert "$defs" in section
+
+
+@pytest.mark.parametrize("executor", ParallelFIMParser.EXECUTORS)
+def test_parallel_parser_init(benchmark, synthetic_schema, code_list_cache, executor):
+    parser = benchmark(ParallelFIMParser, synthetic_schema, code_list_cache=code_list_cache, workers=4,
+                       executor=executor)
+    assert len(parser.form) > 0
+
+
+def test_scan_header(benchmark, synthetic_schema):
+    header = benchmark(scan_header, synthetic_schema)
+    assert header.id is not None
@@ -0,0 +1,36 @@
+import pytest
+
+from ozg.xdatenfelder.parser import FIMParser
+from .synthetic import generate_schema, stub_code_list_cache
+
+VERSIONS = {
+    "v1": FIMParser.FIM_VERSION_1,
+    "v2": FIMParser.FIM_VERSION_2,
+}
+
+SIZES = [100, 1000, 5000]
+
+
+@pytest.fixture(params=list(VERSIONS), scope="session")
+def fim_version(request):
+    return VERSIONS[request.param]
+
+
+@pytest.fixture(params=SIZES, ids=[f"{size}fields" for size in SIZES], scope="session")
+def schema_size(request):
+    return request.param
+
+
+@pytest.fixture(scope="session")
+def synthetic_schema(fim_version, schema_size):
+    return generate_schema(schema_size, fim_version)
+
+
+@pytest.fixture(params=FIMParser.BACKENDS, scope="session")
+def backend(request):
+    return request.param
+
+
+@pytest.fixture
+def code_list_cache():
+    return stub_code_list_cache()
@@ -0,0 +1,44 @@
+"""
+measures the memory held by a parsed FIMParser per field, run with
+
+    python -m benchmarks.memory [number of fields]
+"""
+import gc
+import inspect
+import sys
+import tracemalloc
+
+from ozg.xdatenfelder.parser import FIMParser
+from .synthetic import generate_schema, stub_code_list_cache
+
+
+def measure(xml: str, **kwargs):
+    """
+    :return: the number of bytes allocated by the parser (and still alive after parsing) and the parser
+    """
+    gc.collect()
+    tracemalloc.start()
+    parser = FIMParser(xml, code_list_cache=stub_code_list_cache(), **kwargs)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, parser
+
+
+def main(fields: int = 5000):
+    options = [{}]
+    if "keep_xml" in inspect.signature(FIMParser.__init__).parameters:
+        options.append({"keep_xml": True})
+
+    for version in [FIMParser.FIM_VERSION_1, FIMParser.FIM_VERSION_2]:
+        xml = generate_schema(fields, version)
+        for backend in FIMParser.BACKENDS:
+            for kwargs in options:
+                size, parser = measure(xml, backend=backend, **kwargs)
+                occurrences = sum(1 for _ in parser.iter_fields())
+                print(f"{version.rsplit(':', 1)[-1]} {backend:<9} {str(kwargs):<20} {size / 1024 / 1024:8.2f} MiB "
+                      f"{size / occurrences:8.0f} bytes/field ({occurrences} fields, {len(parser.elements)} elements)")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
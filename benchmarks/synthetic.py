@@ -0,0 +1,139 @@
+"""
+generator for synthetic xDatenfelder schemas of arbitrary size to benchmark the parser
+"""
+from typing import List
+from xml.sax.saxutils import escape
+
+from ozg.xdatenfelder.fim_code_lists import CodeListCache, MemoryCodeListStore
+from ozg.xdatenfelder.parser import FIMParser
+
+
+ROOT_ELEMENTS = {
+    FIMParser.FIM_VERSION_1: "xdf:xdatenfelder.stammdatenschema.0102001",
+    FIMParser.FIM_VERSION_2: "xdf:xdatenfelder.stammdatenschema.0102",
+}
+
+DATA_TYPES = ["text", "date", "bool", "num", "num_int", "num_currency"]
+
+
+def code_list_urn(index: int) -> str:
+    return f"urn:ozg:benchmark:codeliste:{index}"
+
+
+def stub_code_list_cache(code_lists: int = 5, entries: int = 50) -> CodeListCache:
+    """
+    :return: an offline CodeListCache containing all codelists used by generated schemas, so benchmarks never
+    access xrepository
+    """
+    store = MemoryCodeListStore()
+    for index in range(code_lists):
+        urn = code_list_urn(index)
+        store.set_version(urn, f"{urn}_1", 0)
+        store.set_dataset(urn, f"{urn}_1", [(str(key), f"Eintrag {key}") for key in range(entries)])
+    return CodeListCache(store=store, ttl=None, offline=True)
+
+
+class SchemaGenerator(object):
+    def __init__(self, fields: int = 1000, depth: int = 3, fields_per_group: int = 8, shared_groups: int = 5,
+                 select_ratio: int = 5, code_lists: int = 5, version: str = FIMParser.FIM_VERSION_2):
+        """
+        generates a stammdatenschema with (at least) the given number of field occurrences. the schema consists of
+        chains of nested field groups, every group contains fields_per_group own fields and one of the shared groups
+        :param fields: min number of field occurrences in the schema
+        :param depth: nesting depth of the field groups
+        :param fields_per_group: number of own fields of each group
+        :param shared_groups: number of distinct groups that are reused all over the schema
+        :param select_ratio: every n-th field is a select field
+        :param code_lists: number of distinct codelists used by the select fields
+        :param version: the xDatenfelder version
+        """
+        self.fields = fields
+        self.depth = depth
+        self.fields_per_group = fields_per_group
+        self.shared_groups = shared_groups
+        self.select_ratio = select_ratio
+        self.code_lists = code_lists
+        self.version = version
+        self._next_id = 0
+
+    def _id(self, prefix: str) -> str:
+        self._next_id += 1
+        return f"{prefix}{90000000 + self._next_id}"
+
+    def _identification(self, element_id: str) -> str:
+        if self.version == FIMParser.FIM_VERSION_2:
+            return f"<xdf:identifikation><xdf:id>{element_id}</xdf:id><xdf:version>1.0</xdf:version></xdf:identifikation>"
+        return f"<xdf:id>{element_id}</xdf:id>"
+
+    def _header(self, element_id: str, name: str) -> str:
+        return f"{self._identification(element_id)}<xdf:name>{escape(name)}</xdf:name>" \
+               f"<xdf:bezeichnungEingabe>{escape(name)}</xdf:bezeichnungEingabe><xdf:beschreibung/>" \
+               f"<xdf:definition/><xdf:bezug/>"
+
+    def _code_list_reference(self, index: int) -> str:
+        urn = code_list_urn(index % self.code_lists)
+        if self.version == FIMParser.FIM_VERSION_2:
+            return f"<xdf:codelisteReferenz><xdf:genericodeIdentification><xdf:canonicalIdentification>{urn}" \
+                   f"</xdf:canonicalIdentification></xdf:genericodeIdentification></xdf:codelisteReferenz>"
+        return f"<xdf:codeliste><xdf:kennung>{urn}</xdf:kennung></xdf:codeliste>"
+
+    def _field(self, index: int) -> str:
+        element_id = self._id("F")
+        if self.select_ratio and index % self.select_ratio == 0:
+            field_type, data_type = "select", "text"
+            details = "<xdf:praezisierung/>" + self._code_list_reference(index)
+        else:
+            field_type, data_type = "input", DATA_TYPES[index % len(DATA_TYPES)]
+            details = '<xdf:praezisierung>{"minLength":"1","maxLength":"100"}</xdf:praezisierung>' \
+                if data_type == "text" else "<xdf:praezisierung/>"
+        return f"<xdf:datenfeld>{self._header(element_id, f'Feld {element_id}')}" \
+               f"<xdf:hilfetextEingabe>Hilfe zu {element_id}</xdf:hilfetextEingabe><xdf:hilfetextAusgabe/>" \
+               f"<xdf:feldart><code>{field_type}</code></xdf:feldart><xdf:datentyp><code>{data_type}</code></xdf:datentyp>" \
+               f"{details}<xdf:inhalt/></xdf:datenfeld>"
+
+    @staticmethod
+    def _structure(content: str, cardinality: str = "0:1") -> str:
+        return f"<xdf:struktur><xdf:anzahl>{cardinality}</xdf:anzahl><xdf:bezug/>" \
+               f"<xdf:enthaelt>{content}</xdf:enthaelt></xdf:struktur>"
+
+    def _group(self, children: List[str], name: str, element_id: str = None) -> str:
+        element_id = element_id or self._id("G")
+        return f"<xdf:datenfeldgruppe>{self._header(element_id, name)}<xdf:hilfetextEingabe/>" \
+               f"<xdf:hilfetextAusgabe/>{''.join(children)}</xdf:datenfeldgruppe>"
+
+    def generate(self) -> str:
+        """
+        :return: the generated schema as xml string
+        """
+        self._next_id = 0
+        shared = []
+        for index in range(self.shared_groups):
+            children = [self._structure(self._field(i)) for i in range(self.fields_per_group)]
+            shared.append(self._group(children, f"Gemeinsame Gruppe {index}"))
+        fields_per_shared_group = self.fields_per_group
+
+        structures = []
+        field_count = 0
+        chain = 0
+        while field_count < self.fields:
+            # build a chain of nested groups from the inside out
+            group = None
+            for level in range(self.depth):
+                children = [self._structure(self._field(i)) for i in range(self.fields_per_group)]
+                children.append(self._structure(shared[(chain + level) % len(shared)], "0:*") if shared else "")
+                if group is not None:
+                    children.append(self._structure(group, "1:1"))
+                group = self._group(children, f"Gruppe {chain}.{level}")
+                field_count += self.fields_per_group + (fields_per_shared_group if shared else 0)
+            structures.append(self._structure(group, "1:1"))
+            chain += 1
+
+        root = ROOT_ELEMENTS[self.version]
+        return f'<?xml version="1.0" encoding="UTF-8"?><{root} xmlns:xdf="{self.version}"><xdf:header/>' \
+               f"<xdf:stammdatenschema>{self._header('S90000000', 'Synthetisches Stammdatenschema')}" \
+               f"{''.join(structures)}</xdf:stammdatenschema></{root}>"
+
+
+def generate_schema(fields: int = 1000, version: str = FIMParser.FIM_VERSION_2, **kwargs) -> str:
+    """shortcut for SchemaGenerator(fields, version=version, **kwargs).generate()"""
+    return SchemaGenerator(fields, version=version, **kwargs).generate()
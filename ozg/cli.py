@@ -0,0 +1,248 @@
+import argparse
+import json
+import sys
+import time
+
+from ozg.xdatenfelder.catalogue import ElementCatalogue
+from ozg.xdatenfelder.code_list_index import CodeListIndex, CodeListLock
+from ozg.xdatenfelder.convert import ConversionSummary, convert_files, find_files
+from ozg.xdatenfelder.fim_code_lists import CodeListCache, FileCodeListStore
+from ozg.xdatenfelder.parser import FIMParser
+from ozg.xdatenfelder.scan import scan_files
+from ozg.xdatenfelder.service import SchemaServer
+from ozg.xdatenfelder.xrepository_server import XRepositoryServer
+
+
+def convert(args) -> int:
+    paths = find_files(args.inputs)
+    if not paths:
+        print("no xDatenfelder files found", file=sys.stderr)
+        return 1
+
+    if args.offline and not args.cache_dir and not args.index:
+        print("--offline requires the codelists from --cache-dir or --index", file=sys.stderr)
+        return 1
+
+    code_list_lock = CodeListLock.load(args.lock) if args.lock else None
+
+    summary = ConversionSummary()
+    start = time.perf_counter()
+    for result in convert_files(paths, args.output, processes=args.processes, cache_dir=args.cache_dir,
+                                offline=args.offline, backend=args.backend, code_list_lock=code_list_lock,
+                                pin_code_lists=args.pin_code_lists, index_path=args.index, instrument=args.stats,
+                                incremental=args.incremental):
+        summary.add(result)
+        if not result.ok:
+            print(f"failed to convert {result.path}: {result.error}", file=sys.stderr)
+        elif args.verbose:
+            changes = ""
+            if result.changed_defs is not None:
+                changes = f", {len(result.changed_defs)} changed/{len(result.removed_defs)} removed $defs"
+            print(f"{result.path} -> {result.output_path} ({result.fields} fields{changes}, {result.duration:.2f}s)")
+    summary.duration = time.perf_counter() - start
+
+    print(summary)
+    if args.stats:
+        print(f"stats (summed over all files): {summary.stats}")
+    return 1 if summary.failed else 0
+
+
+def lock(args) -> int:
+    paths = find_files(args.inputs)
+    if not paths:
+        print("no xDatenfelder files found", file=sys.stderr)
+        return 1
+
+    urns = set()
+    versions = {}
+    for path in paths:
+        parser = FIMParser(path, pin_code_lists=args.pin_code_lists)
+        urns.update(parser.code_list_urns)
+        versions.update({urn: version for urn, version in parser.code_list_versions.items() if version})
+
+    index = CodeListIndex.build(urns, versions=versions)
+    index.lock().save(args.output)
+    if args.index:
+        index.save(args.index)
+
+    print(f"locked {len(index)}/{len(urns)} codelists of {len(paths)} files")
+    return 0 if len(index) == len(urns) else 1
+
+
+def catalogue_build(args) -> int:
+    paths = find_files(args.inputs)
+    if not paths:
+        print("no xDatenfelder files found", file=sys.stderr)
+        return 1
+
+    with ElementCatalogue(args.catalogue) as catalogue:
+        errors = catalogue.add_files(paths)
+        for path, error in errors:
+            print(f"failed to index {path}: {error}", file=sys.stderr)
+        print(f"indexed {len(paths) - len(errors)}/{len(paths)} files, {len(catalogue)} elements")
+    return 1 if errors else 0
+
+
+def catalogue_usages(args) -> int:
+    with ElementCatalogue(args.catalogue) as catalogue:
+        usages = catalogue.usages(args.element_id, args.version)
+        for usage in usages:
+            print(f"{usage.schema_id or '-'}\t{usage.schema_version or '-'}\t{usage.parent_id or '-'}\t"
+                  f"{usage.element_version or '-'}\t{usage.path}")
+    return 0 if usages else 1
+
+
+def catalogue_fragment(args) -> int:
+    with ElementCatalogue(args.catalogue) as catalogue:
+        print(json.dumps(catalogue.fragment(args.element_id, args.version), ensure_ascii=False, indent=2))
+    return 0
+
+
+def list_schemas(args) -> int:
+    paths = find_files(args.inputs)
+    if not paths:
+        print("no xDatenfelder files found", file=sys.stderr)
+        return 1
+
+    failed = 0
+    for result in scan_files(paths, processes=args.processes):
+        if not result.ok:
+            failed += 1
+            print(f"failed to scan {result.path}: {result.error}", file=sys.stderr)
+        elif args.json:
+            print(json.dumps(result.header.to_dict(), ensure_ascii=False))
+        else:
+            header = result.header
+            print(f"{header.id}\t{header.element_version or '-'}\t{header.status or '-'}\t{header.name}\t"
+                  f"{header.path}")
+    return 1 if failed else 0
+
+
+def serve(args) -> int:
+    if args.index:
+        store = CodeListIndex.load(args.index)
+    else:
+        store = FileCodeListStore(args.cache_dir) if args.cache_dir else None
+    code_list_lock = CodeListLock.load(args.lock) if args.lock else None
+
+    server = SchemaServer(args.directory, host=args.host, port=args.port, reload_interval=args.reload_interval,
+                          code_list_cache=CodeListCache(store=store, offline=args.offline), backend=args.backend,
+                          code_list_lock=code_list_lock)
+    print(f"serving the schemas of {args.directory} at http://{args.host}:{args.port}/schemas")
+    server.run()
+    return 0
+
+
+def xrepository_server(args) -> int:
+    server = XRepositoryServer.from_index(CodeListIndex.load(args.index), latency=args.latency, host=args.host,
+                                          port=args.port)
+    for directory in args.documents:
+        server.add_directory(directory)
+    print(f"serving the codelists of {args.index} at http://{args.host}:{args.port}/api "
+          f"(set OZG_XREPOSITORY_API to use it)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="ozg", description="Tools to build Onlinezugangsgesetz stuff")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = commands.add_parser("convert", help="convert xDatenfelder files to json schema")
+    convert_parser.add_argument("inputs", nargs="+", help="directories or glob patterns of xDatenfelder files")
+    convert_parser.add_argument("-o", "--output", required=True, help="directory the json schemas are written to")
+    convert_parser.add_argument("-j", "--processes", type=int, default=None,
+                                help="number of worker processes (defaults to the number of cpus)")
+    convert_parser.add_argument("--cache-dir", default=None,
+                                help="directory to cache codelists in (a temporary directory if not set)")
+    convert_parser.add_argument("--offline", action="store_true",
+                                help="never access xrepository, only use codelists from --cache-dir or --index")
+    convert_parser.add_argument("--backend", choices=FIMParser.BACKENDS, default=FIMParser.BACKEND_UNTANGLE)
+    convert_parser.add_argument("--lock", default=None, help="lockfile with pinned codelist versions")
+    convert_parser.add_argument("--pin-code-lists", action="store_true",
+                                help="use the codelist versions referenced in the xDatenfelder files")
+    convert_parser.add_argument("--index", default=None,
+                                help="codelist index to read codelists from (instead of --cache-dir)")
+    convert_parser.add_argument("--stats", action="store_true",
+                                help="print where the time went (xml parsing, model, codelists, json, writing)")
+    convert_parser.add_argument("--incremental", action="store_true",
+                                help="only regenerate the $defs that changed since the last conversion to --output")
+    convert_parser.add_argument("-v", "--verbose", action="store_true", help="print every converted file")
+    convert_parser.set_defaults(func=convert)
+
+    lock_parser = commands.add_parser("lock", help="pin the codelists of xDatenfelder files to their versions")
+    lock_parser.add_argument("inputs", nargs="+", help="directories or glob patterns of xDatenfelder files")
+    lock_parser.add_argument("-o", "--output", default="ozg.lock", help="the lockfile to write")
+    lock_parser.add_argument("--index", default=None, help="also write all codelists to this codelist index")
+    lock_parser.add_argument("--pin-code-lists", action="store_true",
+                             help="lock the versions referenced in the files instead of the current ones")
+    lock_parser.set_defaults(func=lock)
+
+    list_parser = commands.add_parser("list", help="list id, version, status and name of xDatenfelder files (only "
+                                                   "their headers are read)")
+    list_parser.add_argument("inputs", nargs="+", help="directories or glob patterns of xDatenfelder files")
+    list_parser.add_argument("-j", "--processes", type=int, default=None,
+                             help="number of worker processes (defaults to the number of cpus)")
+    list_parser.add_argument("--json", action="store_true", help="print every header as a json line")
+    list_parser.set_defaults(func=list_schemas)
+
+    catalogue_parser = commands.add_parser("catalogue", help="index shared fields and field groups of a corpus")
+    catalogue_commands = catalogue_parser.add_subparsers(dest="catalogue_command", required=True)
+
+    build_catalogue_parser = catalogue_commands.add_parser("build", help="index xDatenfelder files")
+    build_catalogue_parser.add_argument("catalogue", help="the sqlite database of the catalogue")
+    build_catalogue_parser.add_argument("inputs", nargs="+", help="directories or glob patterns of xDatenfelder files")
+    build_catalogue_parser.set_defaults(func=catalogue_build)
+
+    usages_parser = catalogue_commands.add_parser("usages", help="list the schemas using a field or field group")
+    usages_parser.add_argument("catalogue", help="the sqlite database of the catalogue")
+    usages_parser.add_argument("element_id")
+    usages_parser.add_argument("--version", default=None)
+    usages_parser.set_defaults(func=catalogue_usages)
+
+    fragment_parser = catalogue_commands.add_parser("fragment", help="print the json schema of a field or field group")
+    fragment_parser.add_argument("catalogue", help="the sqlite database of the catalogue")
+    fragment_parser.add_argument("element_id")
+    fragment_parser.add_argument("--version", default=None)
+    fragment_parser.set_defaults(func=catalogue_fragment)
+
+    serve_parser = commands.add_parser("serve", help="serve the json schemas and codelists of a directory of "
+                                                     "xDatenfelder files over http")
+    serve_parser.add_argument("directory", help="directory of xDatenfelder files, changed files are reloaded")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    serve_parser.add_argument("--reload-interval", type=float, default=2.0,
+                              help="seconds between checks for changed files (0 disables reloading)")
+    serve_parser.add_argument("--cache-dir", default=None, help="directory to cache codelists in")
+    serve_parser.add_argument("--offline", action="store_true",
+                              help="never access xrepository, only use codelists from --cache-dir/--index")
+    serve_parser.add_argument("--index", default=None,
+                              help="codelist index to read codelists from (instead of --cache-dir)")
+    serve_parser.add_argument("--lock", default=None, help="lockfile with pinned codelist versions")
+    serve_parser.add_argument("--backend", choices=FIMParser.BACKENDS, default=FIMParser.BACKEND_UNTANGLE)
+    serve_parser.set_defaults(func=serve)
+
+    server_parser = commands.add_parser("xrepository-server",
+                                        help="serve the codelists of a codelist index like xrepository (offline "
+                                             "tests and benchmarks)")
+    server_parser.add_argument("index", help="the codelist index to serve (see lock --index)")
+    server_parser.add_argument("--host", default="127.0.0.1")
+    server_parser.add_argument("--port", type=int, default=8080)
+    server_parser.add_argument("--latency", type=float, default=0.0, help="seconds every request is delayed")
+    server_parser.add_argument("--documents", action="append", default=[],
+                               help="also serve the xDatenfelder files of this directory by filename")
+    server_parser.set_defaults(func=xrepository_server)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
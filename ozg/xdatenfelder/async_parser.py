@@ -0,0 +1,100 @@
+import asyncio
+from typing import Dict
+
+from .code_list_index import CodeListLock
+from .fim_code_lists import FimCodeList, CodeListCache, DEFAULT_MAX_WORKERS, get_async_client, \
+    prefetch_code_lists_async
+from .parser import FIMParser, iter_fields
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - httpx is only needed for the async api
+    httpx = None
+
+
+class AsyncFIMParser(FIMParser):
+    """
+    FIMParser for asyncio applications: the document is downloaded and parsed chunk by chunk and the codelists of
+    every parsed structure are requested while the rest of the document is still downloading
+    """
+
+    # the http client and the pending codelist requests are bound to the event loop they were created in
+    _TRANSIENT_STATE = dict(FIMParser._TRANSIENT_STATE, _client=None, _pending_code_lists=None)
+
+    _client = None
+    _pending_code_lists = None
+
+    @classmethod
+    async def from_url(cls, url: str, client: "httpx.AsyncClient" = None, code_list_cache: CodeListCache = None,
+                       max_workers: int = DEFAULT_MAX_WORKERS, override_version_check: str = None,
+                       keep_xml: bool = False, code_list_lock: CodeListLock = None,
+                       pin_code_lists: bool = False) -> "AsyncFIMParser":
+        """
+        downloads and parses a fim file (always with the streaming backend)
+        :param url: the url of the fim file
+        :param client: the http client to use (defaults to get_async_client())
+        :param code_list_cache: the CodeListCache used to resolve codelists (defaults to the global cache)
+        :param max_workers: max number of concurrent requests to xrepository
+        :param override_version_check: override the fim version manually (see SUPPORTED_FIM_VERSIONS for options)
+        :param keep_xml: keep the parsed xml (parsed_xml) after parsing, by default it is dropped to save memory
+        :param code_list_lock: pinned codelist versions, they take precedence over the versions in the document
+        :param pin_code_lists: use the codelist versions referenced in the document instead of the latest ones
+        """
+        http = client or get_async_client()
+        parser = cls.__new__(cls)
+        parser._init_state(url, cls.BACKEND_STREAMING, code_list_cache, max_workers, keep_xml, code_list_lock,
+                           pin_code_lists)
+        parser._client = client
+        parser._pending_code_lists = {}
+
+        semaphore = asyncio.Semaphore(max(max_workers, 1))
+
+        async def resolve(urn, version):
+            async with semaphore:
+                return await FimCodeList.resolve_async(urn, cache=code_list_cache, client=http, version=version)
+
+        def on_element(element):
+            for field in iter_fields([element]):
+                urn = field.reference_value_uri
+                if urn and urn not in parser._pending_code_lists:
+                    parser._pending_code_lists[urn] = asyncio.ensure_future(
+                        resolve(urn, parser.pinned_code_list_version(field)))
+
+        streaming_parser = parser._streaming_parser(override_version_check, on_element=on_element)
+        try:
+            async with http.stream("GET", url) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    streaming_parser.feed(chunk)
+            streaming_parser.close()
+        except BaseException:
+            for task in parser._pending_code_lists.values():
+                task.cancel()
+            raise
+
+        parser._parse_root_header()
+        if not keep_xml:
+            parser._parsed_xml = None
+        return parser
+
+    async def prefetch_code_lists_async(self):
+        """
+        async version of prefetch_code_lists, waits for the codelists requested while parsing
+        """
+        pending: Dict[str, asyncio.Future] = self._pending_code_lists or {}
+        self._pending_code_lists = {}
+        if pending:
+            self._code_lists.update(zip(pending, await asyncio.gather(*pending.values())))
+
+        missing = [urn for urn in self.code_list_urns if urn not in self._code_lists]
+        if missing:
+            self._code_lists.update(await prefetch_code_lists_async(
+                missing, cache=self._code_list_cache, client=self._client, max_workers=self._max_workers,
+                versions=self.code_list_versions))
+
+    async def to_json_async(self):
+        """
+        :return: the json schema of the form (see to_json) without blocking the event loop on xrepository
+        """
+        await self.prefetch_code_lists_async()
+        return self.to_json
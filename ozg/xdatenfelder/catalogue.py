@@ -0,0 +1,289 @@
+import io
+import os
+import pickle
+import sqlite3
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+from .parser import FIMParser, FIMElement, FIMField, FIMFieldGroup, FIMStructure
+
+
+class CatalogueEntry(object):
+    def __init__(self, element_id: str, version: str, element_type: str, name: str, fim_version: str):
+        """
+        a field or field group in the catalogue
+        :param element_type: FIMField.ELEMENT_TYPE or FIMFieldGroup.ELEMENT_TYPE
+        :param fim_version: the fim version of the document the element was indexed from
+        """
+        self.id = element_id
+        self.version = version
+        self.element_type = element_type
+        self.name = name
+        self.fim_version = fim_version
+
+    def __repr__(self):
+        return f"CatalogueEntry({self.id} {self.version}: {self.name})"
+
+
+class Usage(object):
+    def __init__(self, element_id: str, element_version: str, schema_id: str, schema_version: str, path: str,
+                 parent_id: str):
+        """
+        an occurrence of an element in a schema
+        :param path: the xDatenfelder file of the schema
+        :param parent_id: the id of the field group containing the element (None if it is a top level element)
+        """
+        self.element_id = element_id
+        self.element_version = element_version
+        self.schema_id = schema_id
+        self.schema_version = schema_version
+        self.path = path
+        self.parent_id = parent_id
+
+    def __repr__(self):
+        return f"Usage({self.element_id} {self.element_version} in {self.schema_id} {self.schema_version} " \
+               f"({self.parent_id or 'top level'}))"
+
+
+def _version_key(version: Optional[str]):
+    # "1.10" is newer than "1.9"
+    parts = []
+    for part in (version or "").split("."):
+        parts.append((0, int(part), "") if part.isdigit() else (1, 0, part))
+    return parts
+
+
+class _ElementPickler(pickle.Pickler):
+    """
+    pickles a single field/field group without the parser and without the shared elements it contains, they are
+    stored as references (id, version) and resolved from the catalogue when the element is loaded
+    """
+
+    def __init__(self, file, element):
+        super().__init__(file, protocol=5)
+        self._element = element
+
+    def persistent_id(self, obj):
+        if isinstance(obj, FIMParser):
+            return "parser"
+        if isinstance(obj, (FIMField, FIMFieldGroup)) and obj is not self._element:
+            return "element", obj.id, obj.element_version
+        return None
+
+
+class _ElementUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, parser: FIMParser):
+        super().__init__(file)
+        self._parser = parser
+
+    def persistent_load(self, pid):
+        if pid == "parser":
+            return self._parser
+        _, element_id, version = pid
+        element = self._parser.resolve_element((element_id, version))
+        if element is None:
+            raise pickle.UnpicklingError(f"{element_id} {version} is missing in the catalogue")
+        return element
+
+
+class ElementCatalogue(object):
+    """
+    index of all fields and field groups of a corpus of xDatenfelder files in a sqlite database. it stores every
+    element (by id and version) once together with all places it is used, so shared elements can be looked up
+    (usages, schema fragments) without parsing the corpus again. FIMParser(xml, catalogue=catalogue) takes shared
+    elements from the catalogue instead of parsing them.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS elements (
+        id TEXT NOT NULL,
+        version TEXT NOT NULL,
+        element_type TEXT NOT NULL,
+        name TEXT,
+        fim_version TEXT NOT NULL,
+        model BLOB NOT NULL,
+        PRIMARY KEY (id, version)
+    );
+    CREATE TABLE IF NOT EXISTS usages (
+        element_id TEXT NOT NULL,
+        element_version TEXT,
+        schema_id TEXT,
+        schema_version TEXT,
+        path TEXT NOT NULL,
+        parent_id TEXT
+    );
+    CREATE INDEX IF NOT EXISTS usages_element ON usages (element_id);
+    CREATE INDEX IF NOT EXISTS usages_path ON usages (path);
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: the sqlite database (is created if it does not exist)
+        """
+        self._path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(self.SCHEMA)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _query(self, sql: str, parameters: Tuple = ()) -> List[Tuple]:
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def add_file(self, path: str) -> FIMParser:
+        """
+        indexes all elements of a xDatenfelder file, the usages of a file that was indexed before are replaced
+        :param path: the xDatenfelder file
+        :return: the parser of the file
+        """
+        parser = FIMParser(path, keep_xml=False)
+        self.add_parser(parser, path)
+        return parser
+
+    def add_files(self, paths: Iterable[str]) -> List[Tuple[str, str]]:
+        """
+        :param paths: the xDatenfelder files
+        :return: the files that could not be indexed and the error message
+        """
+        errors = []
+        for path in paths:
+            try:
+                self.add_file(path)
+            except Exception as e:
+                errors.append((path, f"{type(e).__name__}: {e}"))
+        return errors
+
+    def add_parser(self, parser: FIMParser, path: str):
+        """
+        indexes all elements of a parsed document
+        :param parser: the parsed document
+        :param path: the xDatenfelder file of the document (identifies the document in the usages)
+        """
+        elements = []
+        for (element_id, version), element in parser.elements.items():
+            # unversioned elements (xDatenfelder 1) are not unique across documents
+            if version is None:
+                continue
+            buffer = io.BytesIO()
+            _ElementPickler(buffer, element).dump(element)
+            elements.append((element_id, version, element.ELEMENT_TYPE, element.name, parser._version,
+                             buffer.getvalue()))
+
+        usages = []
+
+        def walk(element, parent_id):
+            if isinstance(element, FIMStructure):
+                element = element.contains
+            usages.append((element.id, element.element_version, parser.id, parser.element_version, path, parent_id))
+            if isinstance(element, FIMFieldGroup):
+                for structure in element.fields:
+                    walk(structure, element.id)
+
+        for element in parser.form:
+            walk(element, None)
+
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR IGNORE INTO elements VALUES (?, ?, ?, ?, ?, ?)", elements)
+            self._connection.execute("DELETE FROM usages WHERE path = ?", (path,))
+            self._connection.executemany("INSERT INTO usages VALUES (?, ?, ?, ?, ?, ?)", sorted(set(usages),
+                                                                                              key=str))
+
+    def versions(self, element_id: str) -> List[str]:
+        """
+        :return: all indexed versions of the element (oldest first)
+        """
+        rows = self._query("SELECT version FROM elements WHERE id = ?", (element_id,))
+        return sorted((row[0] for row in rows), key=_version_key)
+
+    def get(self, element_id: str, version: str = None) -> Optional[CatalogueEntry]:
+        """
+        :param version: the version of the element (defaults to the latest indexed version)
+        :return: the element or None if it is not part of the catalogue
+        """
+        if version is None:
+            versions = self.versions(element_id)
+            if not versions:
+                return None
+            version = versions[-1]
+
+        rows = self._query("SELECT id, version, element_type, name, fim_version FROM elements "
+                           "WHERE id = ? AND version = ?", (element_id, version))
+        return CatalogueEntry(*rows[0]) if rows else None
+
+    def __contains__(self, element_id):
+        return len(self._query("SELECT 1 FROM elements WHERE id = ? LIMIT 1", (element_id,))) > 0
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM elements")[0][0]
+
+    def usages(self, element_id: str, version: str = None) -> List[Usage]:
+        """
+        :param version: only usages of this version of the element (defaults to all versions)
+        :return: every occurrence of the element in the indexed schemas
+        """
+        sql = "SELECT * FROM usages WHERE element_id = ?"
+        parameters = (element_id,)
+        if version is not None:
+            sql += " AND element_version = ?"
+            parameters += (version,)
+        return [Usage(*row) for row in self._query(sql + " ORDER BY path, parent_id", parameters)]
+
+    def schemas_using(self, element_id: str, version: str = None) -> List[str]:
+        """
+        :return: the ids of all schemas using the element (directly or as part of a field group)
+        """
+        return sorted(set(usage.schema_id for usage in self.usages(element_id, version) if usage.schema_id))
+
+    def load_element(self, key: Tuple[str, str], parser: FIMParser) -> Optional[FIMElement]:
+        """
+        restores an indexed element as part of the model of parser. the elements it contains are resolved with
+        parser.resolve_element, so shared elements stay shared. only load catalogues you trust (pickle)!
+        :param key: id and version of the element
+        :return: the element or None if it is not part of the catalogue (or was indexed from another fim version)
+        """
+        rows = self._query("SELECT model FROM elements WHERE id = ? AND version = ? AND fim_version = ?",
+                           key + (parser._version,))
+        if not rows:
+            return None
+        return _ElementUnpickler(io.BytesIO(rows[0][0]), parser).load()
+
+    def fragment(self, element_id: str, version: str = None, **kwargs) -> dict:
+        """
+        :param version: the version of the element (defaults to the latest indexed version)
+        :param kwargs: passed to FIMParser.from_catalogue (e.g. code_list_cache)
+        :return: the json schema of a field or field group (with the $defs it references)
+        :raises: FIMParserError if the element is not part of the catalogue
+        """
+        parser = FIMParser.from_catalogue(self, element_id, version, **kwargs)
+        element = parser.form[0]
+        if isinstance(element, FIMFieldGroup):
+            return parser.section_json(element_id)
+        parser.prefetch_code_lists()
+        return element.to_json()
+
+    @classmethod
+    def build(cls, path: str, paths: Iterable[str]) -> Tuple["ElementCatalogue", List[Tuple[str, str]]]:
+        """
+        indexes a corpus of xDatenfelder files
+        :param path: the sqlite database
+        :param paths: the xDatenfelder files
+        :return: the catalogue and the files that could not be indexed
+        """
+        catalogue = cls(path)
+        return catalogue, catalogue.add_files(paths)
+
+    def __repr__(self):
+        return f"ElementCatalogue({os.path.basename(self._path)})"
@@ -0,0 +1,226 @@
+import json
+import os
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .fim_code_lists import CodeListCache, CodeListStore, FimCodeList, DEFAULT_MAX_WORKERS, prefetch_code_lists
+
+
+class CodeListLock(object):
+    """
+    pinned codelist versions (dat_kennung) by urn. stored as a small json lockfile that can be committed next to
+    the xDatenfelder files, so the rendered enums only change when the lockfile is updated
+    """
+
+    def __init__(self, versions: Dict[str, str] = None):
+        """
+        :param versions: dict of urn -> pinned version
+        """
+        self._versions = dict(versions or {})
+
+    @classmethod
+    def from_code_lists(cls, code_lists: Dict[str, FimCodeList]) -> "CodeListLock":
+        """
+        :param code_lists: resolved codelists by urn (e.g. the result of prefetch_code_lists)
+        :return: a lock pinning every resolved codelist to its current version
+        """
+        return cls({urn: code_list.version for urn, code_list in code_lists.items() if code_list.version})
+
+    @property
+    def versions(self) -> Dict[str, str]:
+        return dict(self._versions)
+
+    def get(self, urn: str) -> Optional[str]:
+        """
+        :return: the pinned version of the urn or None if it is not pinned
+        """
+        return self._versions.get(urn)
+
+    def pin(self, urn: str, version: str):
+        self._versions[urn] = version
+
+    def __contains__(self, urn):
+        return urn in self._versions
+
+    def __len__(self):
+        return len(self._versions)
+
+    def __eq__(self, other):
+        return isinstance(other, CodeListLock) and self._versions == other._versions
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump({"code_lists": self._versions}, fh, ensure_ascii=False, indent=2, sort_keys=True)
+            fh.write("\n")
+
+    @classmethod
+    def load(cls, path: str) -> "CodeListLock":
+        with open(path, "r", encoding="utf-8") as fh:
+            return cls(json.load(fh)["code_lists"])
+
+
+class IndexedCodeList(object):
+    """
+    a single codelist version with hashed lookups from key to label and from label to key
+    """
+
+    __slots__ = ("urn", "version", "dataset", "_labels", "_keys")
+
+    def __init__(self, urn: str, version: str, dataset: List[Tuple[str, str]]):
+        self.urn = urn
+        self.version = version
+        self.dataset = [tuple(item) for item in dataset]
+        self._labels = {key: label for key, label in self.dataset}
+        # the first key wins if a label is used more than once
+        self._keys = {}
+        for key, label in self.dataset:
+            self._keys.setdefault(label, key)
+
+    def label(self, key: str) -> Optional[str]:
+        """:return: the label of the key or None if the key is not part of the codelist"""
+        return self._labels.get(key)
+
+    def key(self, label: str) -> Optional[str]:
+        """:return: the key of the label or None if the label is not part of the codelist"""
+        return self._keys.get(label)
+
+    def has_key(self, key: str) -> bool:
+        return key in self._labels
+
+    def has_label(self, label: str) -> bool:
+        return label in self._keys
+
+    def __contains__(self, key):
+        return key in self._labels
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        return iter(self.dataset)
+
+
+class CodeListIndex(CodeListStore):
+    """
+    all codelists a catalogue needs in a single file. it can be queried directly (index[urn].label(key)) and used
+    as the store of a CodeListCache, e.g. CodeListCache(store=CodeListIndex.load(path), offline=True) renders
+    forms without any network access
+    """
+
+    # increased whenever the file format changes incompatibly
+    FORMAT_VERSION = 1
+
+    def __init__(self, created_at: float = None):
+        """
+        :param created_at: the time the codelists were resolved (defaults to now)
+        """
+        self._created_at = created_at if created_at is not None else time.time()
+        self._code_lists = {}
+        self._current = {}
+
+    @classmethod
+    def build(cls, urns: Iterable[str], cache: CodeListCache = None, max_workers: int = DEFAULT_MAX_WORKERS,
+              versions: Dict[str, str] = None) -> "CodeListIndex":
+        """
+        resolves codelists concurrently and indexes them, codelists that cannot be resolved are skipped
+        :param urns: the urns of the codelists
+        :param cache: the CodeListCache to use (defaults to get_default_cache())
+        :param max_workers: max number of concurrent requests to xrepository
+        :param versions: pinned versions by urn (e.g. CodeListLock.versions)
+        """
+        index = cls()
+        for urn, code_list in prefetch_code_lists(urns, cache=cache, max_workers=max_workers,
+                                                  versions=versions).items():
+            if code_list.version is not None:
+                index.add(urn, code_list.version, code_list.dataset)
+        return index
+
+    @property
+    def created_at(self) -> float:
+        return self._created_at
+
+    def add(self, urn: str, version: str, dataset: List[Tuple[str, str]], current: bool = True) -> IndexedCodeList:
+        """
+        :param current: use this version for lookups without an explicit version
+        """
+        code_list = IndexedCodeList(urn, version, dataset)
+        self._code_lists[(urn, version)] = code_list
+        if current or urn not in self._current:
+            self._current[urn] = version
+        return code_list
+
+    def get(self, urn: str, version: str = None) -> Optional[IndexedCodeList]:
+        """
+        :param version: the version of the codelist (defaults to the current version in the index)
+        :return: the indexed codelist or None if it is not part of the index
+        """
+        version = version if version is not None else self._current.get(urn)
+        return self._code_lists.get((urn, version))
+
+    def __getitem__(self, urn) -> IndexedCodeList:
+        code_list = self.get(urn)
+        if code_list is None:
+            raise KeyError(urn)
+        return code_list
+
+    def __contains__(self, urn):
+        return urn in self._current
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._current)
+
+    def __len__(self):
+        return len(self._current)
+
+    def lock(self) -> CodeListLock:
+        """
+        :return: a lock pinning every codelist to its current version in the index
+        """
+        return CodeListLock(self._current)
+
+    def get_version(self, urn):
+        version = self._current.get(urn)
+        if version is None:
+            return None
+        return version, self._created_at
+
+    def set_version(self, urn, version, resolved_at):
+        if (urn, version) in self._code_lists:
+            self._current[urn] = version
+
+    def get_dataset(self, urn, version):
+        code_list = self._code_lists.get((urn, version))
+        return code_list.dataset if code_list is not None else None
+
+    def set_dataset(self, urn, version, dataset):
+        self.add(urn, version, dataset, current=False)
+
+    def save(self, path: str):
+        data = {
+            "format": self.FORMAT_VERSION,
+            "created_at": self._created_at,
+            "current": self._current,
+            "code_lists": [{"urn": code_list.urn, "version": code_list.version,
+                            "dataset": [list(item) for item in code_list.dataset]}
+                           for code_list in self._code_lists.values()],
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CodeListIndex":
+        """
+        :raises: ValueError if the file was written by an incompatible version
+        """
+        with open(path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+        if data.get("format") != cls.FORMAT_VERSION:
+            raise ValueError(f"{path} is not a codelist index of format {cls.FORMAT_VERSION}")
+
+        index = cls(created_at=data["created_at"])
+        for item in data["code_lists"]:
+            index.add(item["urn"], item["version"], item["dataset"], current=False)
+        index._current.update(data["current"])
+        return index
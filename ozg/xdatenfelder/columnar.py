@@ -0,0 +1,227 @@
+import datetime
+import itertools
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+from .parser import FIMParser, FIMField, FIMFieldGroup, FieldType, DataType, DATA_TYPE_SCHEMAS
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - pyarrow is only needed for the columnar export
+    pyarrow = None
+
+# number of submissions converted to one record batch, the memory of the export is bounded by it
+DEFAULT_BATCH_SIZE = 10000
+
+# builds the arrow arrays of a column (or of all flattened columns of a field group) from the values of a batch
+Builder = Callable[[List[Any]], List["pyarrow.Array"]]
+
+
+def _string(value):
+    return value if isinstance(value, str) else None
+
+
+def _boolean(value):
+    return value if isinstance(value, bool) else None
+
+
+def _number(value):
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _integer(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return None
+
+
+def _date(value):
+    if isinstance(value, str):
+        try:
+            return datetime.date.fromisoformat(value)
+        except ValueError:
+            pass
+    return None
+
+
+def _is_repeated(structure) -> bool:
+    # the same condition as FIMStructure.to_json uses for arrays
+    return not (structure.max_items == 1 and structure.min_items <= 1)
+
+
+class ColumnarExporter(object):
+    """
+    exports submitted form data to Arrow record batches and Parquet/Arrow files. the columns are derived from the
+    parsed FIM model: fields become typed columns (by their data type, codelist values are dictionary encoded),
+    field groups are flattened into columns named by their path (e.g. G00000630.F00000043) and repeated structures
+    (max_items > 1) become list columns of their items. the model is compiled once into plain python functions, like
+    SubmissionValidator does, and submissions are converted batch by batch, so the memory is bounded by the batch
+    size. values that do not match the type of their column are exported as null (validate the submissions first)
+    """
+
+    def __init__(self, parser: FIMParser, batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        :param parser: the parsed FIM model of the submissions
+        :param batch_size: number of submissions per record batch
+        """
+        if pyarrow is None:
+            raise ImportError("the columnar export requires pyarrow (pip install ozg[arrow])")
+        self._parser = parser
+        self._batch_size = batch_size
+
+        entries = []
+        for element in parser.form:
+            if isinstance(element, FIMFieldGroup):
+                # a field group document, its group is the (required) root object
+                entries.append((element, False))
+            else:
+                entries.append((element.contains, _is_repeated(element)))
+        fields, self._build = self._compile_object(entries, "")
+        metadata = {"fim_id": parser.id or "", "fim_version": parser.element_version or ""}
+        self._schema = pyarrow.schema(fields, metadata=metadata)
+
+    @property
+    def schema(self) -> "pyarrow.Schema":
+        return self._schema
+
+    @property
+    def columns(self) -> List[str]:
+        return self._schema.names
+
+    def _compile_object(self, entries: List[Tuple[Any, bool]], prefix: str) -> Tuple[List["pyarrow.Field"], Builder]:
+        """
+        :param entries: the contained element and whether it is repeated of every structure of the object
+        :param prefix: prepended to the names of the columns (the path of the flattened field group)
+        :return: the fields of the flattened columns and a builder for them
+        """
+        fields, builders = [], []
+        for element, repeated in entries:
+            name = prefix + element.id
+            if repeated:
+                element_fields, build = self._compile_list(element, name)
+            elif isinstance(element, FIMFieldGroup):
+                element_fields, build = self._compile_object([(structure.contains, _is_repeated(structure))
+                                                              for structure in element.fields], name + ".")
+            else:
+                element_fields, build = self._compile_field(element, name)
+            if element_fields:
+                fields.extend(element_fields)
+                builders.append((element.id, build))
+
+        def build(objects):
+            arrays = []
+            for key, build_values in builders:
+                arrays.extend(build_values([value.get(key) if isinstance(value, dict) else None
+                                            for value in objects]))
+            return arrays
+
+        return fields, build
+
+    def _compile_list(self, element, name: str) -> Tuple[List["pyarrow.Field"], Builder]:
+        if isinstance(element, FIMFieldGroup):
+            item_fields, build_items = self._compile_object([(structure.contains, _is_repeated(structure))
+                                                             for structure in element.fields], "")
+            if not item_fields:
+                return [], None
+            item_type = pyarrow.struct(item_fields)
+
+            def build_item_array(items):
+                return pyarrow.StructArray.from_arrays(build_items(items), fields=item_fields)
+        else:
+            (item_field,), build_items = self._compile_field(element, "item")
+            item_type = item_field.type
+
+            def build_item_array(items):
+                return build_items(items)[0]
+
+        def build(values):
+            offsets, items, mask = [0], [], []
+            for value in values:
+                if isinstance(value, list):
+                    items.extend(value)
+                    mask.append(False)
+                else:
+                    mask.append(True)
+                offsets.append(len(items))
+            return [pyarrow.ListArray.from_arrays(pyarrow.array(offsets, pyarrow.int32()), build_item_array(items),
+                                                  mask=pyarrow.array(mask, pyarrow.bool_()))]
+
+        return [pyarrow.field(name, pyarrow.list_(item_type))], build
+
+    def _compile_field(self, field: FIMField, name: str) -> Tuple[List["pyarrow.Field"], Builder]:
+        if field.field_type == FieldType.SELECT:
+            # codelist values repeat a lot, so they are dictionary encoded
+            def build(values):
+                return [pyarrow.array([_string(value) for value in values], pyarrow.string()).dictionary_encode()]
+
+            return [pyarrow.field(name, pyarrow.dictionary(pyarrow.int32(), pyarrow.string()))], build
+
+        arrow_type, convert = pyarrow.string(), _string
+        if field.field_type == FieldType.INPUT:
+            # registered data types are mapped by their json schema, unknown ones are exported as text
+            schema = DATA_TYPE_SCHEMAS.get(field.data_type, DATA_TYPE_SCHEMAS[DataType.TEXT])
+            if schema.get("type") == "boolean":
+                arrow_type, convert = pyarrow.bool_(), _boolean
+            elif schema.get("type") == "integer":
+                arrow_type, convert = pyarrow.int64(), _integer
+            elif schema.get("type") == "number":
+                arrow_type, convert = pyarrow.float64(), _number
+            elif schema.get("format") == "date":
+                arrow_type, convert = pyarrow.date32(), _date
+
+        def build(values):
+            return [pyarrow.array([convert(value) for value in values], arrow_type)]
+
+        return [pyarrow.field(name, arrow_type)], build
+
+    def record_batch(self, submissions: List[Dict]) -> "pyarrow.RecordBatch":
+        """
+        :param submissions: the submitted form data (as described by FIMParser.to_json)
+        :return: one row per submission
+        """
+        return pyarrow.RecordBatch.from_arrays(self._build(submissions), schema=self._schema)
+
+    def iter_batches(self, submissions: Iterable[Dict], batch_size: int = None) -> Iterator["pyarrow.RecordBatch"]:
+        """
+        :param submissions: any iterable of submissions, it is consumed batch by batch
+        :param batch_size: number of submissions per record batch (defaults to the batch size of the exporter)
+        """
+        iterator = iter(submissions)
+        batch_size = batch_size or self._batch_size
+        while True:
+            batch = list(itertools.islice(iterator, batch_size))
+            if not batch:
+                return
+            yield self.record_batch(batch)
+
+    def write_parquet(self, submissions: Iterable[Dict], where, batch_size: int = None, compression: str = "zstd",
+                      **kwargs) -> int:
+        """
+        writes the submissions to a Parquet file, one row group per batch
+        :param where: a filename or a writable binary file like object
+        :param kwargs: further options of pyarrow.parquet.ParquetWriter
+        :return: the number of written submissions
+        """
+        rows = 0
+        with pyarrow.parquet.ParquetWriter(where, self._schema, compression=compression, **kwargs) as writer:
+            for batch in self.iter_batches(submissions, batch_size):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        return rows
+
+    def write_arrow(self, submissions: Iterable[Dict], where, batch_size: int = None) -> int:
+        """
+        writes the submissions to an Arrow IPC file
+        :param where: a filename or a writable binary file like object
+        :return: the number of written submissions
+        """
+        rows = 0
+        with pyarrow.ipc.new_file(where, self._schema) as writer:
+            for batch in self.iter_batches(submissions, batch_size):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        return rows
@@ -0,0 +1,264 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+import time
+from multiprocessing import Pool
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from . import emitter
+from .code_list_index import CodeListIndex, CodeListLock
+from .diff import changed_defs, element_hashes, regenerate
+from .fim_code_lists import CodeListCache, FileCodeListStore, get_default_cache, set_default_cache
+from .instrumentation import Instrumentation, Stats, NULL_INSTRUMENTATION
+from .parser import FIMParser
+
+
+class ConversionResult(object):
+    def __init__(self, path: str, output_path: str = None, fields: int = 0, error: str = None,
+                 duration: float = 0.0, stats: dict = None, changed_defs: List[str] = None,
+                 removed_defs: List[str] = None):
+        """
+        the result of converting a single xDatenfelder file
+        :param path: the converted file
+        :param output_path: the written json schema (None if the conversion failed)
+        :param fields: number of fields in the form
+        :param error: the error message if the conversion failed
+        :param duration: seconds it took to convert the file
+        :param stats: timings and counters of the conversion (Stats.as_dict) if it was instrumented
+        :param changed_defs: ids of the added/changed $defs since the previous conversion (incremental conversions)
+        :param removed_defs: ids of the removed $defs since the previous conversion (incremental conversions)
+        """
+        self.path = path
+        self.output_path = output_path
+        self.fields = fields
+        self.error = error
+        self.duration = duration
+        self.stats = stats
+        self.changed_defs = changed_defs
+        self.removed_defs = removed_defs
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class ConversionSummary(object):
+    def __init__(self):
+        self.files = 0
+        self.failed = 0
+        self.fields = 0
+        self.duration = 0.0
+        self.stats = Stats()
+
+    def add(self, result: ConversionResult):
+        self.files += 1
+        self.fields += result.fields
+        if not result.ok:
+            self.failed += 1
+        if result.stats:
+            self.stats.merge(result.stats)
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files / self.duration if self.duration else 0.0
+
+    @property
+    def fields_per_second(self) -> float:
+        return self.fields / self.duration if self.duration else 0.0
+
+    def __str__(self):
+        return f"converted {self.files - self.failed}/{self.files} files ({self.failed} failed) " \
+               f"in {self.duration:.2f}s: {self.files_per_second:.1f} files/s, {self.fields_per_second:.1f} fields/s"
+
+
+def find_files(patterns: Iterable[str]) -> List[str]:
+    """
+    :param patterns: directories (all *.xml files in it are used) or glob patterns
+    :return: the sorted list of matching files
+    """
+    files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*.xml")
+        files.update(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+    return sorted(files)
+
+
+def output_path_for(path: str, output_dir: str) -> str:
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0] + ".json")
+
+
+def output_dirs_for(paths: List[str], output_dir: str) -> Dict[str, str]:
+    """
+    the directory structure of the files (relative to the directory containing all of them) is mirrored in
+    output_dir, so files with the same name in different directories do not overwrite each other
+    :return: the directory the json schema of each file is written to
+    """
+    if not paths:
+        return {}
+    directories = {path: os.path.dirname(os.path.abspath(path)) for path in paths}
+    root = os.path.commonpath(list(directories.values()))
+    return {path: os.path.normpath(os.path.join(output_dir, os.path.relpath(directory, root)))
+            for path, directory in directories.items()}
+
+
+def hashes_path_for(output_path: str) -> str:
+    return os.path.splitext(output_path)[0] + ".hashes.json"
+
+
+def changes_path_for(output_path: str) -> str:
+    return os.path.splitext(output_path)[0] + ".changes.json"
+
+
+def _read_json(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_schema(path: str):
+    """
+    :return: the json schema written to path and the etag of the file (None, None if there is none)
+    """
+    try:
+        with open(path, "rb") as fh:
+            data = fh.read()
+        return json.loads(data), emitter.etag(data)
+    except (OSError, ValueError):
+        return None, None
+
+
+def _write_json(path: str, data):
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, ensure_ascii=False)
+
+
+def _convert_incremental(parser: FIMParser, output_path: str):
+    """
+    regenerates only the $defs of elements that changed since the previous conversion to output_path and writes the
+    element hashes (<name>.hashes.json) and the changed $defs (<name>.changes.json) next to the schema. the hashes
+    are stored with the etag of the schema they describe, if the schema was written by anything else since (e.g. a
+    conversion without incremental) it is generated completely
+    :return: the schema and the ids of the changed and removed $defs
+    """
+    previous_schema, previous_etag = _read_schema(output_path)
+    previous = _read_json(hashes_path_for(output_path))
+    if previous_schema is not None and isinstance(previous, dict) and previous.get("etag") == previous_etag:
+        previous_hashes = previous["hashes"]
+        schema, hashes = regenerate(parser, previous_schema, previous_hashes)
+    else:
+        hashes, previous_hashes = element_hashes(parser), {}
+        schema = parser.to_json
+
+    changed, removed = changed_defs(schema, hashes, previous_hashes)
+    # the etag of the schema file that is written next (write_json writes the same bytes)
+    _write_json(hashes_path_for(output_path), {"etag": parser.etag, "hashes": hashes})
+    _write_json(changes_path_for(output_path), {"changed": changed, "removed": removed})
+    return schema, list(changed), removed
+
+
+def convert_file(path: str, output_dir: str, backend: str = FIMParser.BACKEND_UNTANGLE,
+                 code_list_lock: CodeListLock = None, pin_code_lists: bool = False,
+                 instrument: bool = False, incremental: bool = False) -> ConversionResult:
+    """
+    converts a xDatenfelder file to a json schema file in output_dir, errors are returned instead of raised
+    :param path: the xDatenfelder file
+    :param output_dir: the directory the json schema is written to
+    :param backend: the FIMParser backend
+    :param code_list_lock: pinned codelist versions
+    :param pin_code_lists: use the codelist versions referenced in the document
+    :param instrument: collect timings and counters of the conversion (ConversionResult.stats)
+    :param incremental: reuse the $defs of unchanged elements from the previous conversion in output_dir
+    """
+    start = time.perf_counter()
+    instrumentation = Instrumentation() if instrument else NULL_INSTRUMENTATION
+    try:
+        parser = FIMParser(path, backend=backend, code_list_lock=code_list_lock, pin_code_lists=pin_code_lists,
+                           instrumentation=instrumentation)
+        output_path = output_path_for(path, output_dir)
+        os.makedirs(output_dir, exist_ok=True)
+        changed, removed = None, None
+        if incremental:
+            _, changed, removed = _convert_incremental(parser, output_path)
+        # the schema is encoded straight into the file, definition by definition
+        with instrumentation.span("write"), open(output_path, "wb") as fh:
+            parser.write_json(fh)
+        fields = sum(1 for _ in parser.iter_fields())
+    except Exception as e:
+        return ConversionResult(path, error=f"{type(e).__name__}: {e}", duration=time.perf_counter() - start)
+
+    return ConversionResult(path, output_path=output_path, fields=fields, duration=time.perf_counter() - start,
+                            stats=instrumentation.stats.as_dict() if instrumentation.enabled else None,
+                            changed_defs=changed, removed_defs=removed)
+
+
+def _init_worker(cache_dir: Optional[str], offline: bool, index_path: Optional[str] = None):
+    # all workers share the codelists through the same directory (or read them from the same index)
+    if index_path:
+        store = CodeListIndex.load(index_path)
+    else:
+        store = FileCodeListStore(cache_dir) if cache_dir else None
+    set_default_cache(CodeListCache(store=store, offline=offline))
+
+
+def _convert(args) -> ConversionResult:
+    return convert_file(*args)
+
+
+def convert_files(paths: List[str], output_dir: str, processes: int = None, cache_dir: str = None,
+                  offline: bool = False, backend: str = FIMParser.BACKEND_UNTANGLE, code_list_lock: CodeListLock = None,
+                  pin_code_lists: bool = False, index_path: str = None,
+                  instrument: bool = False, incremental: bool = False) -> Iterator[ConversionResult]:
+    """
+    converts xDatenfelder files to json schema files using a process pool, results are yielded as soon as a
+    file is written (not in order)
+    :param paths: the xDatenfelder files
+    :param output_dir: the directory the json schemas are written to (mirroring the directories of the files, see
+    output_dirs_for). files that would be written to the same json schema (e.g. a.xml and a.XML) fail
+    :param processes: number of worker processes (defaults to the number of cpus, 1 converts in this process)
+    :param cache_dir: the directory the codelists are cached in (a temporary directory if None)
+    :param offline: never access xrepository, only use codelists from cache_dir
+    :param backend: the FIMParser backend
+    :param code_list_lock: pinned codelist versions, pinned codelists are never resolved against xrepository
+    :param pin_code_lists: use the codelist versions referenced in the documents
+    :param index_path: a CodeListIndex file the codelists are read from instead of cache_dir
+    :param instrument: collect timings and counters of every conversion (ConversionResult.stats)
+    :param incremental: only regenerate the $defs that changed since the previous conversion to output_dir
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    temporary_cache_dir = None
+    if cache_dir is None:
+        temporary_cache_dir = cache_dir = tempfile.mkdtemp(prefix="ozg-codelists-")
+
+    try:
+        output_dirs = output_dirs_for(paths, output_dir)
+        converted_paths = {}
+        tasks = []
+        for path in paths:
+            output_path = output_path_for(path, output_dirs[path])
+            if output_path in converted_paths:
+                yield ConversionResult(path, error=f"ValueError: {converted_paths[output_path]} is written to "
+                                                   f"{output_path} as well")
+                continue
+            converted_paths[output_path] = path
+            tasks.append((path, output_dirs[path], backend, code_list_lock, pin_code_lists, instrument, incremental))
+        if processes == 1:
+            default_cache = get_default_cache()
+            _init_worker(cache_dir, offline, index_path)
+            try:
+                for task in tasks:
+                    yield _convert(task)
+            finally:
+                set_default_cache(default_cache)
+            return
+
+        with Pool(processes, initializer=_init_worker, initargs=(cache_dir, offline, index_path)) as pool:
+            for result in pool.imap_unordered(_convert, tasks, chunksize=4):
+                yield result
+    finally:
+        if temporary_cache_dir is not None:
+            shutil.rmtree(temporary_cache_dir, ignore_errors=True)
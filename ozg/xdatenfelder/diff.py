@@ -0,0 +1,254 @@
+import hashlib
+import json
+from typing import Dict, List, Optional, Tuple
+
+from .parser import FIMParser, FIMField, FIMFieldGroup, FIMStructure, FIMHeaderMixin
+
+# increased whenever the json schema generation changes, so hashes of older releases do not match anymore
+HASH_VERSION = 1
+
+_FIELD_ATTRIBUTES = ("field_type", "data_type", "_validation_details", "default_value", "input_hint", "output_hint",
+                     "reference_value_uri", "reference_value_version")
+_HEADER_ATTRIBUTES = tuple(slot.lstrip("_") for slot in FIMHeaderMixin.HEADER_SLOTS)
+
+
+def _attributes(element) -> Dict:
+    names = _HEADER_ATTRIBUTES + (_FIELD_ATTRIBUTES if isinstance(element, FIMField) else ())
+    return {name.lstrip("_"): getattr(element, name) for name in names}
+
+
+def _children(group: FIMFieldGroup) -> List[Tuple[str, Optional[str], int, int]]:
+    return [(structure.contains.id, structure.contains.element_version, structure.min_items, structure.max_items)
+            for structure in group.fields]
+
+
+def element_hashes(parser: FIMParser) -> Dict[str, str]:
+    """
+    content hashes of all fields and field groups of a form by id. the hash of a group covers its whole subtree and
+    the hash of a select field the resolved version of its codelist, so an unchanged hash means that the $defs entry
+    of the element in the json schema is unchanged as well
+    :param parser: the parsed form (codelists are resolved if they were not resolved yet)
+    :return: dict of element id -> sha256 hex digest (by id like the $defs of the json schema)
+    """
+    parser.prefetch_code_lists()
+    hashes = {}
+
+    def digest(element) -> str:
+        if element.id in hashes:
+            return hashes[element.id]
+
+        content = {"version": HASH_VERSION, "type": element.ELEMENT_TYPE, "attributes": _attributes(element)}
+        if isinstance(element, FIMFieldGroup):
+            content["fields"] = [child + (digest(structure.contains),)
+                                 for child, structure in zip(_children(element), element.fields)]
+        elif element.reference_value_uri:
+            content["code_list"] = parser.code_list(element.reference_value_uri).version
+
+        hashes[element.id] = hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        return hashes[element.id]
+
+    for element in parser.form:
+        digest(element.contains if isinstance(element, FIMStructure) else element)
+    return hashes
+
+
+def _subtree_ids(group: FIMFieldGroup, ids: Dict[str, None]) -> Dict[str, None]:
+    # same (post) order the $defs of a group are collected in while generating the schema
+    for structure in group.fields:
+        child = structure.contains
+        if child.id not in ids:
+            if isinstance(child, FIMFieldGroup):
+                _subtree_ids(child, ids)
+            ids[child.id] = None
+    return ids
+
+
+def regenerate(parser: FIMParser, previous_schema: Dict, previous_hashes: Dict[str, str]) -> Tuple[Dict, Dict]:
+    """
+    generates the json schema of a new release of a form, reusing the $defs of all elements that did not change
+    since the previous release (only changed elements and the groups containing them are generated again)
+    :param parser: the parsed new release
+    :param previous_schema: the json schema of the previous release
+    :param previous_hashes: the element_hashes of the previous release
+    :return: the json schema and the element_hashes of the new release
+    """
+    hashes = element_hashes(parser)
+    previous_defs = previous_schema.get("$defs", {})
+    unchanged = [element for element in parser.elements.values()
+                 if previous_hashes.get(element.id) == hashes[element.id] and element.id in previous_defs]
+
+    parser.invalidate()
+    for element in unchanged:
+        if isinstance(element, FIMFieldGroup):
+            subtree_ids = _subtree_ids(element, {})
+            if all(element_id in previous_defs for element_id in subtree_ids):
+                parser._schema_cache[element.id] = (previous_defs[element.id],
+                                                    {element_id: previous_defs[element_id]
+                                                     for element_id in subtree_ids})
+        else:
+            parser._schema_cache[element.id] = previous_defs[element.id]
+
+    return parser.to_json, hashes
+
+
+def changed_defs(schema: Dict, hashes: Dict[str, str], previous_hashes: Dict[str, str]) -> Tuple[Dict, List[str]]:
+    """
+    :return: the $defs entries that were added or changed since the previous release and the ids of the removed ones
+    """
+    defs = schema.get("$defs", {})
+    changed = {element_id: definition for element_id, definition in defs.items()
+               if previous_hashes.get(element_id) != hashes.get(element_id)}
+    removed = sorted(element_id for element_id in previous_hashes if element_id not in defs)
+    return changed, removed
+
+
+class ElementChange(object):
+    def __init__(self, element_id: str, element_type: str, old_version: Optional[str], new_version: Optional[str],
+                 attributes: List[str] = None):
+        """
+        an added, removed or changed field/field group
+        :param element_type: FIMField.ELEMENT_TYPE or FIMFieldGroup.ELEMENT_TYPE
+        :param old_version: the version in the old release (None if the element was added)
+        :param new_version: the version in the new release (None if the element was removed)
+        :param attributes: the names of the changed attributes (fields if the structures of a group changed)
+        """
+        self.element_id = element_id
+        self.element_type = element_type
+        self.old_version = old_version
+        self.new_version = new_version
+        self.attributes = attributes or []
+
+    def to_dict(self) -> Dict:
+        return {"id": self.element_id, "type": self.element_type, "old_version": self.old_version,
+                "new_version": self.new_version, "attributes": self.attributes}
+
+    def __eq__(self, other):
+        return isinstance(other, ElementChange) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"ElementChange({self.element_id} {self.old_version} -> {self.new_version}: {self.attributes})"
+
+
+class CardinalityChange(object):
+    def __init__(self, parent_id: Optional[str], element_id: str, old: Tuple[int, int], new: Tuple[int, int]):
+        """
+        a structure whose number of occurrences changed
+        :param parent_id: the id of the containing field group (None for top level structures)
+        :param old: min and max items in the old release
+        :param new: min and max items in the new release
+        """
+        self.parent_id = parent_id
+        self.element_id = element_id
+        self.old = old
+        self.new = new
+
+    def to_dict(self) -> Dict:
+        return {"parent_id": self.parent_id, "id": self.element_id, "old": list(self.old), "new": list(self.new)}
+
+    def __repr__(self):
+        return f"CardinalityChange({self.parent_id or 'top level'}/{self.element_id}: {self.old} -> {self.new})"
+
+
+class SchemaDiff(object):
+    """
+    structural differences between two releases of a form, elements are matched by id and version (see diff)
+    """
+
+    def __init__(self, added: List[ElementChange], removed: List[ElementChange], changed: List[ElementChange],
+                 cardinalities: List[CardinalityChange]):
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.cardinalities = cardinalities
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed or self.cardinalities)
+
+    def to_dict(self) -> Dict:
+        return {
+            "added": [change.to_dict() for change in self.added],
+            "removed": [change.to_dict() for change in self.removed],
+            "changed": [change.to_dict() for change in self.changed],
+            "cardinalities": [change.to_dict() for change in self.cardinalities],
+        }
+
+    def __str__(self):
+        return f"{len(self.added)} added, {len(self.removed)} removed, {len(self.changed)} changed, " \
+               f"{len(self.cardinalities)} cardinalities changed"
+
+
+def _match_elements(old: FIMParser, new: FIMParser) -> Tuple[List, List, List]:
+    """
+    matches the elements of two releases by id and version. an element whose id occurs in another (single) version
+    in the other release is matched to it (a new version of the element), otherwise it was added/removed
+    :return: the matched (old, new) pairs and the added and removed elements
+    """
+    pairs = [(old.elements[key], element) for key, element in new.elements.items() if key in old.elements]
+    added = [(key, element) for key, element in new.elements.items() if key not in old.elements]
+    removed = [(key, element) for key, element in old.elements.items() if key not in new.elements]
+
+    def by_id(elements) -> Dict[str, List]:
+        elements_by_id = {}
+        for (element_id, _), element in elements:
+            elements_by_id.setdefault(element_id, []).append(element)
+        return elements_by_id
+
+    added_by_id, removed_by_id = by_id(added), by_id(removed)
+    for element_id, elements in list(added_by_id.items()):
+        previous = removed_by_id.get(element_id, [])
+        if len(elements) == 1 and len(previous) == 1:
+            pairs.append((previous[0], elements[0]))
+            del added_by_id[element_id], removed_by_id[element_id]
+
+    return pairs, [element for elements in added_by_id.values() for element in elements], \
+        [element for elements in removed_by_id.values() for element in elements]
+
+
+def _cardinalities(elements: List) -> Dict[str, Tuple[int, int]]:
+    """
+    :param elements: the structures of a form or a field group
+    :return: min and max items by the id of the contained element
+    """
+    return {element.contains.id: (element.min_items, element.max_items)
+            for element in elements if isinstance(element, FIMStructure)}
+
+
+def diff(old: FIMParser, new: FIMParser) -> SchemaDiff:
+    """
+    compares two parsed releases of a form. elements are matched by id and version, an element whose id is part of
+    both releases in a single but different version is reported as changed (element_version)
+    :param old: the previous release
+    :param new: the new release
+    :return: the added, removed and changed fields/field groups and the changed cardinalities of structures that
+    are part of both releases
+    """
+    pairs, added_elements, removed_elements = _match_elements(old, new)
+    added = [ElementChange(element.id, element.ELEMENT_TYPE, None, element.element_version)
+             for element in added_elements]
+    removed = [ElementChange(element.id, element.ELEMENT_TYPE, element.element_version, None)
+               for element in removed_elements]
+
+    changed = []
+    # top level structures and the structures of all field groups that are part of both releases
+    structures = [(None, old.form, new.form)]
+    for previous, element in pairs:
+        old_attributes, new_attributes = _attributes(previous), _attributes(element)
+        attributes = [name for name in new_attributes if old_attributes.get(name) != new_attributes[name]]
+        if isinstance(element, FIMFieldGroup) and isinstance(previous, FIMFieldGroup):
+            if [child[:2] for child in _children(previous)] != [child[:2] for child in _children(element)]:
+                attributes.append("fields")
+            structures.append((element.id, previous.fields, element.fields))
+        if type(previous) is not type(element):
+            attributes.append("type")
+        if attributes:
+            changed.append(ElementChange(element.id, element.ELEMENT_TYPE, previous.element_version,
+                                         element.element_version, attributes))
+
+    cardinalities = []
+    for parent_id, old_structures, new_structures in structures:
+        old_cardinalities = _cardinalities(old_structures)
+        cardinalities.extend(CardinalityChange(parent_id, element_id, old_cardinalities[element_id], value)
+                             for element_id, value in _cardinalities(new_structures).items()
+                             if element_id in old_cardinalities and old_cardinalities[element_id] != value)
+
+    return SchemaDiff(added, removed, changed, cardinalities)
@@ -0,0 +1,63 @@
+import hashlib
+import json
+from typing import Any, Iterator
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# chunks smaller than this are joined before they are yielded (one write/send per chunk)
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# json schemas are nested two levels deep before they get large ($defs -> definition)
+STREAM_DEPTH = 2
+
+
+def dumps(value: Any) -> bytes:
+    """
+    encodes a value as compact utf-8 json. orjson is used if it is installed, otherwise json with the same
+    separators, so both produce the same bytes for json schemas
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def etag(data: bytes) -> str:
+    """
+    :return: a strong http etag of encoded data
+    """
+    return '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+
+
+def _iter_encoded(value: Any, depth: int) -> Iterator[bytes]:
+    if depth == 0 or not isinstance(value, dict) or not value:
+        yield dumps(value)
+        return
+
+    separator = b"{"
+    for key, item in value.items():
+        yield separator + dumps(key) + b":"
+        yield from _iter_encoded(item, depth - 1)
+        separator = b","
+    yield b"}"
+
+
+def iter_chunks(value: Any, chunk_size: int = DEFAULT_CHUNK_SIZE, depth: int = STREAM_DEPTH) -> Iterator[bytes]:
+    """
+    encodes a value piece by piece, only a single nested value (e.g. a definition of $defs) is encoded at once.
+    the joined chunks are the same bytes dumps(value) returns
+    :param chunk_size: pieces are joined until they are at least this large
+    :param depth: dicts up to this depth are encoded item by item
+    :return: a generator over the encoded chunks
+    """
+    buffer, size = [], 0
+    for piece in _iter_encoded(value, depth):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
@@ -1,30 +1,552 @@
+import abc
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from abc import ABC
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+
 import untangle
 import requests
+from requests.adapters import HTTPAdapter
+
+from .instrumentation import Instrumentation, NULL_INSTRUMENTATION
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - httpx is only needed for the async api
+    httpx = None
+
+
+logger = logging.getLogger(__name__)
+
+# can be pointed to a local stand-in (see xrepository_server) with the OZG_XREPOSITORY_API environment variable
+XREPOSITORY_API = os.environ.get("OZG_XREPOSITORY_API", "https://www.xrepository.de/api")
+
+# max number of concurrent requests to xrepository when prefetching codelists
+DEFAULT_MAX_WORKERS = 8
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    :return: the pooled http session (keep-alive) shared by all requests to xrepository
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def set_xrepository_api(url: str) -> str:
+    """
+    changes the xrepository api all codelists are resolved against, e.g. to a local XRepositoryServer
+    :param url: the base url of the api (e.g. https://www.xrepository.de/api)
+    :return: the previous url
+    """
+    global XREPOSITORY_API
+    previous, XREPOSITORY_API = XREPOSITORY_API, url.rstrip("/")
+    return previous
+
+
+def open_url(url: str):
+    """
+    downloads a document with the shared http session, so documents are recorded and replayed like codelists
+    (see replay.use_cassette)
+    :return: a binary file like object streaming the response body
+    """
+    response = get_session().get(url, stream=True, timeout=30)
+    response.raise_for_status()
+    response.raw.decode_content = True
+    return response.raw
+
+
+# event loop -> its client and the async generator closing it
+_async_clients = weakref.WeakKeyDictionary()
+
+
+async def _close_on_shutdown(client: "httpx.AsyncClient"):
+    # started async generators are finalized by loop.shutdown_asyncgens() (asyncio.run calls it before closing the
+    # loop), so the client is closed together with its loop
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+def get_async_client() -> "httpx.AsyncClient":
+    """
+    :return: the pooled async http client (keep-alive) shared by all async requests of the running event loop, it is
+    closed when the loop shuts down (loop.shutdown_asyncgens(), see asyncio.run)
+    """
+    if httpx is None:
+        raise ImportError("the async api requires httpx (pip install ozg[async])")
+
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(loop)
+    if entry is None or entry[0].is_closed:
+        client = httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=32, max_keepalive_connections=16))
+        closer = _close_on_shutdown(client)
+        # starting the generator registers it with the loop (the loop only keeps a weak reference)
+        try:
+            closer.__anext__().send(None)
+        except StopIteration:
+            pass
+        entry = _async_clients[loop] = (client, closer)
+    return entry[0]
+
+
+def resolve_version(urn: str) -> str:
+    """
+    looks up the currently valid version of a codelist in xrepository
+    :param urn: the urn of the codelist
+    :return: the version identifier (dat_kennung) of the current codelist version
+    """
+    response = get_session().get(f"{XREPOSITORY_API}/codeliste/{urn}/gueltigeVersion")
+    response.raise_for_status()
+    version_xml = untangle.parse(response.text)
+    return version_xml.dat_VersionCodeliste.dat_kennung.cdata
+
+
+def download_dataset(version: str) -> List[Tuple[str, str]]:
+    """
+    downloads a specific version of a codelist from xrepository
+    :param version: the version identifier (dat_kennung) of the codelist
+    :return: a list of key/value tuples (currently always the first and second column)
+    """
+    result = get_session().get(f"{XREPOSITORY_API}/version_codeliste/{version}/genericode-daten")
+    result.raise_for_status()
+    return [(item["zelle"][0]["wert"], item["zelle"][1]["wert"]) for item in result.json()["daten"]]
+
+
+async def resolve_version_async(urn: str, client: "httpx.AsyncClient" = None) -> str:
+    """
+    async version of resolve_version
+    :param client: the http client to use (defaults to get_async_client())
+    """
+    response = await (client or get_async_client()).get(f"{XREPOSITORY_API}/codeliste/{urn}/gueltigeVersion")
+    response.raise_for_status()
+    return untangle.parse(response.text).dat_VersionCodeliste.dat_kennung.cdata
+
+
+async def download_dataset_async(version: str, client: "httpx.AsyncClient" = None) -> List[Tuple[str, str]]:
+    """
+    async version of download_dataset
+    :param client: the http client to use (defaults to get_async_client())
+    """
+    result = await (client or get_async_client()).get(
+        f"{XREPOSITORY_API}/version_codeliste/{version}/genericode-daten")
+    result.raise_for_status()
+    return [(item["zelle"][0]["wert"], item["zelle"][1]["wert"]) for item in result.json()["daten"]]
+
+
+class CodeListStore(ABC):
+    """
+    persistent storage for codelists, keyed by urn and resolved version
+    """
+
+    @abc.abstractmethod
+    def get_version(self, urn: str) -> Optional[Tuple[str, float]]:
+        """
+        :return: the last resolved version of the urn and the time it was resolved or None
+        """
+        pass
+
+    @abc.abstractmethod
+    def set_version(self, urn: str, version: str, resolved_at: float):
+        pass
+
+    @abc.abstractmethod
+    def get_dataset(self, urn: str, version: str) -> Optional[List[Tuple[str, str]]]:
+        """
+        :return: the stored dataset of the codelist version or None
+        """
+        pass
+
+    @abc.abstractmethod
+    def set_dataset(self, urn: str, version: str, dataset: List[Tuple[str, str]]):
+        pass
+
+
+class MemoryCodeListStore(CodeListStore):
+    """
+    keeps all codelists in a dict, mostly useful for tests
+    """
+
+    def __init__(self):
+        self._versions = {}
+        self._datasets = {}
+
+    def get_version(self, urn):
+        return self._versions.get(urn)
+
+    def set_version(self, urn, version, resolved_at):
+        self._versions[urn] = (version, resolved_at)
+
+    def get_dataset(self, urn, version):
+        return self._datasets.get((urn, version))
+
+    def set_dataset(self, urn, version, dataset):
+        self._datasets[(urn, version)] = list(dataset)
+
+
+class FileCodeListStore(CodeListStore):
+    """
+    stores every codelist version as a json file below a directory:
+    <directory>/<urn>/<version>.json and the last resolved version in <directory>/<urn>/version.json
+    """
+
+    VERSION_FILE = "version.json"
+
+    def __init__(self, directory: str):
+        """
+        :param directory: the directory the codelists are stored in (is created if it does not exist)
+        """
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    def _path(self, urn, filename=None):
+        path = os.path.join(self._directory, quote(urn, safe=""))
+        if filename is None:
+            return path
+        return os.path.join(path, filename)
+
+    def _read(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first so concurrent readers never see half written files
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def get_version(self, urn):
+        data = self._read(self._path(urn, self.VERSION_FILE))
+        if data is None:
+            return None
+        return data["version"], data["resolved_at"]
+
+    def set_version(self, urn, version, resolved_at):
+        self._write(self._path(urn, self.VERSION_FILE), {"version": version, "resolved_at": resolved_at})
+
+    def get_dataset(self, urn, version):
+        data = self._read(self._path(urn, quote(version, safe="") + ".json"))
+        if data is None:
+            return None
+        return [tuple(item) for item in data]
+
+    def set_dataset(self, urn, version, dataset):
+        self._write(self._path(urn, quote(version, safe="") + ".json"), [list(item) for item in dataset])
+
+
+class CachedCodeList(object):
+    def __init__(self, urn: str, version: str, dataset: List[Tuple[str, str]], resolved_at: float):
+        self.urn = urn
+        self.version = version
+        self.dataset = dataset
+        self.resolved_at = resolved_at
+
+
+class CodeListCache(object):
+    """
+    two level cache for codelists: an in memory lru in front of an (optional) persistent CodeListStore.
+    entries younger than ttl are served without any network call, older entries are revalidated by resolving
+    the current version again (the dataset is only downloaded if the version changed).
+    """
+
+    def __init__(self, store: CodeListStore = None, max_size: int = 128, ttl: float = 24 * 60 * 60,
+                 offline: bool = False):
+        """
+        :param store: persistent store for codelists (None keeps everything in memory only)
+        :param max_size: max number of codelists in the in memory lru
+        :param ttl: seconds after which a codelist is revalidated against xrepository (None = never)
+        :param offline: only serve codelists from the cache/store and never access the network
+        """
+        self._store = store
+        self._max_size = max_size
+        self._ttl = ttl
+        self._offline = offline
+        self._lru = OrderedDict()
+        self._lock = threading.RLock()
+        self._counters = dict.fromkeys(self.COUNTERS, 0)
+
+    # hits: served from the lru/store, resolved: current versions looked up in xrepository,
+    # downloaded: datasets downloaded from xrepository, failed: xrepository requests that failed
+    COUNTERS = ("hits", "resolved", "downloaded", "failed")
+
+    @property
+    def store(self) -> Optional[CodeListStore]:
+        return self._store
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: the counters (see COUNTERS) since the cache was created
+        """
+        with self._lock:
+            return dict(self._counters)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    @property
+    def offline(self) -> bool:
+        return self._offline
+
+    @offline.setter
+    def offline(self, value: bool):
+        self._offline = value
+
+    def clear(self):
+        """empties the in memory lru (the persistent store is left untouched)"""
+        with self._lock:
+            self._lru.clear()
+
+    def _remember(self, entry: CachedCodeList, key=None):
+        key = key if key is not None else entry.urn
+        with self._lock:
+            self._lru[key] = entry
+            self._lru.move_to_end(key)
+            while len(self._lru) > self._max_size:
+                self._lru.popitem(last=False)
+
+    def _lookup(self, urn) -> Optional[CachedCodeList]:
+        with self._lock:
+            entry = self._lru.get(urn)
+            if entry is not None:
+                self._lru.move_to_end(urn)
+                return entry
+
+        if self._store is None:
+            return None
+
+        version = self._store.get_version(urn)
+        if version is None:
+            return None
+        dataset = self._store.get_dataset(urn, version[0])
+        if dataset is None:
+            return None
+
+        entry = CachedCodeList(urn, version[0], dataset, version[1])
+        self._remember(entry)
+        return entry
+
+    def _lookup_pinned(self, urn, version) -> Optional[CachedCodeList]:
+        with self._lock:
+            entry = self._lru.get((urn, version))
+            if entry is not None:
+                self._lru.move_to_end((urn, version))
+                return entry
+            current = self._lru.get(urn)
+            if current is not None and current.version == version:
+                return current
+
+        dataset = self._store.get_dataset(urn, version) if self._store is not None else None
+        if dataset is None:
+            return None
+        entry = CachedCodeList(urn, version, dataset, time.time())
+        self._remember(entry, (urn, version))
+        return entry
+
+    def _pinned(self, urn, version, dataset) -> CachedCodeList:
+        self._count("downloaded")
+        if self._store is not None:
+            self._store.set_dataset(urn, version, dataset)
+        entry = CachedCodeList(urn, version, dataset, time.time())
+        self._remember(entry, (urn, version))
+        return entry
+
+    def _is_fresh(self, entry: CachedCodeList) -> bool:
+        return self._ttl is None or time.time() - entry.resolved_at < self._ttl
+
+    def _known_dataset(self, urn, version, cached: Optional[CachedCodeList]):
+        if cached is not None and cached.version == version:
+            return cached.dataset
+        return self._store.get_dataset(urn, version) if self._store is not None else None
+
+    def _resolved(self, urn, version, dataset, downloaded: bool) -> CachedCodeList:
+        resolved_at = time.time()
+        if self._store is not None:
+            if downloaded:
+                self._store.set_dataset(urn, version, dataset)
+            self._store.set_version(urn, version, resolved_at)
+        return CachedCodeList(urn, version, dataset, resolved_at)
+
+    def _fetch(self, urn, cached: Optional[CachedCodeList]) -> CachedCodeList:
+        version = resolve_version(urn)
+        self._count("resolved")
+        dataset = self._known_dataset(urn, version, cached)
+        downloaded = dataset is None
+        if downloaded:
+            dataset = download_dataset(version)
+            self._count("downloaded")
+        return self._resolved(urn, version, dataset, downloaded)
+
+    async def _fetch_async(self, urn, cached: Optional[CachedCodeList], client) -> CachedCodeList:
+        version = await resolve_version_async(urn, client)
+        self._count("resolved")
+        dataset = self._known_dataset(urn, version, cached)
+        downloaded = dataset is None
+        if downloaded:
+            dataset = await download_dataset_async(version, client)
+            self._count("downloaded")
+        return self._resolved(urn, version, dataset, downloaded)
+
+    def get(self, urn: str, version: str = None) -> Optional[CachedCodeList]:
+        """
+        :param urn: the urn of the codelist
+        :param version: the pinned version (dat_kennung) to use instead of the currently valid one. pinned versions
+        never change, so they are served from the cache without resolving the current version
+        :return: the cached codelist or None if it is neither cached nor available in xrepository
+        """
+        if version is not None:
+            cached = self._lookup_pinned(urn, version)
+            if cached is not None or self._offline:
+                self._count("hits" if cached is not None else "failed")
+                return cached
+            try:
+                return self._pinned(urn, version, download_dataset(version))
+            except Exception:
+                self._count("failed")
+                return None
+
+        cached = self._lookup(urn)
+        if cached is not None and (self._offline or self._is_fresh(cached)):
+            self._count("hits")
+            return cached
+        if self._offline:
+            self._count("failed")
+            return None
+
+        try:
+            entry = self._fetch(urn, cached)
+        except Exception:
+            # serve stale entries rather than nothing if xrepository is unavailable
+            self._count("failed")
+            return cached
+
+        self._remember(entry)
+        return entry
+
+    async def get_async(self, urn: str, client: "httpx.AsyncClient" = None,
+                        version: str = None) -> Optional[CachedCodeList]:
+        """
+        async version of get
+        :param client: the http client to use (defaults to get_async_client())
+        """
+        if version is not None:
+            cached = self._lookup_pinned(urn, version)
+            if cached is not None or self._offline:
+                self._count("hits" if cached is not None else "failed")
+                return cached
+            try:
+                return self._pinned(urn, version, await download_dataset_async(version, client))
+            except Exception:
+                self._count("failed")
+                return None
+
+        cached = self._lookup(urn)
+        if cached is not None and (self._offline or self._is_fresh(cached)):
+            self._count("hits")
+            return cached
+        if self._offline:
+            self._count("failed")
+            return None
+
+        try:
+            entry = await self._fetch_async(urn, cached, client)
+        except Exception:
+            self._count("failed")
+            return cached
+
+        self._remember(entry)
+        return entry
+
+
+_default_cache = CodeListCache()
+
+
+def get_default_cache() -> CodeListCache:
+    """:return: the cache used by FimCodeList if no cache is passed explicitly"""
+    return _default_cache
+
+
+def set_default_cache(cache: CodeListCache):
+    """
+    replaces the cache used by FimCodeList if no cache is passed explicitly
+    :param cache: the new default cache
+    """
+    global _default_cache
+    _default_cache = cache
 
 
 class FimCodeList(object):
-    def __init__(self, urn):
+    def __init__(self, urn, cache: CodeListCache = None, version: str = None):
         """
-        searches for the urn in xrepository and parses the latest version
+        searches for the urn in xrepository (or the codelist cache) and parses the latest version
         :param urn: the urn to search for
+        :param cache: the CodeListCache to use (defaults to get_default_cache())
+        :param version: pin the codelist to this version (dat_kennung) instead of the latest one
+        """
+        cache = cache if cache is not None else get_default_cache()
+        self._set_entry(urn, cache.get(urn, version) if urn else None)
+
+    @classmethod
+    async def resolve_async(cls, urn, cache: CodeListCache = None, client: "httpx.AsyncClient" = None,
+                            version: str = None) -> "FimCodeList":
+        """
+        async version of FimCodeList(urn, cache, version)
+        :param client: the http client to use (defaults to get_async_client())
         """
+        cache = cache if cache is not None else get_default_cache()
+        code_list = cls.__new__(cls)
+        code_list._set_entry(urn, await cache.get_async(urn, client, version) if urn else None)
+        return code_list
+
+    def _set_entry(self, urn, entry: Optional[CachedCodeList]):
+        self._version = None
 
         if not urn:
             self._dataset = [(None, f"no urn provided")]
+            return
 
-        try:
-            # try to find the current codelist for the urn
-            self.version_xml = untangle.parse(f"https://www.xrepository.de/api/codeliste/{urn}/gueltigeVersion")
-            self._dataset = []
-            latest_uri = self.version_xml.dat_VersionCodeliste.dat_kennung.cdata
-            # download the codelist and parse (currently always the second value) as a list of enums
-            result = requests.get(f"https://www.xrepository.de/api/version_codeliste/{latest_uri}/genericode-daten")
-            for item in result.json()["daten"]:
-                self._dataset.append((item["zelle"][0]["wert"], item["zelle"][1]["wert"]))
-        except Exception as e:
-            print(f"https://www.xrepository.de/api/codeliste/{urn}/gueltigeVersion")
-            print(f"unable to find {urn} in xrepository")
+        if entry is None:
+            logger.warning("unable to find %s in xrepository", urn)
             self._dataset = [(None, f"unable to find {urn} in xrepository")]
+            return
+
+        self._version = entry.version
+        self._dataset = entry.dataset
+
+    @property
+    def version(self) -> Optional[str]:
+        """
+        :return: the resolved version (dat_kennung) of the codelist or None if it could not be resolved
+        """
+        return self._version
 
     @property
     def dataset(self):
@@ -32,3 +554,48 @@ class FimCodeList(object):
         :return: a list of key/value tuples
         """
         return self._dataset
+
+
+def prefetch_code_lists(urns: Iterable[str], cache: CodeListCache = None, max_workers: int = DEFAULT_MAX_WORKERS,
+                        versions: Dict[str, str] = None,
+                        instrumentation: Instrumentation = NULL_INSTRUMENTATION) -> Dict[str, FimCodeList]:
+    """
+    resolves a bunch of codelists concurrently
+    :param urns: the urns of the codelists (duplicates and empty urns are ignored)
+    :param cache: the CodeListCache to use (defaults to get_default_cache())
+    :param max_workers: max number of concurrent requests to xrepository (1 disables concurrency)
+    :param versions: pinned versions by urn (all other codelists are resolved to their latest version)
+    :param instrumentation: every codelist is resolved in a code_list span
+    :return: a dict of urn -> FimCodeList
+    """
+    urns = sorted(set(urn for urn in urns if urn))
+    versions = versions or {}
+
+    def resolve(urn):
+        with instrumentation.span("code_list", urn=urn):
+            return FimCodeList(urn, cache=cache, version=versions.get(urn))
+
+    if max_workers <= 1 or len(urns) <= 1:
+        return {urn: resolve(urn) for urn in urns}
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urns))) as executor:
+        return dict(zip(urns, executor.map(resolve, urns)))
+
+
+async def prefetch_code_lists_async(urns: Iterable[str], cache: CodeListCache = None,
+                                    client: "httpx.AsyncClient" = None, max_workers: int = DEFAULT_MAX_WORKERS,
+                                    versions: Dict[str, str] = None) -> Dict[str, FimCodeList]:
+    """
+    async version of prefetch_code_lists
+    :param client: the http client to use (defaults to get_async_client())
+    :param max_workers: max number of concurrent requests to xrepository
+    """
+    urns = sorted(set(urn for urn in urns if urn))
+    versions = versions or {}
+    semaphore = asyncio.Semaphore(max(max_workers, 1))
+
+    async def resolve(urn):
+        async with semaphore:
+            return await FimCodeList.resolve_async(urn, cache=cache, client=client, version=versions.get(urn))
+
+    return dict(zip(urns, await asyncio.gather(*[resolve(urn) for urn in urns])))
@@ -0,0 +1,138 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable
+
+# called with the name of the span, its duration in seconds and its attributes
+SpanCallback = Callable[[str, float, Dict], None]
+
+
+class Stats(object):
+    """
+    timers (total seconds per phase) and counters collected by an Instrumentation
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_time(self, phase: str, seconds: float):
+        with self._lock:
+            self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other: Dict):
+        """
+        :param other: the as_dict() of another Stats, e.g. from a worker process
+        """
+        for phase, seconds in other.get("timings", {}).items():
+            self.add_time(phase, seconds)
+        for name, value in other.get("counters", {}).items():
+            self.count(name, value)
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            return {"timings": dict(self.timings), "counters": dict(self.counters)}
+
+    def __str__(self):
+        timings = ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in self.timings.items())
+        counters = ", ".join(f"{name} {value}" for name, value in self.counters.items())
+        return "; ".join(part for part in [timings, counters] if part)
+
+    def __repr__(self):
+        return f"Stats({self})"
+
+
+class _Span(object):
+    __slots__ = ("_instrumentation", "_name", "_attributes", "_start", "_otel_span")
+
+    def __init__(self, instrumentation: "Instrumentation", name: str, attributes: Dict):
+        self._instrumentation = instrumentation
+        self._name = name
+        self._attributes = attributes
+        self._otel_span = None
+
+    def __enter__(self):
+        tracer = self._instrumentation.tracer
+        if tracer is not None:
+            self._otel_span = tracer.start_as_current_span(f"ozg.{self._name}", attributes=self._attributes)
+            self._otel_span.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self._start
+        if self._otel_span is not None:
+            self._otel_span.__exit__(exc_type, exc_value, traceback)
+        self._instrumentation.finish(self._name, elapsed, self._attributes)
+        return False
+
+
+class Instrumentation(object):
+    """
+    collects timings and counters of the parse/convert pipeline (see Stats) and reports every span to callbacks,
+    a logger (debug level) and an OpenTelemetry style tracer
+    """
+
+    enabled = True
+
+    def __init__(self, callbacks: Iterable[SpanCallback] = (), logger: logging.Logger = None, tracer=None):
+        """
+        :param callbacks: called with (name, seconds, attributes) whenever a span ends
+        :param logger: the spans are logged to this logger (debug level)
+        :param tracer: an object with start_as_current_span(name, attributes=...) like opentelemetry.trace.Tracer
+        """
+        self.stats = Stats()
+        self.callbacks = list(callbacks)
+        self.logger = logger
+        self.tracer = tracer
+
+    def span(self, name: str, **attributes) -> _Span:
+        """
+        :return: a context manager timing the phase name
+        """
+        return _Span(self, name, attributes)
+
+    def count(self, name: str, value: int = 1):
+        self.stats.count(name, value)
+
+    def finish(self, name: str, seconds: float, attributes: Dict):
+        self.stats.add_time(name, seconds)
+        for callback in self.callbacks:
+            callback(name, seconds, attributes)
+        if self.logger is not None:
+            self.logger.debug("%s took %.3fs %s", name, seconds, attributes)
+
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class NullInstrumentation(object):
+    """
+    used if instrumentation is disabled, spans and counters are no-ops
+    """
+
+    enabled = False
+    stats = None
+
+    _SPAN = _NullSpan()
+
+    def span(self, name: str, **attributes) -> _NullSpan:
+        return self._SPAN
+
+    def count(self, name: str, value: int = 1):
+        pass
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
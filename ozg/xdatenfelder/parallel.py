@@ -0,0 +1,325 @@
+import io
+import os
+import pickle
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import untangle
+
+from . import streaming
+from .code_list_index import CodeListLock
+from .fim_code_lists import CodeListCache, DEFAULT_MAX_WORKERS, open_url
+from .instrumentation import Instrumentation
+from .parser import FIMParser, FIMParserError, FIMStructure, FIMFieldGroup
+
+_ENCODING = re.compile(rb"^\s*<\?xml[^>]*encoding=[\"']([\w.-]+)[\"']")
+_ROOT_TAG = re.compile(r"<(?![?!])([^\s>/]+)[^>]*>")
+_STRUCTURE_TAG = re.compile(r"<(/?)xdf:struktur\b[^>]*?(/?)>")
+_SCHEMA_START = re.compile(r"<xdf:stammdatenschema\b")
+_SCHEMA_END = "</xdf:stammdatenschema>"
+
+
+class SplitDocument(object):
+    def __init__(self, header: str, root_tag: str, root_name: str, structures: List[str]):
+        """
+        a xDatenfelder document split into its top level structures
+        :param header: the document without the top level structures
+        :param root_tag: the start tag of the root element (with all namespace declarations)
+        :param root_name: the name of the root element
+        :param structures: the xml of every top level structure (xdf:struktur of xdf:stammdatenschema)
+        """
+        self.header = header
+        self.root_tag = root_tag
+        self.root_name = root_name
+        self.structures = structures
+
+    def fragment(self, structures: List[str]) -> bytes:
+        """
+        :return: a document containing only the given structures, they are direct children of the root element
+        """
+        return f'<?xml version="1.0" encoding="UTF-8"?>{self.root_tag}{"".join(structures)}' \
+               f'</{self.root_name}>'.encode("utf-8")
+
+
+def read_source(source) -> str:
+    """
+    :param source: xml as a string, a filename or an url (like FIMParser)
+    :return: the decoded xml
+    """
+    if isinstance(source, os.PathLike) or (isinstance(source, str) and not source.lstrip().startswith("<")
+                                           and os.path.exists(source)):
+        with open(source, "rb") as fh:
+            data = fh.read()
+    elif isinstance(source, str) and source.startswith(("http://", "https://")):
+        stream = open_url(source)
+        try:
+            data = stream.read()
+        finally:
+            stream.close()
+    elif isinstance(source, bytes):
+        data = source
+    else:
+        return source
+
+    match = _ENCODING.match(data)
+    return data.decode(match.group(1).decode("ascii") if match else "utf-8")
+
+
+def split_document(xml: str) -> SplitDocument:
+    """
+    splits a stammdatenschema into its top level structures without parsing it (the structures are found by
+    counting the nesting of xdf:struktur tags, the document has to use the xdf prefix like FIMParser expects)
+    :param xml: the decoded xml
+    :return: the split document (without structures if the document does not contain a stammdatenschema)
+    """
+    root = _ROOT_TAG.search(xml)
+    if root is None:
+        raise FIMParserError("the document does not contain any xml element")
+
+    start = _SCHEMA_START.search(xml)
+    end = xml.rfind(_SCHEMA_END)
+    if start is None or end < 0:
+        return SplitDocument(xml, root.group(0), root.group(1), [])
+
+    header, structures = [], []
+    depth, position, structure_start = 0, 0, None
+    for tag in _STRUCTURE_TAG.finditer(xml, start.end(), end):
+        closing, self_closing = tag.group(1), tag.group(2)
+        if self_closing:
+            continue
+        if not closing:
+            if depth == 0:
+                structure_start = tag.start()
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                header.append(xml[position:structure_start])
+                structures.append(xml[structure_start:tag.end()])
+                position = tag.end()
+    if depth != 0:
+        raise FIMParserError("unbalanced xdf:struktur elements")
+    header.append(xml[position:])
+    return SplitDocument("".join(header), root.group(0), root.group(1), structures)
+
+
+def _shell_parser(version: str, backend: str) -> FIMParser:
+    # the structures of a fragment are parsed without a document, the elements are adopted by the real parser
+    parser = FIMParser.__new__(FIMParser)
+    parser._init_state(None, backend, None, DEFAULT_MAX_WORKERS, False)
+    parser._version = version
+    return parser
+
+
+def _parse_fragment(fragment: bytes, version: str, backend: str) -> List[FIMStructure]:
+    parser = _shell_parser(version, backend)
+    if backend == FIMParser.BACKEND_STREAMING:
+        document = streaming.parse(fragment)
+    else:
+        document = untangle.parse(io.BytesIO(fragment))
+    return [FIMStructure(element, parser) for element in document.children[0].get_elements("xdf_struktur")]
+
+
+class _ParserPickler(pickle.Pickler):
+    """pickles model elements without the parser they belong to"""
+
+    def persistent_id(self, obj):
+        return "parser" if isinstance(obj, FIMParser) else None
+
+
+class _ParserUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, parser: FIMParser):
+        super().__init__(file)
+        self._parser = parser
+
+    def persistent_load(self, pid):
+        return self._parser
+
+
+def _parse_fragment_pickled(fragment: bytes, version: str, backend: str) -> bytes:
+    buffer = io.BytesIO()
+    _ParserPickler(buffer, protocol=5).dump(_parse_fragment(fragment, version, backend))
+    return buffer.getvalue()
+
+
+# the model of a ParallelFIMParser in a json worker process
+_worker_parser: Optional[FIMParser] = None
+
+
+def _init_json_worker(model: bytes):
+    global _worker_parser
+    _worker_parser = FIMParser.loads(model)
+
+
+def _json_fragment(parser: FIMParser, start: int, stop: int) -> Tuple[List, dict]:
+    properties, defs = [], {}
+    for element in parser.form[start:stop]:
+        schema, defs = element.to_json(defs)
+        properties.append(schema)
+    return properties, defs
+
+
+def _json_fragment_in_worker(start: int, stop: int) -> Tuple[List, dict]:
+    return _json_fragment(_worker_parser, start, stop)
+
+
+def merge_defs(fragments: List[dict]) -> dict:
+    """
+    merges the $defs of consecutive ranges of structures, the first definition of an id wins. the result is the
+    same (including the order) as generating all structures one after another
+    """
+    defs = {}
+    for fragment in fragments:
+        for element_id, definition in fragment.items():
+            if element_id not in defs:
+                defs[element_id] = definition
+    return defs
+
+
+class ParallelFIMParser(FIMParser):
+    """
+    a FIMParser that parses the top level structures of a stammdatenschema and generates their json schemas in
+    parallel. the document is split into its top level structures, every worker parses a consecutive range of them
+    (or builds the $defs of a range) and the results are merged in document order, so the model and the json schema
+    are exactly the same as the ones of FIMParser. field group documents (without top level structures) are parsed
+    like FIMParser does.
+    """
+
+    # worker processes, every range of structures is pickled back to the parser
+    EXECUTOR_PROCESSES = "processes"
+    # worker threads, only faster on free-threaded python builds
+    EXECUTOR_THREADS = "threads"
+
+    EXECUTORS = [EXECUTOR_PROCESSES, EXECUTOR_THREADS]
+
+    # every worker gets this many ranges of structures (smaller ranges balance the load, larger ones share more)
+    RANGES_PER_WORKER = 2
+
+    def __init__(self, fim_xml: str, override_version_check: str = None, workers: int = None,
+                 executor: str = EXECUTOR_PROCESSES, code_list_cache: CodeListCache = None,
+                 max_workers: int = DEFAULT_MAX_WORKERS, backend: str = FIMParser.BACKEND_UNTANGLE,
+                 keep_xml: bool = False, code_list_lock: CodeListLock = None, pin_code_lists: bool = False,
+                 instrumentation: Instrumentation = None):
+        """
+        :param workers: number of worker processes/threads (defaults to the number of cpus, 1 disables parallelism)
+        :param executor: EXECUTOR_PROCESSES or EXECUTOR_THREADS
+        see FIMParser for all other parameters, parsed_xml only contains the header of the document (like the
+        streaming backend)
+        """
+        if executor not in self.EXECUTORS:
+            raise FIMParserError(f"unknown executor {executor}")
+        self._init_state(fim_xml, backend, code_list_cache, max_workers, keep_xml, code_list_lock, pin_code_lists,
+                         instrumentation=instrumentation)
+        self._workers = workers or os.cpu_count() or 1
+        self._executor = executor
+
+        with self._instrumentation.span("parse", backend=backend, workers=self._workers):
+            with self._instrumentation.span("split"):
+                document = split_document(read_source(fim_xml))
+            with self._instrumentation.span("xml"):
+                self._parsed_xml = self._parse_header_document(document)
+            self._init_version(override_version_check)
+            self._parse_root_header()
+            self._parse_structure(document)
+
+        if not keep_xml:
+            self._parsed_xml = None
+        if self._instrumentation.enabled:
+            self._count_elements()
+
+    def _parse_header_document(self, document: SplitDocument):
+        if self._backend == self.BACKEND_STREAMING:
+            return streaming.parse(document.header)
+        return untangle.parse(io.StringIO(document.header))
+
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    @property
+    def executor(self) -> str:
+        return self._executor
+
+    def _pool(self, **kwargs) -> Executor:
+        if self._executor == self.EXECUTOR_THREADS:
+            return ThreadPoolExecutor(max_workers=self._workers)
+        return ProcessPoolExecutor(max_workers=self._workers, **kwargs)
+
+    def _ranges(self, count: int) -> List[Tuple[int, int]]:
+        """
+        :return: consecutive (start, stop) ranges covering count items
+        """
+        size = max(1, -(-count // (self._workers * self.RANGES_PER_WORKER)))
+        return [(start, min(start + size, count)) for start in range(0, count, size)]
+
+    def _parse_structure(self, document: SplitDocument = None):
+        if document is None:
+            document = split_document(read_source(self._xml))
+        if not document.structures:
+            # a field group document, the header document is the whole document
+            self._parsed_xml = self._parse_header_document(document)
+            return super()._parse_structure()
+
+        self.invalidate()
+        ranges = self._ranges(len(document.structures))
+        fragments = [document.fragment(document.structures[start:stop]) for start, stop in ranges]
+
+        with self._instrumentation.span("model", ranges=len(ranges)):
+            if self._workers <= 1 or len(ranges) <= 1:
+                results = [_parse_fragment(fragment, self._version, self._backend) for fragment in fragments]
+            elif self._executor == self.EXECUTOR_THREADS:
+                with self._pool() as pool:
+                    results = list(pool.map(_parse_fragment, fragments, [self._version] * len(fragments),
+                                            [self._backend] * len(fragments)))
+            else:
+                with self._pool() as pool:
+                    results = [_ParserUnpickler(io.BytesIO(data), self).load()
+                               for data in pool.map(_parse_fragment_pickled, fragments,
+                                                    [self._version] * len(fragments),
+                                                    [self._backend] * len(fragments))]
+            self._adopt([structure for structures in results for structure in structures])
+
+    def _adopt(self, structures: List[FIMStructure]):
+        """
+        makes this parser the owner of structures that were parsed by the workers and shares elements (by id and
+        version) across ranges like FIMParser.intern does, in the same order
+        """
+        self._form = []
+        self._elements = {}
+
+        def adopt(element):
+            key = (element.id, element.element_version)
+            existing = self._elements.get(key)
+            if isinstance(existing, type(element)):
+                return existing
+
+            element._fim_parser = self
+            if isinstance(element, FIMFieldGroup):
+                for structure in element.fields:
+                    structure._fim_parser = self
+                    structure._contains = adopt(structure.contains)
+            self._elements[key] = element
+            return element
+
+        for structure in structures:
+            structure._fim_parser = self
+            structure._contains = adopt(structure.contains)
+            self._form.append(structure)
+
+    def _build_properties(self):
+        ranges = self._ranges(len(self.form))
+        if self._workers <= 1 or len(ranges) <= 1:
+            return super()._build_properties()
+
+        if self._executor == self.EXECUTOR_THREADS:
+            with self._pool() as pool:
+                fragments = list(pool.map(_json_fragment, [self] * len(ranges), *zip(*ranges)))
+        else:
+            # every worker process gets the whole model (with the resolved codelists) once
+            with self._pool(initializer=_init_json_worker, initargs=(self.dumps(),)) as pool:
+                fragments = list(pool.map(_json_fragment_in_worker, *zip(*ranges)))
+
+        properties = [schema for fragment_properties, _ in fragments for schema in fragment_properties]
+        return properties, merge_defs([defs for _, defs in fragments])
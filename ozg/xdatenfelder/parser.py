@@ -1,25 +1,179 @@
 import abc
+import copy
 import json
+import mmap
+import pickle
+import sys
 import untangle
-from typing import List, Any, Union
+from collections import deque
+from enum import Enum
+from typing import List, Any, Union, Dict, Optional, Tuple, TYPE_CHECKING
 from abc import ABC
 
-from .fim_code_lists import FimCodeList
+from . import emitter, streaming
+from .code_list_index import CodeListLock
+from .fim_code_lists import FimCodeList, CodeListCache, prefetch_code_lists, get_default_cache, open_url, \
+    DEFAULT_MAX_WORKERS
+from .instrumentation import Instrumentation, Stats, NULL_INSTRUMENTATION
+
+if TYPE_CHECKING:  # pragma: no cover - catalogue imports the parser
+    from .catalogue import ElementCatalogue
 
 
 class FIMParserError(Exception):
     pass
 
 
+def parse_xml(source):
+    """
+    parses xml with untangle, urls are downloaded with the shared http session (see fim_code_lists.open_url)
+    :param source: xml as a string, a filename or an url
+    """
+    if isinstance(source, str) and source.startswith(("http://", "https://")):
+        stream = open_url(source)
+        try:
+            return untangle.parse(stream)
+        finally:
+            stream.close()
+    return untangle.parse(source)
+
+
+class FIMCode(str, Enum):
+    """
+    base class for xDatenfelder codes, members compare equal to their code (e.g. FieldType.SELECT == "select")
+    """
+
+    @classmethod
+    def from_code(cls, code: str):
+        """
+        :return: the member for the code or the (interned) code itself if it is unknown
+        """
+        try:
+            return cls(code)
+        except ValueError:
+            return sys.intern(code)
+
+    def __str__(self):
+        return self.value
+
+
+class FieldType(FIMCode):
+    """xDatenfelder feldart"""
+    INPUT = "input"
+    SELECT = "select"
+    LABEL = "label"
+    HIDDEN = "hidden"
+    LOCKED = "locked"
+
+
+class DataType(FIMCode):
+    """xDatenfelder datentyp"""
+    TEXT = "text"
+    DATE = "date"
+    BOOL = "bool"
+    NUM = "num"
+    NUM_INT = "num_int"
+    NUM_CURRENCY = "num_currency"
+    FILE = "file"
+    OBJ = "obj"
+
+
+# json schema of the input fields of every data type, see register_data_type
+DATA_TYPE_SCHEMAS = {
+    DataType.TEXT: {"type": "string"},
+    DataType.DATE: {"type": "string", "format": "date"},
+    DataType.BOOL: {"type": "boolean"},
+    DataType.NUM: {"type": "number"},
+    DataType.NUM_INT: {"type": "integer"},
+    DataType.NUM_CURRENCY: {"type": "number"},
+    DataType.FILE: {"type": "string", "x-display": "file"},
+    DataType.OBJ: {"type": "string", "x-display": "data-url"},
+}
+
+
+def register_data_type(code: str, schema: Dict):
+    """
+    adds (or replaces) the json schema of input fields of a data type, e.g. for data types of newer xDatenfelder
+    versions. fields are compiled while parsing, so the data type has to be registered before the form is parsed
+    :param code: the xDatenfelder datentyp code
+    :param schema: the json schema keywords of the data type (e.g. {"type": "string", "format": "time"})
+    """
+    DATA_TYPE_SCHEMAS[DataType.from_code(code)] = dict(schema)
+
+
+class ValidationConstraints(object):
+    """
+    the parsed validation details (xdf:praezisierung) of a field, None if a constraint is not set
+    """
+    __slots__ = ("min_length", "max_length", "minimum", "maximum", "pattern")
+
+    # attribute, key in xdf:praezisierung, json schema keyword
+    KEYWORDS = (("min_length", "minLength", "minLength"), ("max_length", "maxLength", "maxLength"),
+                ("minimum", "minValue", "minimum"), ("maximum", "maxValue", "maximum"))
+
+    def __init__(self, min_length: int = None, max_length: int = None, minimum: int = None, maximum: int = None,
+                 pattern: str = None):
+        self.min_length = min_length
+        self.max_length = max_length
+        self.minimum = minimum
+        self.maximum = maximum
+        self.pattern = pattern
+
+    @classmethod
+    def parse(cls, details: Optional[str]) -> "ValidationConstraints":
+        """
+        :param details: the json encoded validation details of a field
+        :return: the constraints (without any constraint if the details are missing or invalid)
+        """
+        constraints = cls()
+        if not details:
+            return constraints
+        try:
+            validation = json.loads(details)
+            for attribute, key, _ in cls.KEYWORDS:
+                if key in validation:
+                    setattr(constraints, attribute, int(validation[key]))
+            if "pattern" in validation:
+                constraints.pattern = validation["pattern"]
+        except (ValueError, TypeError):
+            return cls()
+        return constraints
+
+    def json_schema(self) -> Tuple[Tuple[str, Any], ...]:
+        """
+        :return: the json schema keywords of all set constraints as (keyword, value) pairs
+        """
+        items = tuple((keyword, getattr(self, attribute)) for attribute, _, keyword in self.KEYWORDS
+                      if getattr(self, attribute) is not None)
+        if self.pattern is not None:
+            items += (("pattern", self.pattern),)
+        return items
+
+    def __bool__(self):
+        return any(getattr(self, attribute) is not None for attribute in self.__slots__)
+
+    def __eq__(self, other):
+        return isinstance(other, ValidationConstraints) and \
+               all(getattr(self, attribute) == getattr(other, attribute) for attribute in self.__slots__)
+
+    def __repr__(self):
+        constraints = ", ".join(f"{attribute}={getattr(self, attribute)!r}" for attribute in self.__slots__
+                                if getattr(self, attribute) is not None)
+        return f"ValidationConstraints({constraints})"
+
+
 class FIMHeaderMixin(object):
+    # slots of the header fields, used by the element classes (the mixin itself has to stay slot free so that it
+    # can be combined with FIMElement)
+    HEADER_SLOTS = ("_id", "_element_version", "_name", "_description", "_input_name", "_internal_definition",
+                    "_relation", "_output_name")
+
+    __slots__ = ()
 
     def _parse_header(self, element):
         # required fields by FIM standard
         base_schema = element
-        if self._version == FIMParser.FIM_VERSION_2:
-            self._id = base_schema.xdf_identifikation.xdf_id.cdata
-        elif self._version == FIMParser.FIM_VERSION_1:
-            self._id = base_schema.xdf_id.cdata
+        self._id, self._element_version = FIMParser.identification(base_schema, self._version)
         self._name = base_schema.xdf_name.cdata
         self._description = self.set_none_if_empty(base_schema.xdf_beschreibung.cdata)
         self._input_name = self.set_none_if_empty(base_schema.xdf_bezeichnungEingabe.cdata)
@@ -28,12 +182,40 @@ class FIMHeaderMixin(object):
 
         # optional fields by fim standard
         if len(element.get_elements("xdf_bezeichnungAusgabe")) > 0:
-            self._output_name = base_schema.xdf_bezeichnungAusgabe
+            self._output_name = self.set_none_if_empty(base_schema.xdf_bezeichnungAusgabe.cdata)
         else:
             self._output_name = None
 
-        # TODO: parse status gueltigAb gueltigBis fachlicherErsteller versionshinweis freigabedatum veroeffentlichungsdatum
-        # in FimParser itself
+    # optional metadata of a header by key and xml element (status is a code)
+    METADATA_ELEMENTS = {
+        "status": "xdf_status",
+        "valid_from": "xdf_gueltigAb",
+        "valid_until": "xdf_gueltigBis",
+        "author": "xdf_fachlicherErsteller",
+        "version_note": "xdf_versionshinweis",
+        "release_date": "xdf_freigabedatum",
+        "publication_date": "xdf_veroeffentlichungsdatum",
+    }
+
+    def parse_metadata(self, element) -> dict:
+        """
+        parses the status, validity and release information of a header (only done for the schema itself, the
+        elements do not keep them)
+        :param element: the xml element of the header (e.g. xdf:stammdatenschema)
+        :return: the value (None if it is missing or empty) of every key in METADATA_ELEMENTS
+        """
+        metadata = {}
+        for key, name in self.METADATA_ELEMENTS.items():
+            value = None
+            children = element.get_elements(name)
+            if children:
+                value = children[0]
+                if key == "status":
+                    codes = value.get_elements("code")
+                    value = codes[0] if codes else None
+                value = self.set_none_if_empty(value.cdata.strip()) if value is not None else None
+            metadata[key] = value
+        return metadata
 
     EMPTY_VALUES = ["", ".", "-"]
 
@@ -57,6 +239,13 @@ class FIMHeaderMixin(object):
         """
         return self._id
 
+    @property
+    def element_version(self) -> str:
+        """
+        :return: the version of the element (xdf:version) or None if the element is not versioned
+        """
+        return self._element_version
+
     @property
     def name(self) -> str:
         """
@@ -101,43 +290,45 @@ class FIMHeaderMixin(object):
 
 
 class FIMElement(ABC):
+    __slots__ = ("_fim_parser", "_version")
+
     def __init__(self, definition, fim_parser):
         """
-        the representation of a fim structure
+        the representation of a fim structure, the xml definition is only used while parsing and not kept
         :param definition: the fim structure definition as untangle xml object
         :param fim_parser: the current fim parser instance
         """
-        self._definition = definition
-        self._parsed_xml = definition
         self._fim_parser = fim_parser
         self._version = fim_parser._version
-        self._parse()
+        self._parse(definition)
 
     @abc.abstractmethod
-    def _parse(self):
+    def _parse(self, definition):
         pass
 
 
 class FIMStructure(FIMElement):
+    __slots__ = ("_min_items", "_max_items", "_related_field", "_contains")
+
     MAX_ITEMS_UNLIMITED = 9999
 
-    def _parse(self):
-        min_items, max_items = str(self._definition.xdf_anzahl.cdata).split(":")
+    def _parse(self, definition):
+        min_items, max_items = str(definition.xdf_anzahl.cdata).split(":")
 
         self._min_items = int(min_items)
         self._max_items = int(max_items) if max_items != "*" else self.MAX_ITEMS_UNLIMITED
 
-        if len(self._definition.get_elements("xdf_bezug")) > 0:
-            self._related_field = str(self._definition.xdf_bezug.cdata)
+        if len(definition.get_elements("xdf_bezug")) > 0:
+            self._related_field = str(definition.xdf_bezug.cdata)
         else:
             self._related_field = None
 
-        if len(self._definition.xdf_enthaelt.get_elements("xdf_datenfeld")) == 1:
-            self._contains = FIMField(self._definition.xdf_enthaelt.xdf_datenfeld, self._fim_parser)
-        elif len(self._definition.xdf_enthaelt.get_elements("xdf_datenfeldgruppe")) == 1:
-            self._contains = FIMFieldGroup(self._definition.xdf_enthaelt.xdf_datenfeldgruppe, self._fim_parser)
-        elif len(self._definition.get_elements("xdf_datenfeldgruppe")) == 1:
-            self._contains = FIMFieldGroup(self._definition.xdf_datenfeldgruppe, self._fim_parser)
+        if len(definition.xdf_enthaelt.get_elements("xdf_datenfeld")) == 1:
+            self._contains = self._fim_parser.intern(FIMField, definition.xdf_enthaelt.xdf_datenfeld)
+        elif len(definition.xdf_enthaelt.get_elements("xdf_datenfeldgruppe")) == 1:
+            self._contains = self._fim_parser.intern(FIMFieldGroup, definition.xdf_enthaelt.xdf_datenfeldgruppe)
+        elif len(definition.get_elements("xdf_datenfeldgruppe")) == 1:
+            self._contains = self._fim_parser.intern(FIMFieldGroup, definition.xdf_datenfeldgruppe)
         else:
             raise FIMParserError("FIMStructure contains unrecognised element")
 
@@ -181,15 +372,16 @@ class FIMStructure(FIMElement):
         return False
 
     def to_json(self, defs, level=None):
-        if isinstance(self.contains, FIMField):
-            fim_structure_schema = self.contains.to_json()
-        elif isinstance(self.contains, FIMFieldGroup):
-            fim_structure_schema, defs = self.contains.to_json(defs)
-        else:
-            raise RuntimeError("Unknown element inside FIMStructure")
-
-        # add containing element to defs
+        # shared elements are only generated once, all further occurrences just reference them
         if self.contains.id not in defs:
+            if isinstance(self.contains, FIMField):
+                fim_structure_schema = self.contains._cached_json()
+            elif isinstance(self.contains, FIMFieldGroup):
+                fim_structure_schema, defs = self.contains._cached_json(defs)
+            else:
+                raise RuntimeError("Unknown element inside FIMStructure")
+
+            # add containing element to defs
             defs[self.contains.id] = fim_structure_schema
 
         if self.max_items == 1 and self.min_items <= 1:
@@ -221,33 +413,77 @@ class FIMStructure(FIMElement):
 
 
 class FIMField(FIMElement, FIMHeaderMixin):
-    def _parse(self):
-        self._parse_header(self._definition)
+    __slots__ = FIMHeaderMixin.HEADER_SLOTS + ("_field_type", "_data_type", "_validation_details", "_default_value",
+                                               "_input_hint", "_output_hint", "_reference_value_uri",
+                                               "_reference_value_version", "_validation", "_template")
+
+    def _parse(self, definition):
+        self._parse_header(definition)
 
-        self._field_type = self._definition.xdf_feldart.code.cdata
-        self._data_type = self._definition.xdf_datentyp.code.cdata
-        self._validation_details = self._definition.xdf_praezisierung.cdata
-        self._default_value = self.set_none_if_empty(self._definition.xdf_inhalt.cdata)
-        self._input_hint = self.set_none_if_empty(self._definition.xdf_hilfetextEingabe.cdata)
-        self._output_hint = self.set_none_if_empty(self._definition.xdf_hilfetextAusgabe.cdata)
+        self._field_type = FieldType.from_code(definition.xdf_feldart.code.cdata)
+        self._data_type = DataType.from_code(definition.xdf_datentyp.code.cdata)
+        self._validation_details = definition.xdf_praezisierung.cdata
+        self._default_value = self.set_none_if_empty(definition.xdf_inhalt.cdata)
+        self._input_hint = self.set_none_if_empty(definition.xdf_hilfetextEingabe.cdata)
+        self._output_hint = self.set_none_if_empty(definition.xdf_hilfetextAusgabe.cdata)
 
         self._reference_value_uri = None
+        self._reference_value_version = None
         if self._field_type == "select":
             if self._version == FIMParser.FIM_VERSION_1:
-                if len(self._definition.get_elements("xdf_codeliste")) == 1:
-                    self._reference_value_uri = self._definition.xdf_codeliste.xdf_kennung.cdata
+                if len(definition.get_elements("xdf_codeliste")) == 1:
+                    self._reference_value_uri = definition.xdf_codeliste.xdf_kennung.cdata
+                    self._reference_value_version = self._code_list_version(definition.xdf_codeliste, None)
             elif self._version == FIMParser.FIM_VERSION_2:
-                if len(self._definition.get_elements("xdf_codelisteReferenz")) == 1:
-                    self._reference_value_uri = self._definition.xdf_codelisteReferenz.xdf_genericodeIdentification.xdf_canonicalIdentification.cdata
-                    print(self._reference_value_uri)
+                if len(definition.get_elements("xdf_codelisteReferenz")) == 1:
+                    self._reference_value_uri = definition.xdf_codelisteReferenz.xdf_genericodeIdentification.xdf_canonicalIdentification.cdata
+                    identification = definition.xdf_codelisteReferenz.xdf_genericodeIdentification
+                    self._reference_value_version = self._code_list_version(
+                        identification, identification.get_elements("xdf_canonicalVersionUri"))
+
+        self.compile()
+
+    def compile(self):
+        """
+        compiles everything the json schema needs once, to_json only copies the template. FIMParser.invalidate
+        calls it again after the field was changed
+        """
+        self._validation = ValidationConstraints.parse(self._validation_details)
+        self._template = self._compile_template()
+
+    def _code_list_version(self, definition, version_uri):
+        """
+        :return: the version (dat_kennung) of the referenced codelist: the canonical version uri if present,
+        otherwise <urn>_<version> like xrepository names its versions (None if the version is not specified)
+        """
+        if version_uri and version_uri[0].cdata:
+            return version_uri[0].cdata
+        if len(definition.get_elements("xdf_version")) == 1 and definition.xdf_version.cdata:
+            return f"{self._reference_value_uri}_{definition.xdf_version.cdata}"
+        return None
 
     ELEMENT_TYPE = "field"
 
     @property
-    def field_type(self):
-        """xDatenfelder field_type"""
+    def reference_value_uri(self):
+        """urn of the codelist used by select fields (None for all other fields)"""
+        return self._reference_value_uri
+
+    @property
+    def reference_value_version(self):
+        """version (dat_kennung) of the codelist the document refers to (None if it is not specified)"""
+        return self._reference_value_version
+
+    @property
+    def field_type(self) -> Union[FieldType, str]:
+        """xDatenfelder field_type (FieldType or the code itself if it is unknown)"""
         return self._field_type
 
+    @property
+    def validation(self) -> ValidationConstraints:
+        """the parsed validation details (xdf:praezisierung) of the field"""
+        return self._validation
+
     @property
     def input_hint(self):
         return self._input_hint
@@ -261,7 +497,7 @@ class FIMField(FIMElement, FIMHeaderMixin):
         return self._default_value
 
     @property
-    def data_type(self):
+    def data_type(self) -> Union[DataType, str]:
         """
                 text Text
                 date Datum
@@ -271,106 +507,130 @@ class FIMField(FIMElement, FIMHeaderMixin):
                 num_currency Geldbetrag
                 file Anlage (Datei)
                 obj Objekt (Blob)
-        :return: one of th xDatenfelder data types
+        :return: one of th xDatenfelder data types (DataType or the code itself if it is unknown)
         """
         return self._data_type
 
     def to_json(self, level=None):
         """
-        :return: json schema representation of the field
-        """
-        mapping = {
-            "text": {"type": "string"},
-            "date": {"type": "string", "format": "date"},
-            "bool": {"type": "boolean"},
-            "num": {"type": "number"},
-            "num_int": {"type": "integer"},
-            "num_currency": {"type": "number"},
-            "file": {"type": "string", "x-display": "file"},
-            "obj": {"type": "string", "x-display": "data-url"},
-        }
-
-        if self.field_type == "input":
-            a = mapping[self.data_type]
-            a["title"] = self.input_name if self.input_name else self.name
-            if self._input_hint:
-                a["description"] = self._input_hint
-
-            if self._default_value:
-                a["default"] = self.default_value
-
-            if self._validation_details:
-                try:
-                    validation = json.loads(self._validation_details)
-                    if "minLength" in validation:
-                        a["minLength"] = int(validation["minLength"])
-                    if "maxLength" in validation:
-                        a["maxLength"] = int(validation["maxLength"])
-                    if "minValue" in validation:
-                        a["minimum"] = int(validation["minValue"])
-                    if "maxValue" in validation:
-                        a["maximum"] = int(validation["maxValue"])
-                    if "pattern" in validation:
-                        a["pattern"] = validation["pattern"]
-                except ValueError:
-                    pass
-            return a
-        elif self.field_type == "select":
-            fim_code_list = FimCodeList(self._reference_value_uri)
-            any_of = []
-            for choice in fim_code_list.dataset:
-                any_of.append(choice[1])
-
-            schema = {
-                "title": self.input_name if self.input_name else self.name,
-                "type": "string",
-                "enum": any_of,
-            }
-
-            if self._input_hint:
-                schema["description"] = self._input_hint
-
-            return schema
-        elif self.field_type == "label":
-            return {
-                "title": self.input_name if self.input_name else self.name,
-                "description": self.default_value,
-                "type": "string",
-                "x-display": "label"
-            }
-        else:
-            schema = {
-                "title": self.input_name if self.input_name else self.name,
-                "type": "string"
-            }
+        :return: json schema representation of the field (a copy, changing it does not affect the parser)
+        """
+        schema = dict(self._cached_json())
+        if "enum" in schema:
+            schema["enum"] = list(schema["enum"])
+        return schema
 
-            if self._input_hint:
-                schema["description"] = self._input_hint
+    def _cached_json(self) -> dict:
+        """
+        :return: the json schema of the field that is shared with the schema of the parser (cached on the parser
+        until it is invalidated), it must not be changed
+        """
+        schema_cache = self._fim_parser._schema_cache
+        if self.id not in schema_cache:
+            schema_cache[self.id] = self._build_json()
+        return schema_cache[self.id]
 
-            return schema
+    def _compile_template(self) -> Optional[Tuple[Tuple[str, Any], ...]]:
+        """
+        :return: the json schema of the field as immutable (key, value) pairs, the enum of select fields is
+        a placeholder that is filled in with the codelist (None if the data type of an input field is unknown)
+        """
+        title = self.input_name if self.input_name else self.name
+        description = (("description", self._input_hint),) if self._input_hint else ()
+
+        if self._field_type == FieldType.INPUT:
+            data_type_schema = DATA_TYPE_SCHEMAS.get(self._data_type)
+            if data_type_schema is None:
+                return None
+            default = (("default", self._default_value),) if self._default_value else ()
+            return tuple(data_type_schema.items()) + (("title", title),) + description + default + \
+                self._validation.json_schema()
+        elif self._field_type == FieldType.SELECT:
+            return (("title", title), ("type", "string"), ("enum", None)) + description
+        elif self._field_type == FieldType.LABEL:
+            return ("title", title), ("description", self._default_value), ("type", "string"), ("x-display", "label")
+        return (("title", title), ("type", "string")) + description
+
+    def _build_json(self):
+        if self._template is None:
+            # the data type may have been registered after the field was parsed
+            self._template = self._compile_template()
+            if self._template is None:
+                raise FIMParserError(f"unknown data type {self._data_type} of field {self.id}, "
+                                     f"see register_data_type")
+
+        schema = dict(self._template)
+        if self._field_type == FieldType.SELECT:
+            fim_code_list = self._fim_parser.code_list(self._reference_value_uri,
+                                                       self._fim_parser.pinned_code_list_version(self))
+            schema["enum"] = [choice[1] for choice in fim_code_list.dataset]
+        return schema
 
     def __str__(self):
         return f'FIMField[name = {self.name}, field_type = {self.field_type}, data_type = {self.data_type}, reference_value_uri = {self._reference_value_uri}]'
 
 
 class FIMFieldGroup(FIMElement, FIMHeaderMixin):
-    def _parse(self):
-        self._parse_header(self._definition)
+    __slots__ = FIMHeaderMixin.HEADER_SLOTS + ("_fields", "_structure_definitions")
+
+    def _parse(self, definition):
+        self._parse_header(definition)
 
-        self._fields = []
-        for element in self._definition.xdf_struktur:
-            self._fields.append(FIMStructure(element, self))
+        # lazy groups only parse their header, the structures are parsed on first access
+        self._fields = None
+        self._structure_definitions = definition.xdf_struktur
+        if not self._fim_parser.lazy:
+            self._expand()
+
+    def _expand(self):
+        self._fields = [FIMStructure(element, self._fim_parser) for element in self._structure_definitions]
+        self._structure_definitions = None
+
+    @property
+    def is_expanded(self) -> bool:
+        """False as long as the structures of a lazy group were not parsed"""
+        return self._fields is not None
 
     @property
     def fields(self):
         """:returns a list of FIMFields/FIMFieldGroups"""
+        if self._fields is None:
+            self._expand()
         return self._fields
 
     ELEMENT_TYPE = "field_group"
 
     def to_json(self, defs, level=None):
         """
-        :return: a json-schema object
+        :param defs: the $defs collected so far, the defs of all elements of the group are added to it
+        :return: a json-schema object and the defs (copies, changing them does not affect the parser)
+        """
+        base, subtree_defs = self._cached_json({})
+        for element_id, schema in subtree_defs.items():
+            if element_id not in defs:
+                defs[element_id] = copy.deepcopy(schema)
+        return copy.deepcopy(base), defs
+
+    def _cached_json(self, defs):
+        """
+        :return: the json-schema object of the group and the defs that are shared with the schema of the parser
+        (cached on the parser until it is invalidated), they must not be changed
+        """
+        schema_cache = self._fim_parser._schema_cache
+        if self.id not in schema_cache:
+            schema_cache[self.id] = self._build_json()
+
+        # add the defs of the whole subtree (which were collected while building the cached schema)
+        base, subtree_defs = schema_cache[self.id]
+        for element_id, schema in subtree_defs.items():
+            if element_id not in defs:
+                defs[element_id] = schema
+
+        return base, defs
+
+    def _build_json(self):
+        """
+        :return: the json-schema object of the group and the defs of all elements it contains
         """
         base = {
             "title": self.name,
@@ -379,13 +639,13 @@ class FIMFieldGroup(FIMElement, FIMHeaderMixin):
         }
 
         required = []
+        subtree_defs = {}
 
         if self.description:
             base["description"] = self.description
 
-        last_element = None
         for fim_structure in self.fields:
-            base["properties"][fim_structure.contains.id], defs = fim_structure.to_json(defs)
+            base["properties"][fim_structure.contains.id], subtree_defs = fim_structure.to_json(subtree_defs)
 
             if fim_structure.is_required:
                 required.append(fim_structure.contains.id)
@@ -393,13 +653,29 @@ class FIMFieldGroup(FIMElement, FIMHeaderMixin):
         if len(required) > 0:
             base["required"] = required
 
-        return base, defs
+        return base, subtree_defs
 
     def __str__(self):
         newline = '\n'
         return f'FIMGroup[name = {self.name}, fields = [\n- {(newline+"- ").join([str(e) for e in self.fields])}\n]]'
 
 
+def iter_fields(elements: List):
+    """
+    :param elements: FIMStructures/FIMFieldGroups/FIMFields
+    :return: a generator over all FIMFields of the elements (depth first)
+    """
+    stack = list(reversed(elements))
+    while stack:
+        element = stack.pop()
+        if isinstance(element, FIMStructure):
+            stack.append(element.contains)
+        elif isinstance(element, FIMFieldGroup):
+            stack.extend(reversed(element.fields))
+        else:
+            yield element
+
+
 class FIMParser(FIMHeaderMixin):
     FIM_VERSION_1 = "urn:xoev-de:fim:standard:xdatenfelder_1"
     FIM_VERSION_2 = "urn:xoev-de:fim:standard:xdatenfelder_2"
@@ -409,31 +685,178 @@ class FIMParser(FIMHeaderMixin):
         "urn:xoev-de:fim:standard:xdatenfelder_2": FIM_VERSION_2,
     }
 
-    def __init__(self, fim_xml: str, override_version_check: str = None, no_parsing: bool = False):
+    # parse the whole document with untangle first and build the model from the untangle tree
+    BACKEND_UNTANGLE = "untangle"
+    # build the model while parsing the document with iterparse (lxml if installed), freeing each parsed structure
+    BACKEND_STREAMING = "streaming"
+
+    BACKENDS = [BACKEND_UNTANGLE, BACKEND_STREAMING]
+
+    def __init__(self, fim_xml: str, override_version_check: str = None, no_parsing: bool = False,
+                 code_list_cache: CodeListCache = None, max_workers: int = DEFAULT_MAX_WORKERS,
+                 backend: str = BACKEND_UNTANGLE, keep_xml: bool = False, code_list_lock: CodeListLock = None,
+                 pin_code_lists: bool = False, lazy: bool = False, instrumentation: Instrumentation = None,
+                 catalogue: "ElementCatalogue" = None):
         """
         init a new FIMParser
         :param fim_xml: xml of the fim file you want to parse as a string, a url or a filename
         :param override_version_check: override the fim version manually (see SUPPORTED_FIM_VERSIONS for options)
         :param no_parsing: used for tests
+        :param code_list_cache: the CodeListCache used to resolve codelists (defaults to the global cache)
+        :param max_workers: max number of concurrent requests to xrepository while prefetching codelists
+        :param backend: the xml backend used for parsing (see BACKENDS for options)
+        :param keep_xml: keep the parsed xml (parsed_xml) after parsing, by default it is dropped to save memory
+        :param code_list_lock: pinned codelist versions, they take precedence over the versions in the document
+        :param pin_code_lists: use the codelist versions referenced in the document instead of the latest ones
+        :param lazy: only parse the headers of field groups, their structures are parsed on first access (the xml
+        of unparsed groups is kept until then). use it with section_json to render large forms page by page
+        :param instrumentation: collects timings and counters of parsing and json generation (see stats)
+        :param catalogue: an ElementCatalogue, versioned fields and field groups that are part of it are taken
+        from the catalogue instead of being parsed
         """
+        self._init_state(fim_xml, backend, code_list_cache, max_workers, keep_xml, code_list_lock, pin_code_lists,
+                         lazy, instrumentation, catalogue)
+
+        with self._instrumentation.span("parse", backend=backend):
+            if backend == self.BACKEND_STREAMING:
+                # xml parsing and model building are interleaved
+                with self._instrumentation.span("stream"):
+                    self._stream(override_version_check=override_version_check, build_model=not no_parsing)
+                if not no_parsing:
+                    self._parse_root_header()
+            else:
+                with self._instrumentation.span("xml"):
+                    self._parsed_xml = parse_xml(fim_xml)
+                self._init_version(override_version_check)
+
+                if not no_parsing:
+                    self._parse_root_header()
+                    self._parse_structure()
+
+        if not no_parsing and not keep_xml:
+            self._parsed_xml = None
+        if self._instrumentation.enabled:
+            self._count_elements()
+
+    def _init_state(self, fim_xml: str, backend: str, code_list_cache: CodeListCache, max_workers: int,
+                    keep_xml: bool, code_list_lock: CodeListLock = None, pin_code_lists: bool = False,
+                    lazy: bool = False, instrumentation: Instrumentation = None,
+                    catalogue: "ElementCatalogue" = None):
+        if backend not in self.BACKENDS:
+            raise FIMParserError(f"unknown backend {backend}")
+
         self._xml = fim_xml
-        self._parsed_xml = untangle.parse(fim_xml)
+        self._backend = backend
+        self._code_list_cache = code_list_cache
+        self._max_workers = max_workers
+        self._code_lists = {}
+        self._json = None
+        self._json_bytes = None
+        self._schema_cache = {}
+        self._elements = {}
+        # documents without a stammdatenschema (and catalogue elements) have no metadata
+        self._metadata = dict.fromkeys(self.METADATA_ELEMENTS)
+        self._keep_xml = keep_xml
+        self._code_list_lock = code_list_lock
+        self._pin_code_lists = pin_code_lists
+        self._lazy = lazy
+        self._instrumentation = instrumentation if instrumentation is not None else NULL_INSTRUMENTATION
+        self._catalogue = catalogue
+
+    @staticmethod
+    def identification(definition, version: str):
+        """
+        reads the id and version of a field, field group or schema definition without parsing it
+        :param definition: the xml definition of the element
+        :param version: the fim version of the document
+        :return: a tuple of id and version (None if the element is not versioned)
+        """
+        if version == FIMParser.FIM_VERSION_2:
+            identification = definition.xdf_identifikation
+        else:
+            identification = definition
+
+        element_version = None
+        if len(identification.get_elements("xdf_version")) > 0:
+            element_version = identification.xdf_version.cdata or None
+        return identification.xdf_id.cdata, element_version
+
+    def intern(self, element_class, definition):
+        """
+        every distinct field/field group (by id and version) is only parsed once and then shared by all
+        structures containing it
+        :param element_class: FIMField or FIMFieldGroup
+        :param definition: the xml definition of the element
+        :return: the (shared) instance of the element
+        """
+        key = self.identification(definition, self._version)
+        element = self.resolve_element(key)
+        if not isinstance(element, element_class):
+            element = element_class(definition, self)
+            self._elements[key] = element
+        return element
+
+    def resolve_element(self, key):
+        """
+        :param key: id and version of a field/field group
+        :return: the element if it was already parsed or is part of the catalogue, None otherwise
+        """
+        element = self._elements.get(key)
+        if element is None and self._catalogue is not None and key[1] is not None:
+            element = self._catalogue.load_element(key, self)
+            if element is not None:
+                self._instrumentation.count("catalogue_elements")
+                self._elements[key] = element
+        return element
+
+    @classmethod
+    def from_catalogue(cls, catalogue: "ElementCatalogue", element_id: str, version: str = None,
+                       code_list_cache: CodeListCache = None, **kwargs) -> "FIMParser":
+        """
+        creates a parser for a single field/field group of a catalogue (without any xml), like a xDatenfelder
+        document containing only this element
+        :param catalogue: the ElementCatalogue
+        :param element_id: the id of the element
+        :param version: the version of the element (defaults to the latest indexed version)
+        :param code_list_cache: the CodeListCache used to resolve codelists (defaults to the global cache)
+        :param kwargs: further options of FIMParser (e.g. code_list_lock)
+        :raises: FIMParserError if the element is not part of the catalogue
+        """
+        entry = catalogue.get(element_id, version)
+        if entry is None:
+            raise FIMParserError(f"{element_id} {version or ''} is not part of the catalogue")
+
+        parser = cls.__new__(cls)
+        parser._init_state(None, cls.BACKEND_UNTANGLE, code_list_cache, kwargs.pop("max_workers", DEFAULT_MAX_WORKERS),
+                           False, catalogue=catalogue, **kwargs)
+        parser._version = entry.fim_version
+        parser._parsed_xml = None
+        element = parser.resolve_element((entry.id, entry.version))
+        parser._form = [element]
+        for attribute in FIMHeaderMixin.HEADER_SLOTS:
+            setattr(parser, attribute, getattr(element, attribute))
+        return parser
+
+    def _init_version(self, override_version_check: str = None):
         if not override_version_check:
             self._check_fim_version()
         else:
             self._version = override_version_check
 
-        if not no_parsing:
-            if len(self.parsed_xml.children[0].get_elements("xdf_stammdatenschema")) > 0:
-                self._parse_header(self._parsed_xml.children[0].xdf_stammdatenschema)
-            else:
-                self._name = "Data Fields"
-                self._description = None
-                self._input_name = None
-                self._internal_definition = None
-                self._relation = None
-
-            self._parse_structure()
+    def _parse_root_header(self):
+        if len(self.parsed_xml.children[0].get_elements("xdf_stammdatenschema")) > 0:
+            self._parse_header(self._parsed_xml.children[0].xdf_stammdatenschema)
+            self._metadata = self.parse_metadata(self._parsed_xml.children[0].xdf_stammdatenschema)
+        else:
+            self._metadata = dict.fromkeys(self.METADATA_ELEMENTS)
+            self._id = None
+            self._element_version = None
+            self._name = "Data Fields"
+            self._output_name = None
+            self._description = None
+            self._input_name = None
+            self._internal_definition = None
+            self._relation = None
 
     def _check_fim_version(self):
         """
@@ -444,28 +867,362 @@ class FIMParser(FIMHeaderMixin):
             raise FIMParserError("FIM File is in an unsupported version")
         self._version = self.FIM_VERSION_MAPPING[self.parsed_xml.children[0].get_attribute("xmlns:xdf")]
 
+    def _stream(self, override_version_check: str = None, check_version: bool = True, build_model: bool = True):
+        """
+        parses the xml in one streaming pass, every top level structure is added to the form as soon as it is
+        complete and removed from the parsed xml afterwards
+        """
+        self._streaming_parser(override_version_check, check_version, build_model).parse(self._xml)
+
+    def _streaming_parser(self, override_version_check: str = None, check_version: bool = True,
+                          build_model: bool = True, on_element=None) -> streaming.StreamingParser:
+        """
+        :param on_element: called with every top level element of the form as soon as it is parsed
+        :return: a StreamingParser building the model of this parser from the xml fed to it
+        """
+        document = streaming.StreamingElement(None)
+
+        def start(element, parent):
+            if parent is document and check_version:
+                self._init_version(override_version_check)
+
+        def end(element, parent):
+            if not build_model:
+                return True
+            if element._name == "xdf_struktur" and parent._name == "xdf_stammdatenschema":
+                self._form.append(FIMStructure(element, self))
+            elif element._name == "xdf_datenfeldgruppe" and parent is document.children[0]:
+                self._form.append(self.intern(FIMFieldGroup, element))
+            else:
+                return True
+
+            if on_element is not None:
+                on_element(self._form[-1])
+            return False
+
+        self._form = []
+        self._elements = {}
+        self._parsed_xml = document
+        return streaming.StreamingParser(document, start, end)
+
     def _parse_structure(self):
         """
         parse the form structure itself
         :return:
         """
-        self._form = []
-        if len(self.parsed_xml.children[0].get_elements("xdf_stammdatenschema")) > 0:
-            for element in self.parsed_xml.children[0].xdf_stammdatenschema.xdf_struktur:
-                self.form.append(FIMStructure(element, self))
+        self.invalidate()
+
+        if self._backend == self.BACKEND_STREAMING:
+            # the structures are not kept in the parsed xml, so the document has to be streamed again
+            with self._instrumentation.span("stream"):
+                self._stream(check_version=False)
+            return
+
+        if self._parsed_xml is not None:
+            parsed_xml = self._parsed_xml
         else:
-            self.form.append(FIMFieldGroup(self.parsed_xml.children[0].xdf_datenfeldgruppe, self))
+            with self._instrumentation.span("xml"):
+                parsed_xml = parse_xml(self._xml)
+
+        with self._instrumentation.span("model"):
+            self._form = []
+            self._elements = {}
+            if len(parsed_xml.children[0].get_elements("xdf_stammdatenschema")) > 0:
+                for element in parsed_xml.children[0].xdf_stammdatenschema.xdf_struktur:
+                    self.form.append(FIMStructure(element, self))
+            else:
+                self.form.append(self.intern(FIMFieldGroup, parsed_xml.children[0].xdf_datenfeldgruppe))
+
+    def _count_elements(self):
+        # distinct parsed elements (lazy groups that were not expanded yet do not count their children)
+        fields = sum(1 for element in self._elements.values() if isinstance(element, FIMField))
+        self._instrumentation.count("structures", len(self._form))
+        self._instrumentation.count("fields", fields)
+        self._instrumentation.count("field_groups", len(self._elements) - fields)
+
+    def iter_fields(self):
+        """
+        :return: a generator over all FIMFields of the form (depth first)
+        """
+        return iter_fields(self.form)
+
+    @property
+    def code_list_urns(self) -> List[str]:
+        """
+        :return: the urns of all codelists referenced anywhere in the form
+        """
+        return self._code_list_urns(self.iter_fields())
+
+    @staticmethod
+    def _code_list_urns(fields) -> List[str]:
+        urns = []
+        for field in fields:
+            if field.reference_value_uri and field.reference_value_uri not in urns:
+                urns.append(field.reference_value_uri)
+        return urns
+
+    @property
+    def code_list_versions(self) -> dict:
+        """
+        :return: the pinned version of every codelist referenced in the form by urn (None if it is not pinned)
+        """
+        return self._code_list_versions(self.iter_fields())
+
+    def _code_list_versions(self, fields) -> dict:
+        versions = {}
+        for field in fields:
+            if field.reference_value_uri and versions.get(field.reference_value_uri) is None:
+                versions[field.reference_value_uri] = self.pinned_code_list_version(field)
+        return versions
+
+    def pinned_code_list_version(self, field) -> str:
+        """
+        :return: the version of the field's codelist from the lock, the document (if pin_code_lists is set) or None
+        if the latest version is used
+        """
+        if self._code_list_lock is not None and field.reference_value_uri in self._code_list_lock:
+            return self._code_list_lock.get(field.reference_value_uri)
+        return field.reference_value_version if self._pin_code_lists else None
+
+    def lock_code_lists(self) -> CodeListLock:
+        """
+        :return: a lock pinning every codelist of the form to the version that is currently used
+        """
+        self.prefetch_code_lists()
+        return CodeListLock.from_code_lists(self._code_lists)
+
+    def prefetch_code_lists(self, elements: List = None):
+        """
+        resolves all codelists referenced in the form concurrently (at most max_workers requests at once)
+        so that to_json does not need to wait for xrepository field by field
+        :param elements: only resolve the codelists of these fields/field groups/structures (defaults to the form)
+        """
+        fields = list(iter_fields(elements if elements is not None else self.form))
+        missing = [urn for urn in self._code_list_urns(fields) if urn not in self._code_lists]
+        if not missing:
+            return
+
+        instrumentation = self._instrumentation
+        cache = self._code_list_cache if self._code_list_cache is not None else get_default_cache()
+        cache_stats = cache.stats if instrumentation.enabled else None
+
+        with instrumentation.span("code_lists", count=len(missing)):
+            self._code_lists.update(prefetch_code_lists(missing, cache=cache, max_workers=self._max_workers,
+                                                        versions=self._code_list_versions(fields),
+                                                        instrumentation=instrumentation))
+
+        if cache_stats is not None:
+            # the deltas include concurrent requests of other users of the same cache
+            for name, value in cache.stats.items():
+                instrumentation.count(f"code_list_{name}", value - cache_stats[name])
+
+    def code_list(self, urn: str, version: str = None) -> FimCodeList:
+        """
+        :param urn: the urn of the codelist
+        :param version: the pinned version, used if the codelist was not prefetched
+        :return: the (prefetched) FimCodeList for the urn
+        """
+        if urn not in self._code_lists:
+            with self._instrumentation.span("code_list", urn=urn):
+                self._code_lists[urn] = FimCodeList(urn, cache=self._code_list_cache, version=version)
+        return self._code_lists[urn]
+
+    def find_group(self, group_id: str) -> "FIMFieldGroup":
+        """
+        :param group_id: the id of a field group anywhere in the form
+        :return: the field group or None if it is not part of the form. lazy groups are only expanded as far as
+        needed to find the group
+        """
+        for (element_id, _), element in self._elements.items():
+            if element_id == group_id and isinstance(element, FIMFieldGroup):
+                return element
+
+        queue = deque(self.form)
+        while queue:
+            element = queue.popleft()
+            if isinstance(element, FIMStructure):
+                element = element.contains
+            if isinstance(element, FIMFieldGroup):
+                if element.id == group_id:
+                    return element
+                queue.extend(element.fields)
+        return None
+
+    def section_json(self, group_id: str) -> dict:
+        """
+        generates the json schema of a single field group, e.g. to render a large form page by page. only the
+        group itself and the codelists it uses are parsed/resolved (with lazy=True)
+        :param group_id: the id of the field group
+        :return: the json schema of the group with the $defs it references
+        :raises: FIMParserError if the group is not part of the form
+        """
+        group = self.find_group(group_id)
+        if group is None:
+            raise FIMParserError(f"field group {group_id} is not part of the form")
+
+        self.prefetch_code_lists([group])
+        schema, defs = group.to_json({})
+        return {
+            "$schema": "https://json-schema.org/draft/2020-12/schema",
+            **schema,
+            "$defs": defs,
+        }
+
+    def invalidate(self, element_id: str = None):
+        """
+        drops cached json schemas, call this after changing the model
+        :param element_id: id of the changed field/field group, only the schema of this element and the groups
+        containing it are regenerated (None drops all cached schemas)
+        """
+        self._json = None
+        self._json_bytes = None
+        if element_id is None:
+            self._schema_cache.clear()
+            changed = self._elements.values()
+        else:
+            for invalid_id in [element_id] + self._containing_group_ids(element_id):
+                self._schema_cache.pop(invalid_id, None)
+            changed = [element for (key, _), element in self._elements.items() if key == element_id]
+
+        for element in changed:
+            if isinstance(element, FIMField):
+                element.compile()
+
+    def _containing_group_ids(self, element_id: str) -> List[str]:
+        """
+        :return: the ids of all field groups the element is (directly or indirectly) part of
+        """
+        group_ids = set()
+
+        def walk(element, path):
+            if isinstance(element, FIMStructure):
+                return walk(element.contains, path)
+            if element.id == element_id:
+                group_ids.update(path)
+            if isinstance(element, FIMFieldGroup):
+                for structure in element.fields:
+                    walk(structure, path + [element.id])
+
+        for element in self.form:
+            walk(element, [])
+        return list(group_ids)
+
+    # increased whenever the pickled model changes incompatibly
+    MODEL_FORMAT_VERSION = 5
+
+    # attributes that are not part of a dumped model: the parsed xml and everything that is derived on demand
+    _TRANSIENT_STATE = {
+        "_parsed_xml": None,
+        "_code_list_cache": None,
+        "_json": None,
+        "_json_bytes": None,
+        "_instrumentation": NULL_INSTRUMENTATION,
+        "_catalogue": None,
+    }
+
+    def __getstate__(self):
+        # lazy groups keep their xml until they are expanded, so everything is parsed before dumping
+        for _ in self.iter_fields():
+            pass
+        state = {key: value for key, value in self.__dict__.items() if key not in self._TRANSIENT_STATE}
+        state["_schema_cache"] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(self._TRANSIENT_STATE)
+        self.__dict__.update(state)
+
+    def dumps(self) -> bytes:
+        """
+        :return: the parsed model (header, structures and resolved codelists) as bytes (pickle protocol 5)
+        """
+        return pickle.dumps((self.MODEL_FORMAT_VERSION, self), protocol=5)
+
+    @classmethod
+    def loads(cls, data, code_list_cache: CodeListCache = None) -> "FIMParser":
+        """
+        restores a model created with dumps() without parsing any xml. only load data you trust (pickle)!
+        :param data: bytes or any other buffer (e.g. a mmap)
+        :param code_list_cache: the CodeListCache used to resolve codelists (defaults to the global cache)
+        :raises: FIMParserError if the data was created by an incompatible version
+        """
+        format_version, parser = pickle.loads(data)
+        if format_version != cls.MODEL_FORMAT_VERSION or not isinstance(parser, cls):
+            raise FIMParserError("the model was dumped by an incompatible version")
+        parser._code_list_cache = code_list_cache
+        return parser
+
+    def dump(self, path: str):
+        """
+        writes the parsed model to a file, see dumps()
+        :param path: the file the model is written to
+        """
+        with open(path, "wb") as fh:
+            fh.write(self.dumps())
+
+    @classmethod
+    def load(cls, path: str, code_list_cache: CodeListCache = None) -> "FIMParser":
+        """
+        loads a model written by dump() using mmap. only load files you trust (pickle)!
+        :param path: the file the model was written to
+        :param code_list_cache: the CodeListCache used to resolve codelists (defaults to the global cache)
+        """
+        with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return cls.loads(data, code_list_cache=code_list_cache)
 
     @property
     def xml(self) -> str:
         """get the xml provided as string"""
         return self._xml
 
+    @property
+    def stats(self) -> Stats:
+        """
+        timings (parse, xml, model or stream, code_lists, code_list, json) and counters of this parser, None if
+        it was created without instrumentation
+        """
+        return self._instrumentation.stats
+
+    @property
+    def lazy(self) -> bool:
+        """True if field groups are only parsed on first access"""
+        return self._lazy
+
+    @property
+    def backend(self) -> str:
+        """the xml backend used for parsing (see BACKENDS)"""
+        return self._backend
+
+    @property
+    def metadata(self) -> dict:
+        """
+        :return: status, validity and release information of the schema (see METADATA_ELEMENTS)
+        """
+        return dict(self._metadata)
+
+    @property
+    def status(self) -> str:
+        """
+        :return: the status code of the schema (e.g. inVorbereitung, aktiv) or None
+        """
+        return self._metadata["status"]
+
     @property
     def parsed_xml(self):
-        """the provided xml parsed by untangle"""
+        """
+        the provided xml parsed by untangle (or as StreamingElements without the structures when using the
+        streaming backend). None unless the parser was created with keep_xml=True, by default the document is
+        dropped after parsing
+        """
         return self._parsed_xml
 
+    @property
+    def elements(self) -> dict:
+        """
+        :return: all distinct fields and field groups of the form by (id, version)
+        """
+        return self._elements
+
     @property
     def legal_definition(self) -> str:
         """
@@ -482,6 +1239,74 @@ class FIMParser(FIMHeaderMixin):
 
     @property
     def to_json(self, level=None):
+        """
+        :return: the json schema of the form, it is generated once and cached until invalidate() is called. the
+        same dict is returned on every call and it is shared with to_json_bytes() and etag, treat it as read-only
+        (copy.deepcopy it before changing it)
+        """
+        if self._json is None:
+            self.prefetch_code_lists()
+            with self._instrumentation.span("json"):
+                self._json = self._build_json()
+        return self._json
+
+    def to_json_bytes(self) -> bytes:
+        """
+        :return: the json schema encoded as compact utf-8 json (using orjson if it is installed), the bytes are
+        cached together with their etag until invalidate() is called
+        """
+        if self._json_bytes is None:
+            schema = self.to_json
+            with self._instrumentation.span("encode"):
+                data = emitter.dumps(schema)
+            self._json_bytes = (data, emitter.etag(data))
+        return self._json_bytes[0]
+
+    @property
+    def etag(self) -> str:
+        """
+        :return: the http etag of to_json_bytes(), it only changes if the generated schema changes
+        """
+        self.to_json_bytes()
+        return self._json_bytes[1]
+
+    def iter_json_bytes(self, chunk_size: int = emitter.DEFAULT_CHUNK_SIZE):
+        """
+        encodes the json schema chunk by chunk (e.g. for a streamed http response of a very large form) without
+        holding the whole encoded schema in memory. the cached bytes are used if to_json_bytes() was called before
+        :param chunk_size: minimum size of the chunks
+        :return: a generator over the chunks, joined they are the same bytes as to_json_bytes()
+        """
+        if self._json_bytes is not None:
+            data = self._json_bytes[0]
+            for offset in range(0, len(data), chunk_size):
+                yield data[offset:offset + chunk_size]
+            return
+        yield from emitter.iter_chunks(self.to_json, chunk_size)
+
+    def write_json(self, fh, chunk_size: int = emitter.DEFAULT_CHUNK_SIZE) -> int:
+        """
+        writes the json schema to a binary file object, see iter_json_bytes()
+        :return: the number of bytes written
+        """
+        written = 0
+        for chunk in self.iter_json_bytes(chunk_size):
+            fh.write(chunk)
+            written += len(chunk)
+        return written
+
+    def _build_properties(self):
+        """
+        :return: the json schemas of all top level elements and the $defs they reference
+        """
+        properties, defs = [], {}
+        for fim_structure in self.form:
+            schema, defs = fim_structure.to_json(defs)
+            properties.append(schema)
+        return properties, defs
+
+    def _build_json(self):
+
         # create json schema skeleton
         json_schema = {
             "$schema": "https://json-schema.org/draft/2020-12/schema",
@@ -493,14 +1318,14 @@ class FIMParser(FIMHeaderMixin):
         }
 
         # definitions
-        defs = {}
+        properties, defs = self._build_properties()
 
         # required attributes
         required = []
 
         # add root properties and update fill definitions
-        for fim_structure in self.form:
-            json_schema["properties"][fim_structure.id], defs = fim_structure.to_json(defs)
+        for fim_structure, schema in zip(self.form, properties):
+            json_schema["properties"][fim_structure.id] = schema
 
             # if the root property is a FIMFieldGroup, then the whole object is a xdatenfelder.datenfeldgruppe
             if isinstance(fim_structure, FIMFieldGroup):
@@ -0,0 +1,232 @@
+import base64
+import io
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+from urllib.parse import unquote
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+
+from .fim_code_lists import get_session
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - httpx is only needed for the async api
+    httpx = None
+
+
+class CassetteError(requests.ConnectionError):
+    """raised if a request is not part of a cassette that is replayed"""
+
+
+class Cassette(object):
+    """
+    recorded http responses (of xrepository and xDatenfelder documents) in a json file, so tests and benchmarks
+    can run without network access. requests are matched by method and url
+    """
+
+    # replay only, requests that were not recorded fail with CassetteError
+    REPLAY = "replay"
+    # send every request and record the response
+    RECORD = "record"
+    # replay recorded requests and record all others
+    ONCE = "once"
+
+    MODES = [REPLAY, RECORD, ONCE]
+
+    # increased whenever the file format changes incompatibly
+    FORMAT_VERSION = 1
+
+    def __init__(self, path: str, mode: str = ONCE):
+        """
+        :param path: the json file of the cassette (is created when recording)
+        :param mode: see MODES
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"unknown cassette mode {mode}")
+        self._path = path
+        self._mode = mode
+        self._lock = threading.Lock()
+        self._interactions = {}
+        self._changed = False
+        if mode != self.RECORD and os.path.exists(path):
+            self._load()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    @staticmethod
+    def _key(method: str, url: str) -> Tuple[str, str]:
+        # requests and httpx quote urns in urls differently
+        return method.upper(), unquote(url)
+
+    def find(self, method: str, url: str) -> Optional[Tuple[int, str, bytes]]:
+        """
+        :return: the recorded status, content type and body or None if the request was not recorded (or the
+        cassette is recording every request)
+        """
+        if self._mode == self.RECORD:
+            return None
+        with self._lock:
+            return self._interactions.get(self._key(method, url))
+
+    def can_record(self) -> bool:
+        return self._mode != self.REPLAY
+
+    def record(self, method: str, url: str, status: int, content_type: str, body: bytes):
+        with self._lock:
+            self._interactions[self._key(method, url)] = (status, content_type, body)
+            self._changed = True
+
+    def __len__(self):
+        return len(self._interactions)
+
+    def _load(self):
+        with open(self._path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+        if data.get("format") != self.FORMAT_VERSION:
+            raise ValueError(f"{self._path} is not a cassette of format {self.FORMAT_VERSION}")
+        for item in data["interactions"]:
+            if "body" in item:
+                body = item["body"].encode("utf-8")
+            else:
+                body = base64.b64decode(item["body_base64"])
+            self._interactions[(item["method"], item["url"])] = (item["status"], item["content_type"], body)
+
+    def save(self):
+        """writes the cassette if anything was recorded"""
+        with self._lock:
+            if not self._changed:
+                return
+            interactions = []
+            for (method, url), (status, content_type, body) in sorted(self._interactions.items()):
+                item = {"method": method, "url": url, "status": status, "content_type": content_type}
+                try:
+                    item["body"] = body.decode("utf-8")
+                except UnicodeDecodeError:
+                    item["body_base64"] = base64.b64encode(body).decode("ascii")
+                interactions.append(item)
+            self._changed = False
+
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self._path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump({"format": self.FORMAT_VERSION, "interactions": interactions}, fh, ensure_ascii=False,
+                      indent=1)
+        os.replace(tmp_path, self._path)
+
+    def async_client(self, **kwargs) -> "httpx.AsyncClient":
+        """
+        :param kwargs: further options of httpx.AsyncClient
+        :return: an async http client recording/replaying with this cassette (pass it as client to the async api)
+        """
+        if httpx is None:
+            raise ImportError("the async api requires httpx (pip install ozg[async])")
+        return httpx.AsyncClient(transport=AsyncCassetteTransport(self), **kwargs)
+
+    def __repr__(self):
+        return f"Cassette({os.path.basename(self._path)}, {self._mode}, {len(self)} interactions)"
+
+
+class CassetteAdapter(HTTPAdapter):
+    """
+    requests transport adapter answering requests from a Cassette (and recording the ones it does not know)
+    """
+
+    def __init__(self, cassette: Cassette, **kwargs):
+        super().__init__(**kwargs)
+        self._cassette = cassette
+
+    def send(self, request, **kwargs):
+        interaction = self._cassette.find(request.method, request.url)
+        if interaction is None:
+            if not self._cassette.can_record():
+                raise CassetteError(f"{request.method} {request.url} is not part of {self._cassette.path}",
+                                    request=request)
+            response = super().send(request, **kwargs)
+            interaction = (response.status_code, response.headers.get("Content-Type", ""), response.content)
+            self._cassette.record(request.method, request.url, *interaction)
+
+        # every response is built from the recorded body, so streamed responses (open_url) work the same way
+        status, content_type, body = interaction
+        raw = HTTPResponse(body=io.BytesIO(body), headers={"Content-Type": content_type}, status=status,
+                           preload_content=False, decode_content=False, request_method=request.method)
+        return self.build_response(request, raw)
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport if httpx is not None else object):
+    """
+    httpx transport answering requests from a Cassette (and recording the ones it does not know)
+    """
+
+    def __init__(self, cassette: Cassette, transport: "httpx.AsyncBaseTransport" = None):
+        """
+        :param transport: the transport used to record requests (defaults to httpx.AsyncHTTPTransport)
+        """
+        self._cassette = cassette
+        self._transport = transport
+
+    async def handle_async_request(self, request):
+        url = str(request.url)
+        interaction = self._cassette.find(request.method, url)
+        if interaction is None:
+            if not self._cassette.can_record():
+                raise httpx.ConnectError(f"{request.method} {url} is not part of {self._cassette.path}",
+                                         request=request)
+            if self._transport is None:
+                self._transport = httpx.AsyncHTTPTransport()
+            response = await self._transport.handle_async_request(request)
+            body = await response.aread()
+            await response.aclose()
+            interaction = (response.status_code, response.headers.get("Content-Type", ""), body)
+            self._cassette.record(request.method, url, *interaction)
+
+        status, content_type, body = interaction
+        return httpx.Response(status, headers={"Content-Type": content_type}, content=body, request=request)
+
+    async def aclose(self):
+        if self._transport is not None:
+            await self._transport.aclose()
+
+
+@contextmanager
+def use_cassette(path: str, mode: str = Cassette.ONCE, session: requests.Session = None):
+    """
+    routes all requests of the shared http session (codelists and xDatenfelder urls) through a cassette, e.g.
+
+        with use_cassette("tests/fixtures/cassettes/code_lists.json"):
+            FIMParser(url).to_json
+
+    recorded requests are saved when the block is left
+    :param path: the json file of the cassette
+    :param mode: see Cassette.MODES
+    :param session: the requests session (defaults to fim_code_lists.get_session())
+    :return: the Cassette
+    """
+    cassette = Cassette(path, mode)
+    session = session if session is not None else get_session()
+    adapter = CassetteAdapter(cassette)
+    previous: Dict[str, HTTPAdapter] = {}
+    for prefix in ["http://", "https://"]:
+        previous[prefix] = session.adapters.get(prefix)
+        session.mount(prefix, adapter)
+    try:
+        yield cassette
+    finally:
+        for prefix, previous_adapter in previous.items():
+            if previous_adapter is not None:
+                session.mount(prefix, previous_adapter)
+            else:
+                session.adapters.pop(prefix, None)
+        cassette.save()
@@ -0,0 +1,164 @@
+import mmap
+from multiprocessing import Pool
+from typing import Iterator, List
+
+from . import streaming
+from .parser import FIMHeaderMixin, FIMParser, FIMParserError
+
+# the header of a stammdatenschema is a few kilobytes, so only the first chunk of a file is parsed in most cases
+SCAN_CHUNK_SIZE = 16 * 1024
+
+# the header elements of the documents, a field group document is described by its field group
+_HEADER_ELEMENTS = ["xdf_stammdatenschema", "xdf_datenfeldgruppe"]
+
+
+class _HeaderComplete(Exception):
+    pass
+
+
+class SchemaHeader(FIMHeaderMixin):
+    def __init__(self, element, fim_version: str, path: str = None):
+        """
+        the header metadata of a xDatenfelder document (see scan_header)
+        :param element: the xml element of the header (xdf:stammdatenschema or xdf:datenfeldgruppe)
+        :param fim_version: the fim version of the document
+        :param path: the scanned file
+        """
+        self._version = fim_version
+        self.path = path
+        self.element_type = element._name[len("xdf_"):]
+        self._parse_header(element)
+        self._metadata = self.parse_metadata(element)
+
+    @property
+    def fim_version(self) -> str:
+        return self._version
+
+    @property
+    def metadata(self) -> dict:
+        """
+        :return: status, validity and release information (see FIMParser.metadata)
+        """
+        return dict(self._metadata)
+
+    @property
+    def status(self) -> str:
+        return self._metadata["status"]
+
+    def to_dict(self) -> dict:
+        return dict({
+            "path": self.path,
+            "type": self.element_type,
+            "fim_version": self.fim_version,
+            "id": self.id,
+            "version": self.element_version,
+            "name": self.name,
+            "input_name": self.input_name,
+            "output_name": self.output_name,
+            "description": self.description,
+            "definition": self.internal_definition,
+            "relation": self.relation,
+        }, **self._metadata)
+
+    def __repr__(self):
+        return f"SchemaHeader({self.id} {self.element_version}: {self.name})"
+
+
+def scan_header(source, path: str = None, chunk_size: int = SCAN_CHUNK_SIZE) -> SchemaHeader:
+    """
+    reads only the header of a xDatenfelder document (id, version, names, status and validity) without parsing its
+    structures, reading stops as soon as the first structure starts
+    :param source: xml as a string, a filename, an url or a file like object (like FIMParser)
+    :param path: the path reported in the header (defaults to source if it is a filename or url)
+    :param chunk_size: number of bytes read at once
+    :raises: FIMParserError if the document is no supported xDatenfelder document
+    """
+    document = streaming.StreamingElement(None)
+
+    def start(element, parent):
+        if element._name == "xdf_struktur":
+            raise _HeaderComplete()
+
+    def end(element, parent):
+        if element._name in _HEADER_ELEMENTS and parent is document.children[0]:
+            raise _HeaderComplete()
+
+    try:
+        streaming.StreamingParser(document, start, end).parse(source, chunk_size=chunk_size)
+    except _HeaderComplete:
+        pass
+    except streaming.ElementTree.ParseError as e:
+        raise FIMParserError(f"invalid xml: {e}")
+
+    if not document.children:
+        raise FIMParserError("the document does not contain any xml element")
+    root = document.children[0]
+    fim_version = FIMParser.FIM_VERSION_MAPPING.get(root.get_attribute("xmlns:xdf"))
+    if fim_version is None:
+        raise FIMParserError("FIM File is in an unsupported version")
+
+    for name in _HEADER_ELEMENTS:
+        elements = root.get_elements(name)
+        if elements:
+            if path is None and isinstance(source, str) and not source.lstrip().startswith("<"):
+                path = source
+            try:
+                return SchemaHeader(elements[0], fim_version, path)
+            except AttributeError as e:
+                raise FIMParserError(f"incomplete header: {e}")
+    raise FIMParserError("the document neither contains a stammdatenschema nor a datenfeldgruppe")
+
+
+def scan_file(path: str, chunk_size: int = SCAN_CHUNK_SIZE) -> SchemaHeader:
+    """
+    scans the header of a file through a memory map, only the pages of the header are read from disk
+    """
+    with open(path, "rb") as fh:
+        try:
+            mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can not be mapped
+            raise FIMParserError(f"{path} is empty")
+        with mapped:
+            return scan_header(mapped, path, chunk_size)
+
+
+class ScanResult(object):
+    def __init__(self, path: str, header: SchemaHeader = None, error: str = None):
+        """
+        the result of scanning a single xDatenfelder file
+        :param header: the scanned header (None if the scan failed)
+        :param error: the error message if the scan failed
+        """
+        self.path = path
+        self.header = header
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _scan(path: str) -> ScanResult:
+    try:
+        return ScanResult(path, header=scan_file(path))
+    except Exception as e:
+        return ScanResult(path, error=f"{type(e).__name__}: {e}")
+
+
+def scan_files(paths: List[str], processes: int = None, chunksize: int = 64) -> Iterator[ScanResult]:
+    """
+    scans the headers of many xDatenfelder files using a process pool, errors are returned instead of raised.
+    results are yielded in the order of paths
+    :param paths: the xDatenfelder files (see convert.find_files)
+    :param processes: number of worker processes (defaults to the number of cpus, 1 scans in this process)
+    :param chunksize: number of files sent to a worker at once
+    """
+    if processes == 1 or len(paths) <= 1:
+        for path in paths:
+            yield _scan(path)
+        return
+
+    with Pool(processes) as pool:
+        for result in pool.imap(_scan, paths, chunksize=chunksize):
+            yield result
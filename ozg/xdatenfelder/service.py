@@ -0,0 +1,406 @@
+import asyncio
+import collections
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from . import emitter
+from .catalogue import _version_key
+from .convert import find_files
+from .fim_code_lists import CodeListCache
+from .instrumentation import Stats
+from .parser import FIMParser
+
+logger = logging.getLogger(__name__)
+
+# number of request latencies the percentiles of the metrics are computed from
+LATENCY_WINDOW = 10000
+
+# max size of the request line and headers of a request
+MAX_HEADER_SIZE = 16 * 1024
+
+_REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+class Response(object):
+    """
+    a precomputed http response, the status line and headers are encoded once together with the body
+    """
+
+    __slots__ = ("status", "etag", "body", "head", "not_modified")
+
+    def __init__(self, body: bytes, etag: str = None, status: int = 200, content_type: str = "application/json",
+                 headers: Dict[str, str] = None):
+        self.status = status
+        self.etag = etag
+        self.body = body
+        lines = [f"HTTP/1.1 {status} {_REASONS[status]}", f"Content-Type: {content_type}",
+                 f"Content-Length: {len(body)}"]
+        if etag is not None:
+            lines += [f"ETag: {etag}", "Cache-Control: no-cache"]
+        lines += [f"{key}: {value}" for key, value in (headers or {}).items()]
+        self.head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+        self.not_modified = f"HTTP/1.1 304 Not Modified\r\nETag: {etag}\r\n\r\n".encode("latin-1") if etag else None
+
+    @classmethod
+    def json(cls, value, status: int = 200, **kwargs) -> "Response":
+        body = emitter.dumps(value)
+        return cls(body, emitter.etag(body) if status == 200 else None, status, **kwargs)
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """
+        :param if_none_match: the If-None-Match header of a request
+        :return: True if the client already has this response
+        """
+        if not if_none_match or self.etag is None:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        return any(tag.strip().lstrip("W/") == self.etag for tag in if_none_match.split(","))
+
+
+NOT_FOUND = Response.json({"error": "not found"}, status=404)
+BAD_REQUEST = Response.json({"error": "bad request"}, status=400)
+METHOD_NOT_ALLOWED = Response.json({"error": "method not allowed"}, status=405, headers={"Allow": "GET, HEAD"})
+
+
+class SchemaDocument(object):
+    def __init__(self, path: str, signature: Tuple[int, int], parser: FIMParser):
+        """
+        the precomputed responses of a xDatenfelder file, the parser itself is not kept
+        :param signature: modification time and size of the file when it was parsed
+        """
+        self.path = path
+        self.signature = signature
+        element = parser if parser.id is not None else parser.form[0]
+        self.id = element.id
+        self.version = element.element_version
+        self.name = parser.name if parser.id is not None else element.name
+        self.schema = Response(parser.to_json_bytes(), parser.etag)
+        self.code_lists = {}
+        for urn, version in parser.code_list_versions.items():
+            code_list = parser.code_list(urn, version)
+            self.code_lists[urn] = Response.json({"urn": urn, "version": code_list.version,
+                                                  "dataset": [list(item) for item in code_list.dataset]})
+
+    @property
+    def route(self) -> str:
+        return f"/schemas/{self.id}/{self.version}" if self.version else f"/schemas/{self.id}"
+
+    def __repr__(self):
+        return f"SchemaDocument({self.id} {self.version}: {self.path})"
+
+
+class SchemaRepository(object):
+    """
+    the precomputed responses of all xDatenfelder files of a directory. reload() only parses files that changed
+    since the last reload and swaps all routes at once, so lookups (from any thread) always see a consistent state:
+
+        /schemas                   index of all schemas
+        /schemas/<id>              the newest version of a schema
+        /schemas/<id>/<version>    a version of a schema
+        /codelists/<urn>           a codelist used by the schemas
+    """
+
+    def __init__(self, directory: str, code_list_cache: CodeListCache = None, **parser_options):
+        """
+        :param directory: the directory of the xDatenfelder files (or a glob pattern, see convert.find_files)
+        :param code_list_cache: the CodeListCache used to resolve codelists (defaults to the global cache)
+        :param parser_options: further options of FIMParser (e.g. backend, code_list_lock)
+        """
+        self._directory = directory
+        self._code_list_cache = code_list_cache
+        self._parser_options = parser_options
+        self._documents = {}
+        # path -> signature and error of files that could not be parsed, only used by reload()
+        self._failed = {}
+        # the errors by path, replaced (never changed) by reload() like the routes
+        self._errors = {}
+        self._routes = {}
+        # reloads are serialized, lookups never wait for them
+        self._reload_lock = threading.Lock()
+
+    @property
+    def documents(self) -> List[SchemaDocument]:
+        return list(self._documents.values())
+
+    @property
+    def errors(self) -> Dict[str, str]:
+        """
+        :return: the error of every file that could not be parsed by path (the previous version is still served)
+        """
+        return dict(self._errors)
+
+    def __len__(self):
+        return len(self._documents)
+
+    def lookup(self, path: str) -> Optional[Response]:
+        return self._routes.get(path)
+
+    def reload(self) -> Tuple[List[str], List[str]]:
+        """
+        parses new and changed files and removes deleted ones
+        :return: the paths of the changed and the removed files
+        """
+        with self._reload_lock:
+            signatures = {}
+            for path in find_files([self._directory]):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                signatures[path] = (stat.st_mtime_ns, stat.st_size)
+
+            documents = {path: document for path, document in self._documents.items() if path in signatures}
+            removed = [path for path in self._documents if path not in signatures]
+            changed = []
+            for path, signature in signatures.items():
+                document = documents.get(path)
+                if document is not None and document.signature == signature:
+                    continue
+                failed = self._failed.get(path)
+                if failed is not None and failed[0] == signature:
+                    continue
+                try:
+                    options = dict(self._parser_options)
+                    if self._code_list_cache is not None:
+                        options.setdefault("code_list_cache", self._code_list_cache)
+                    documents[path] = SchemaDocument(path, signature, FIMParser(path, keep_xml=False, **options))
+                    self._failed.pop(path, None)
+                    changed.append(path)
+                except Exception as e:
+                    # the previous version of the file (if any) is served until it can be parsed again
+                    logger.warning("failed to load %s: %s", path, e)
+                    self._failed[path] = (signature, f"{type(e).__name__}: {e}")
+            for path in removed:
+                self._failed.pop(path, None)
+
+            if changed or removed or not self._routes:
+                self._documents = documents
+                self._routes = self._build_routes(documents)
+            self._errors = {path: error for path, (_, error) in self._failed.items()}
+            return changed, removed
+
+    @staticmethod
+    def _build_routes(documents: Dict[str, SchemaDocument]) -> Dict[str, Response]:
+        routes = {}
+        newest = {}
+        for path in sorted(documents):
+            document = documents[path]
+            routes.setdefault(document.route, document.schema)
+            current = newest.get(document.id)
+            if current is None or _version_key(document.version) > _version_key(current.version):
+                newest[document.id] = document
+            for urn, response in document.code_lists.items():
+                routes.setdefault(f"/codelists/{urn}", response)
+        for schema_id, document in newest.items():
+            routes[f"/schemas/{schema_id}"] = document.schema
+
+        index = [{"id": document.id, "version": document.version, "name": document.name, "path": document.route,
+                  "etag": document.schema.etag}
+                 for document in sorted(documents.values(), key=lambda item: (item.id, _version_key(item.version)))]
+        routes["/schemas"] = Response.json(index)
+        return routes
+
+
+class ServiceMetrics(object):
+    """
+    counters (requests, hits, not_modified, misses, reloads, ...) and request latencies of a SchemaServer
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.stats = Stats()
+        self._latencies = collections.deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self._latencies.append(seconds)
+
+    def latency(self) -> Dict[str, float]:
+        """
+        :return: percentiles of the latest request latencies in milliseconds
+        """
+        latencies = sorted(self._latencies)
+        if not latencies:
+            return {}
+
+        def percentile(value):
+            return round(latencies[min(len(latencies) - 1, int(value * len(latencies)))] * 1000, 3)
+
+        return {"p50": percentile(0.5), "p90": percentile(0.9), "p99": percentile(0.99),
+                "max": round(latencies[-1] * 1000, 3), "samples": len(latencies)}
+
+    def as_dict(self) -> Dict:
+        counters = self.stats.as_dict()
+        requests = counters["counters"].get("requests", 0)
+        served = sum(counters["counters"].get(name, 0) for name in ["hits", "not_modified"])
+        return dict(counters, latency_ms=self.latency(), hit_ratio=round(served / requests, 4) if requests else None)
+
+
+class SchemaServer(object):
+    """
+    a small asyncio http server for the json schemas and codelists of a directory of xDatenfelder files. all
+    responses are precomputed (see SchemaRepository), so a request is a dictionary lookup. changed files are parsed
+    again in a background thread and swapped in atomically, /metrics reports request latencies and cache hits:
+
+        SchemaServer("fim-catalogue/", port=8000).run()
+    """
+
+    def __init__(self, directory: str, host: str = "127.0.0.1", port: int = 8000, reload_interval: float = 2.0,
+                 code_list_cache: CodeListCache = None, **parser_options):
+        """
+        :param directory: the directory of the xDatenfelder files
+        :param host: the interface the server listens on
+        :param port: the port the server listens on (0 picks a free port)
+        :param reload_interval: seconds between checks for changed files (0 disables reloading)
+        :param code_list_cache: the CodeListCache used to resolve codelists (defaults to the global cache)
+        :param parser_options: further options of FIMParser
+        """
+        self.repository = SchemaRepository(directory, code_list_cache, **parser_options)
+        self.metrics = ServiceMetrics()
+        self._host = host
+        self._port = port
+        self._reload_interval = reload_interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ozg-reload")
+        self._server = None
+        self._watcher = None
+        self._connections = set()
+
+    @property
+    def url(self) -> str:
+        if self._server is None:
+            raise RuntimeError("the server is not running")
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def _reload(self):
+        start = time.perf_counter()
+        changed, removed = self.repository.reload()
+        self.metrics.stats.add_time("reload", time.perf_counter() - start)
+        self.metrics.stats.count("reloads")
+        self.metrics.stats.count("reloaded_files", len(changed))
+        if changed or removed:
+            logger.info("reloaded %d changed and removed %d files", len(changed), len(removed))
+
+    async def reload(self):
+        """parses changed files in the background thread"""
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._reload)
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self._reload_interval)
+            try:
+                await self.reload()
+            except Exception:
+                logger.exception("reloading %s failed", self.repository._directory)
+
+    async def start(self):
+        """loads all files and starts serving"""
+        await self.reload()
+        self._server = await asyncio.start_server(self._handle, self._host, self._port, limit=MAX_HEADER_SIZE)
+        if self._reload_interval:
+            self._watcher = asyncio.ensure_future(self._watch())
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+        if self._server is not None:
+            self._server.close()
+            # idle keep-alive connections would keep their handlers waiting for the next request
+            for writer in list(self._connections):
+                writer.close()
+            for _ in range(100):
+                if not self._connections:
+                    break
+                await asyncio.sleep(0.01)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+            self._executor.shutdown(wait=False)
+
+    def run(self):
+        """serves in the current thread until it is interrupted"""
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            pass
+
+    def _respond(self, method: str, target: str, headers: Dict[str, str]) -> Tuple[Response, bytes]:
+        """
+        :return: the response and the bytes to send
+        """
+        stats = self.metrics.stats
+        if method not in ("GET", "HEAD"):
+            return METHOD_NOT_ALLOWED, METHOD_NOT_ALLOWED.head + METHOD_NOT_ALLOWED.body
+
+        path = unquote(urlsplit(target).path).rstrip("/") or "/"
+        if path == "/metrics":
+            response = Response.json(dict(self.metrics.as_dict(), schemas=len(self.repository),
+                                          errors=self.repository.errors))
+        else:
+            response = self.repository.lookup(path)
+            if response is None:
+                stats.count("misses")
+                response = NOT_FOUND
+            elif response.matches(headers.get("if-none-match")):
+                stats.count("not_modified")
+                return response, response.not_modified
+            else:
+                stats.count("hits")
+
+        return response, response.head if method == "HEAD" else response.head + response.body
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(writer)
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                start = time.perf_counter()
+                self.metrics.stats.count("requests")
+
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    writer.write(BAD_REQUEST.head + BAD_REQUEST.body)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        key, value = line.split(":", 1)
+                        headers[key.strip().lower()] = value.strip()
+
+                # request bodies are not used, but have to be read to keep the connection usable
+                length = headers.get("content-length")
+                if length:
+                    try:
+                        await reader.readexactly(int(length))
+                    except (ValueError, asyncio.IncompleteReadError):
+                        break
+
+                _, data = self._respond(method, target, headers)
+                writer.write(data)
+                await writer.drain()
+                self.metrics.observe(time.perf_counter() - start)
+
+                connection = headers.get("connection", "").lower()
+                if connection == "close" or (version != "HTTP/1.1" and connection != "keep-alive"):
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
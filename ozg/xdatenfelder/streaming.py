@@ -0,0 +1,242 @@
+import io
+import keyword
+import os
+import re
+from typing import Callable, Dict, Iterator, List, Optional
+
+try:
+    from lxml import etree as ElementTree
+except ImportError:  # pragma: no cover - lxml is optional
+    from xml.etree import ElementTree
+
+from .fim_code_lists import open_url
+
+_XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+
+class StreamingElement(object):
+    """
+    a lightweight xml element with the same interface as untangle.Element (attribute access to children,
+    cdata, get_elements, get_attribute) but with an index of the children by name, so lookups are O(1)
+    """
+
+    __slots__ = ("_name", "_attributes", "children", "cdata", "_index")
+
+    def __init__(self, name: Optional[str], attributes: Dict[str, str] = None):
+        self._name = name
+        self._attributes = attributes or {}
+        self.children = []
+        self.cdata = ""
+        self._index = None
+
+    def add_child(self, element: "StreamingElement"):
+        self.children.append(element)
+        self._index = None
+
+    def _children_by_name(self) -> Dict[str, List["StreamingElement"]]:
+        if self._index is None:
+            index = {}
+            for child in self.children:
+                index.setdefault(child._name, []).append(child)
+            self._index = index
+        return self._index
+
+    def get_attribute(self, key):
+        return self._attributes.get(key)
+
+    def get_elements(self, name=None):
+        if name:
+            return self._children_by_name().get(name, [])
+        return self.children
+
+    def __getattr__(self, key):
+        if key.startswith("__"):
+            raise AttributeError(key)
+        matching_children = self._children_by_name().get(key)
+        if not matching_children:
+            raise AttributeError(f"'{self._name}' has no attribute '{key}'")
+        if len(matching_children) == 1:
+            return matching_children[0]
+        return matching_children
+
+    def __getitem__(self, key):
+        return self.get_attribute(key)
+
+    def __iter__(self):
+        yield self
+
+    def __bool__(self):
+        return True
+
+    def __len__(self):
+        return len(self.children)
+
+    def __repr__(self):
+        return f"StreamingElement(name = {self._name}, attributes = {self._attributes}, cdata = {self.cdata})"
+
+
+def _element_name(name: str) -> str:
+    # same name mangling as untangle
+    name = name.replace("-", "_").replace(".", "_").replace(":", "_")
+    if keyword.iskeyword(name):
+        name += "_"
+    return name
+
+
+def _open_source(source):
+    """
+    :param source: xml as a string, a filename, an url or a file like object
+    :return: a binary file like object and a flag if it has to be closed by the caller
+    """
+    if isinstance(source, os.PathLike):
+        return open(source, "rb"), True
+    if isinstance(source, bytes):
+        return io.BytesIO(source), True
+    if isinstance(source, str):
+        if source.startswith(("http://", "https://")):
+            return open_url(source), True
+        if os.path.exists(source):
+            return open(source, "rb"), True
+        # the string is already decoded, so the encoding in the xml declaration does not apply anymore
+        return io.BytesIO(_XML_DECLARATION.sub("", source, count=1).encode("utf-8")), True
+    if hasattr(source, "read"):
+        return source, False
+    raise ValueError("parse() takes a filename, URL or XML string")
+
+
+StartHandler = Callable[[StreamingElement, StreamingElement], None]
+EndHandler = Callable[[StreamingElement, StreamingElement], bool]
+
+
+class _ElementBuilder(object):
+    """
+    parser target building StreamingElements directly from the parser events (no intermediate ElementTree)
+    """
+
+    def __init__(self, document: StreamingElement, start: StartHandler = None, end: EndHandler = None):
+        self._start = start
+        self._end = end
+        self._prefixes = {}
+        # element names by tag, documents only use a handful of distinct tags
+        self._names = {}
+        self._pending_namespaces = {}
+        self._stack = [document]
+        self._cdata = [[]]
+
+    def start_ns(self, prefix, uri):
+        self._prefixes[uri] = prefix or ""
+        self._names.clear()
+        self._pending_namespaces["xmlns:" + prefix if prefix else "xmlns"] = uri
+
+    def start(self, tag, attrib, nsmap=None):
+        attributes = self._pending_namespaces
+        self._pending_namespaces = {}
+        for key, value in attrib.items():
+            attributes[_qualified_name(key, self._prefixes)] = value
+
+        name = self._names.get(tag)
+        if name is None:
+            name = self._names[tag] = _element_name(_qualified_name(tag, self._prefixes))
+
+        element = StreamingElement(name, attributes)
+        parent = self._stack[-1]
+        parent.add_child(element)
+        self._stack.append(element)
+        self._cdata.append([])
+        if self._start is not None:
+            self._start(element, parent)
+
+    def data(self, data):
+        self._cdata[-1].append(data)
+
+    def end(self, tag):
+        element = self._stack.pop()
+        element.cdata = "".join(self._cdata.pop())
+        parent = self._stack[-1]
+        if self._end is not None and self._end(element, parent) is False:
+            parent.children.pop()
+            parent._index = None
+
+    def close(self):
+        return self._stack[0]
+
+
+class StreamingParser(object):
+    """
+    incremental parser, xml can be fed chunk by chunk (e.g. while it is downloaded)
+    """
+
+    def __init__(self, document: StreamingElement = None, start: StartHandler = None, end: EndHandler = None):
+        """
+        :param document: the (empty) document element the root element gets added to
+        :param start: called with (element, parent) as soon as an element starts, its attributes are available
+        but not its children
+        :param end: called with (element, parent) when an element is complete. if it returns False the element is
+        not kept in the tree, so the subtree can be freed as soon as it is consumed
+        """
+        self._document = document if document is not None else StreamingElement(None)
+        self._parser = ElementTree.XMLParser(target=_ElementBuilder(self._document, start, end))
+
+    def feed(self, data: bytes):
+        self._parser.feed(data)
+
+    def close(self) -> StreamingElement:
+        """
+        :return: the document element (like untangle.parse)
+        """
+        self._parser.close()
+        return self._document
+
+    def iterparse(self, source, chunk_size: int = 64 * 1024) -> Iterator[int]:
+        """
+        feeds the source to the parser chunk by chunk and yields after every chunk, so whatever the handlers
+        collected can be consumed while the document is parsed. the parser is not closed
+        :param source: xml as a string, a filename, an url or a file like object
+        :param chunk_size: number of bytes read from the source at once
+        :return: a generator over the number of bytes fed so far
+        """
+        stream, close = _open_source(source)
+        try:
+            fed = 0
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                self.feed(chunk)
+                fed += len(chunk)
+                yield fed
+        finally:
+            if close:
+                stream.close()
+
+    def parse(self, source, chunk_size: int = 64 * 1024) -> StreamingElement:
+        """
+        reads the whole source and feeds it to the parser
+        :param source: xml as a string, a filename, an url or a file like object
+        :param chunk_size: number of bytes read from the source at once
+        :return: the document element (like untangle.parse)
+        """
+        for _ in self.iterparse(source, chunk_size):
+            pass
+        return self.close()
+
+
+def parse(source, document: StreamingElement = None, start: StartHandler = None,
+          end: EndHandler = None) -> StreamingElement:
+    """
+    parses xml in one streaming pass (using lxml if installed, xml.etree otherwise) into StreamingElements
+    :param source: xml as a string, a filename, an url or a file like object
+    :param document: the (empty) document element the root element gets added to
+    :param start: see StreamingParser
+    :param end: see StreamingParser
+    :return: the document element (like untangle.parse)
+    """
+    return StreamingParser(document, start, end).parse(source)
+
+
+def _qualified_name(name: str, prefixes: Dict[str, str]) -> str:
+    if not name.startswith("{"):
+        return name
+    uri, local_name = name[1:].split("}", 1)
+    prefix = prefixes.get(uri)
+    return f"{prefix}:{local_name}" if prefix else local_name
@@ -0,0 +1,215 @@
+import re
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+from .parser import FIMParser, FIMStructure, FIMField, FIMFieldGroup, FieldType, DataType, ValidationConstraints
+
+# validates a value at a path and appends all errors to the list
+Validator = Callable[[Any, Tuple, List["ValidationError"]], None]
+
+_DATE_PATTERN = re.compile(r"^\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])$")
+
+
+class ValidationError(object):
+    def __init__(self, path: Tuple, message: str):
+        """
+        :param path: the path of the invalid value in the submission (property names and list indices)
+        :param message: what is wrong with the value
+        """
+        self.path = path
+        self.message = message
+
+    @property
+    def pointer(self) -> str:
+        """:return: the path as json pointer (e.g. /G00000630/F00000013)"""
+        return "".join(f"/{part}" for part in self.path)
+
+    def __eq__(self, other):
+        return isinstance(other, ValidationError) and (self.path, self.message) == (other.path, other.message)
+
+    def __repr__(self):
+        return f"ValidationError({self.pointer or '/'}: {self.message})"
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_integer(value) -> bool:
+    return (isinstance(value, int) and not isinstance(value, bool)) or (isinstance(value, float) and value.is_integer())
+
+
+def _is_date(value) -> bool:
+    return isinstance(value, str) and _DATE_PATTERN.match(value) is not None
+
+
+_TYPE_CHECKS = {
+    DataType.TEXT: (lambda value: isinstance(value, str), "a string"),
+    DataType.DATE: (_is_date, "a date (YYYY-MM-DD)"),
+    DataType.BOOL: (lambda value: isinstance(value, bool), "a boolean"),
+    DataType.NUM: (_is_number, "a number"),
+    DataType.NUM_INT: (_is_integer, "an integer"),
+    DataType.NUM_CURRENCY: (_is_number, "a number"),
+    DataType.FILE: (lambda value: isinstance(value, str), "a string"),
+    DataType.OBJ: (lambda value: isinstance(value, str), "a string"),
+}
+
+
+class SubmissionValidator(object):
+    """
+    validates submitted form data against a parsed FIM model. the FIMStructure tree is compiled once into
+    plain python functions (patterns are precompiled, codelists are hashed sets), so validating a submission does
+    not need a json schema validator or any $ref lookups. the rules are the same as the ones of FIMParser.to_json
+    """
+
+    def __init__(self, parser: FIMParser):
+        """
+        :param parser: the parsed FIM model
+        """
+        self._parser = parser
+        self._compiled = {}
+        parser.prefetch_code_lists()
+        self._validate = self._compile_object([(self._root_key(element), self._root_required(element),
+                                                self._compile_root(element)) for element in parser.form])
+
+    @staticmethod
+    def _root_key(element) -> str:
+        return element.id if isinstance(element, FIMFieldGroup) else element.contains.id
+
+    @staticmethod
+    def _root_required(element) -> bool:
+        return isinstance(element, FIMFieldGroup) or element.is_required
+
+    def _compile_root(self, element) -> Validator:
+        if isinstance(element, FIMFieldGroup):
+            return self._compile_element(element)
+        return self._compile_structure(element)
+
+    def _compile_element(self, element) -> Validator:
+        # shared fields/groups are compiled only once
+        if element.id not in self._compiled:
+            if isinstance(element, FIMFieldGroup):
+                self._compiled[element.id] = self._compile_group(element)
+            else:
+                self._compiled[element.id] = self._compile_field(element)
+        return self._compiled[element.id]
+
+    def _compile_structure(self, structure: FIMStructure) -> Validator:
+        validate_item = self._compile_element(structure.contains)
+        if structure.max_items == 1 and structure.min_items <= 1:
+            return validate_item
+
+        min_items, max_items = structure.min_items, structure.max_items
+
+        def validate(value, path, errors):
+            if not isinstance(value, list):
+                errors.append(ValidationError(path, "must be a list"))
+                return
+            if len(value) < min_items:
+                errors.append(ValidationError(path, f"must contain at least {min_items} items"))
+            if len(value) > max_items:
+                errors.append(ValidationError(path, f"must contain at most {max_items} items"))
+            for index, item in enumerate(value):
+                validate_item(item, path + (index,), errors)
+
+        return validate
+
+    def _compile_group(self, group: FIMFieldGroup) -> Validator:
+        return self._compile_object([(structure.contains.id, structure.is_required,
+                                      self._compile_structure(structure)) for structure in group.fields])
+
+    @staticmethod
+    def _compile_object(properties: List[Tuple[str, bool, Validator]]) -> Validator:
+        """
+        :param properties: list of (key, required, validator) of the object
+        """
+        properties = tuple(properties)
+
+        def validate(value, path, errors):
+            if not isinstance(value, dict):
+                errors.append(ValidationError(path, "must be an object"))
+                return
+            for key, required, validator in properties:
+                if key in value:
+                    validator(value[key], path + (key,), errors)
+                elif required:
+                    errors.append(ValidationError(path + (key,), "is required"))
+
+        return validate
+
+    def _compile_field(self, field: FIMField) -> Validator:
+        if field.field_type == FieldType.SELECT:
+            return self._compile_select(field)
+        if field.field_type == FieldType.INPUT:
+            return self._compile_input(field)
+
+        def validate(value, path, errors):
+            if not isinstance(value, str):
+                errors.append(ValidationError(path, "must be a string"))
+
+        return validate
+
+    def _compile_select(self, field: FIMField) -> Validator:
+        choices = frozenset(choice[1] for choice in self._parser.code_list(field.reference_value_uri).dataset)
+
+        def validate(value, path, errors):
+            if not isinstance(value, str):
+                errors.append(ValidationError(path, "must be a string"))
+            elif value not in choices:
+                errors.append(ValidationError(path, "is not a valid choice"))
+
+        return validate
+
+    def _compile_input(self, field: FIMField) -> Validator:
+        check_type, type_name = _TYPE_CHECKS.get(field.data_type, _TYPE_CHECKS[DataType.TEXT])
+        constraints = field.validation
+        try:
+            pattern = re.compile(constraints.pattern) if constraints.pattern is not None else None
+        except re.error:
+            # like invalid validation details, an invalid pattern disables all constraints of the field
+            constraints, pattern = ValidationConstraints(), None
+        min_length = constraints.min_length
+        max_length = constraints.max_length
+        minimum = constraints.minimum
+        maximum = constraints.maximum
+
+        def validate(value, path, errors):
+            if not check_type(value):
+                errors.append(ValidationError(path, f"must be {type_name}"))
+                return
+            if isinstance(value, str):
+                if min_length is not None and len(value) < min_length:
+                    errors.append(ValidationError(path, f"must be at least {min_length} characters long"))
+                if max_length is not None and len(value) > max_length:
+                    errors.append(ValidationError(path, f"must be at most {max_length} characters long"))
+                if pattern is not None and pattern.search(value) is None:
+                    errors.append(ValidationError(path, f"must match {pattern.pattern}"))
+            elif _is_number(value):
+                if minimum is not None and value < minimum:
+                    errors.append(ValidationError(path, f"must be at least {minimum}"))
+                if maximum is not None and value > maximum:
+                    errors.append(ValidationError(path, f"must be at most {maximum}"))
+
+        return validate
+
+    def validate(self, submission: Dict) -> List[ValidationError]:
+        """
+        :param submission: the submitted form data (as described by FIMParser.to_json)
+        :return: all errors of the submission (an empty list if it is valid)
+        """
+        errors = []
+        self._validate(submission, (), errors)
+        return errors
+
+    def is_valid(self, submission: Dict) -> bool:
+        return len(self.validate(submission)) == 0
+
+    def validate_many(self, submissions: Iterable[Dict]) -> Iterator[List[ValidationError]]:
+        """
+        :param submissions: any iterable of submissions
+        :return: a generator over the errors of each submission (in order)
+        """
+        validate = self._validate
+        for submission in submissions:
+            errors = []
+            validate(submission, (), errors)
+            yield errors
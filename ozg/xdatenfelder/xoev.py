@@ -0,0 +1,196 @@
+import io
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+from xml.sax.saxutils import escape, quoteattr
+
+from .parser import FIMParser, FIMParserError, FIMStructure, FIMField, FIMFieldGroup, FieldType
+
+# writes a value (and its children) as xml parts to the list
+Writer = Callable[[Any, List[str]], None]
+
+
+def _format_value(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return escape(str(value))
+
+
+class XOEVSerializer(object):
+    """
+    serializes submitted form data (as described by FIMParser.to_json) to XÖV xml documents. the FIM model is
+    compiled once into writers, documents are generated chunk by chunk without building a DOM.
+
+    every field/field group is written as element named by its FIM id, repeated structures are written as repeated
+    elements and select fields are written as XÖV code (<F... listURI="..." listVersionID="..."><code>key</code>)
+    using the key of the code list instead of the label. missing and null values are omitted, values of the wrong
+    type (e.g. a list for a field group that is not repeated) raise a FIMParserError.
+    """
+
+    XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+    def __init__(self, parser: FIMParser, namespace: str = None, root_name: str = None):
+        """
+        :param parser: the parsed FIM model
+        :param namespace: the (default) namespace of the documents
+        :param root_name: the name of the root element of each document (defaults to the id of the form)
+        """
+        self._parser = parser
+        self._namespace = namespace
+        self._root_name = root_name or parser.id or parser.form[0].id
+        self._compiled = {}
+        parser.prefetch_code_lists()
+        self._writers = [self._compile_root(element) for element in parser.form]
+
+    def _compile_root(self, element):
+        if isinstance(element, FIMFieldGroup):
+            return element.id, self._compile_element(element)
+        return element.contains.id, self._compile_structure(element)
+
+    def _compile_element(self, element) -> Writer:
+        # shared fields/groups are compiled only once
+        if element.id not in self._compiled:
+            if isinstance(element, FIMFieldGroup):
+                self._compiled[element.id] = self._compile_group(element)
+            else:
+                self._compiled[element.id] = self._compile_field(element)
+        return self._compiled[element.id]
+
+    def _compile_structure(self, structure: FIMStructure) -> Writer:
+        write_item = self._compile_element(structure.contains)
+        if structure.max_items == 1 and structure.min_items <= 1:
+            return write_item
+
+        def write(value, out):
+            if not isinstance(value, (list, tuple)):
+                raise FIMParserError(f"{structure.contains.id} has to be a list, got {value!r}")
+            for item in value:
+                # missing items are omitted
+                if item is not None:
+                    write_item(item, out)
+
+        return write
+
+    def _compile_group(self, group: FIMFieldGroup) -> Writer:
+        start, end = f"<{group.id}>", f"</{group.id}>"
+        children = tuple((structure.contains.id, self._compile_structure(structure)) for structure in group.fields)
+
+        def write(value, out):
+            if not isinstance(value, dict):
+                raise FIMParserError(f"{group.id} has to be an object, got {value!r}")
+            out.append(start)
+            for key, write_child in children:
+                # missing and null values are omitted
+                child = value.get(key)
+                if child is not None:
+                    write_child(child, out)
+            out.append(end)
+
+        return write
+
+    def _compile_field(self, field: FIMField) -> Writer:
+        if field.field_type == FieldType.LABEL:
+            # labels are only displayed in forms and do not carry any data
+            return lambda value, out: None
+        if field.field_type == FieldType.SELECT:
+            return self._compile_select(field)
+
+        start, end = f"<{field.id}>", f"</{field.id}>"
+
+        def write(value, out):
+            if isinstance(value, (dict, list, tuple)):
+                raise FIMParserError(f"{field.id} has to be a single value, got {value!r}")
+            out.append(start)
+            out.append(_format_value(value))
+            out.append(end)
+
+        return write
+
+    def _compile_select(self, field: FIMField) -> Writer:
+        code_list = self._parser.code_list(field.reference_value_uri)
+        keys = {label: key for key, label in code_list.dataset if key is not None}
+
+        start = f"<{field.id}"
+        if field.reference_value_uri:
+            start += f" listURI={quoteattr(field.reference_value_uri)}"
+        if code_list.version:
+            start += f" listVersionID={quoteattr(code_list.version)}"
+        start += "><code>"
+        end = f"</code></{field.id}>"
+
+        def write(value, out):
+            if isinstance(value, (dict, list, tuple)) or value not in keys:
+                raise FIMParserError(f"{value!r} is not a valid choice for {field.id}")
+            out.append(start)
+            out.append(escape(keys[value]))
+            out.append(end)
+
+        return write
+
+    def _root_start(self, name: str) -> str:
+        if self._namespace:
+            return f"<{name} xmlns={quoteattr(self._namespace)}>"
+        return f"<{name}>"
+
+    def _iter_submission(self, submission: Dict) -> Iterator[str]:
+        out = []
+        yield self._root_start(self._root_name)
+        for key, write in self._writers:
+            value = submission.get(key)
+            if value is not None:
+                write(value, out)
+                # yield after every top level element, so only one of them is kept in memory
+                yield "".join(out)
+                out.clear()
+        yield f"</{self._root_name}>"
+
+    def iter_xml(self, submission: Dict) -> Iterator[str]:
+        """
+        :param submission: the submitted form data
+        :return: a generator over the chunks of the xml document
+        """
+        yield self.XML_DECLARATION
+        yield from self._iter_submission(submission)
+
+    def to_xml(self, submission: Dict) -> str:
+        """
+        :return: the xml document of the submission as string
+        """
+        return "".join(self.iter_xml(submission))
+
+    def iter_xml_many(self, submissions: Iterable[Dict], root_name: str = "submissions") -> Iterator[str]:
+        """
+        serializes any number of submissions into one document, submissions are consumed one at a time
+        :param submissions: any iterable (e.g. a generator reading from a database) of submissions
+        :param root_name: the name of the element containing the submissions
+        :return: a generator over the chunks of the xml document
+        """
+        yield self.XML_DECLARATION
+        yield self._root_start(root_name)
+        for submission in submissions:
+            yield from self._iter_submission(submission)
+        yield f"</{root_name}>"
+
+    @staticmethod
+    def _write_chunks(chunks: Iterator[str], fh, buffer_size: int = 64 * 1024):
+        binary = not isinstance(fh, io.TextIOBase)
+        buffer, size = [], 0
+        for chunk in chunks:
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= buffer_size:
+                data = "".join(buffer)
+                fh.write(data.encode("utf-8") if binary else data)
+                buffer, size = [], 0
+        data = "".join(buffer)
+        fh.write(data.encode("utf-8") if binary else data)
+
+    def write(self, submission: Dict, fh):
+        """
+        writes the xml document of a submission to a (text or binary) file like object
+        """
+        self._write_chunks(self.iter_xml(submission), fh)
+
+    def write_many(self, submissions: Iterable[Dict], fh, root_name: str = "submissions"):
+        """
+        writes all submissions as one xml document to a (text or binary) file like object, see iter_xml_many
+        """
+        self._write_chunks(self.iter_xml_many(submissions, root_name), fh)
@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import unquote, urlsplit
+from xml.sax.saxutils import escape
+
+from .code_list_index import CodeListIndex
+
+VERSION_XML = '<?xml version="1.0" encoding="UTF-8"?>' \
+              '<dat:VersionCodeliste xmlns:dat="http://xoev.de/schemata/code/1_0">' \
+              '<dat:kennung>{version}</dat:kennung></dat:VersionCodeliste>'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_HTTPServer"
+
+    def do_GET(self):
+        stand_in = self.server.stand_in
+        stand_in._started()
+        try:
+            if stand_in.latency:
+                time.sleep(stand_in.latency)
+            status, content_type, body = stand_in.respond(unquote(urlsplit(self.path).path))
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            stand_in._finished()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 drops connections of concurrent clients
+    request_queue_size = 128
+
+    def __init__(self, address, stand_in: "XRepositoryServer"):
+        super().__init__(address, _Handler)
+        self.stand_in = stand_in
+
+
+class XRepositoryServer(object):
+    """
+    a local stand-in for the parts of the xrepository api ozg uses (gueltigeVersion and genericode-daten of
+    codelists) that can serve xDatenfelder documents as well. every request is delayed by latency, so throughput and
+    concurrency of codelist resolution can be benchmarked deterministically without network access:
+
+        with XRepositoryServer.from_index(index, latency=0.05) as server:
+            set_xrepository_api(server.api)
+    """
+
+    def __init__(self, code_lists: Dict[str, Tuple[str, List[Tuple[str, str]]]] = None, latency: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0, documents: Dict[str, bytes] = None):
+        """
+        :param code_lists: the current version and the dataset of every codelist by urn
+        :param latency: seconds every request is delayed
+        :param host: the interface the server listens on
+        :param port: the port the server listens on (0 picks a free port)
+        :param documents: further documents by path (e.g. {"/BlaueKarte.xml": xml})
+        """
+        self.latency = latency
+        self._current = {}
+        self._datasets = {}
+        self._documents = dict(documents or {})
+        self._address = (host, port)
+        self._server = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._active = 0
+        self._max_concurrency = 0
+        for urn, (version, dataset) in (code_lists or {}).items():
+            self.add_code_list(urn, version, dataset)
+
+    @classmethod
+    def from_index(cls, index: CodeListIndex, **kwargs) -> "XRepositoryServer":
+        """
+        serves all codelists of a CodeListIndex (every indexed version, gueltigeVersion is the current one)
+        :param kwargs: further options of XRepositoryServer
+        """
+        server = cls(**kwargs)
+        for (urn, version), code_list in index._code_lists.items():
+            server.add_code_list(urn, version, code_list.dataset, current=False)
+        server._current.update(index._current)
+        return server
+
+    def add_code_list(self, urn: str, version: str, dataset: List[Tuple[str, str]], current: bool = True):
+        """
+        :param current: answer gueltigeVersion of the urn with this version
+        """
+        self._datasets[version] = [tuple(item) for item in dataset]
+        if current or urn not in self._current:
+            self._current[urn] = version
+
+    def add_document(self, path: str, content: bytes):
+        """
+        :param path: the path the document is served at (e.g. /BlaueKarte.xml)
+        """
+        self._documents["/" + path.lstrip("/")] = content
+
+    def add_directory(self, directory: str, extension: str = ".xml"):
+        """
+        serves all files with the extension in a directory by their filename
+        """
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(extension):
+                with open(os.path.join(directory, filename), "rb") as fh:
+                    self.add_document(filename, fh.read())
+
+    def respond(self, path: str) -> Tuple[int, str, bytes]:
+        """
+        :param path: the (unquoted) path of a request
+        :return: status, content type and body of the response
+        """
+        if path in self._documents:
+            return 200, "application/xml", self._documents[path]
+
+        parts = path.strip("/").split("/")
+        if len(parts) == 4 and parts[:2] == ["api", "codeliste"] and parts[3] == "gueltigeVersion":
+            version = self._current.get(parts[2])
+            if version is not None:
+                return 200, "application/xml", VERSION_XML.format(version=escape(version)).encode("utf-8")
+        elif len(parts) == 4 and parts[:2] == ["api", "version_codeliste"] and parts[3] == "genericode-daten":
+            dataset = self._datasets.get(parts[2])
+            if dataset is not None:
+                data = {"daten": [{"zelle": [{"wert": key}, {"wert": value}]} for key, value in dataset]}
+                return 200, "application/json", json.dumps(data, ensure_ascii=False).encode("utf-8")
+        return 404, "text/plain", b"not found"
+
+    def _started(self):
+        with self._lock:
+            self._requests += 1
+            self._active += 1
+            self._max_concurrency = max(self._max_concurrency, self._active)
+
+    def _finished(self):
+        with self._lock:
+            self._active -= 1
+
+    @property
+    def requests(self) -> int:
+        """number of requests served so far"""
+        return self._requests
+
+    @property
+    def max_concurrency(self) -> int:
+        """max number of requests that were served at the same time"""
+        return self._max_concurrency
+
+    @property
+    def url(self) -> str:
+        """the base url of the server (documents are served relative to it)"""
+        if self._server is None:
+            raise RuntimeError("the server is not running")
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api(self) -> str:
+        """the url to use as xrepository api (see fim_code_lists.set_xrepository_api)"""
+        return f"{self.url}/api"
+
+    def start(self) -> "XRepositoryServer":
+        """starts serving in a background thread"""
+        self._server = _HTTPServer(self._address, self)
+        # a short poll interval, so stopping the server does not delay tests
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.05},
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """serves in the current thread until it is interrupted"""
+        self._server = _HTTPServer(self._address, self)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self._server = None
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,310 @@
+import os
+import re
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, Optional, Union
+
+from ozg.xdatenfelder import streaming
+from ozg.xdatenfelder.convert import find_files
+from ozg.xdatenfelder.fim_code_lists import CodeListCache, FimCodeList
+from ozg.xdatenfelder.parser import FIMCode, FIMHeaderMixin, FIMParser
+from ozg.xdatenfelder.scan import scan_files
+
+
+class XZuFiParserError(Exception):
+    pass
+
+
+class LeikaTextModule(FIMCode):
+    """LeiKa textmodul (the kind of a text of a Leistung)"""
+    LEISTUNGSBEZEICHNUNG = "01"
+    LEISTUNGSBEZEICHNUNG_II = "02"
+    VOLLTEXT = "03"
+    ERFORDERLICHE_UNTERLAGEN = "04"
+    VORAUSSETZUNGEN = "05"
+    KOSTEN = "06"
+    VERFAHRENSABLAUF = "07"
+    BEARBEITUNGSDAUER = "08"
+    FRIST = "09"
+    WEITERFUEHRENDE_INFORMATIONEN = "10"
+    HINWEISE = "11"
+    RECHTSGRUNDLAGE = "12"
+    RECHTSBEHELF = "13"
+    KURZTEXT = "14"
+
+
+# the codelist of the textmodul codes, used if a text does not reference its codelist
+LEIKA_TEXT_MODULE_URN = "urn:xoev-de:fim:codeliste:leikatextmodul"
+
+# ids of xDatenfelder stammdatenschemas (in form references, e.g. S00000121 or .../S00000121_1.0.xml)
+_SCHEMA_ID = re.compile(r"(?<![A-Za-z0-9])S\d{8}(?!\d)")
+
+# where the stammdatenschema of an id is read from (see XZuFiParser)
+SchemaSource = Union[str, Dict[str, str], Callable[[str], Optional[str]]]
+
+
+def _local_name(element) -> str:
+    # XZuFi documents use different prefixes, elements are matched by their local name
+    return element._name.split("_", 1)[-1]
+
+
+def _children(element, local_name: str) -> list:
+    return [child for child in element.children if _local_name(child) == local_name]
+
+
+def _child(element, local_name: str):
+    children = _children(element, local_name)
+    return children[0] if children else None
+
+
+def _code(element) -> Optional[str]:
+    code = _child(element, "code") if element is not None else None
+    return code.cdata.strip() if code is not None else None
+
+
+class Leistung(FIMHeaderMixin):
+    def __init__(self, element, xzufi_parser: "XZuFiParser"):
+        """
+        a Leistung (public service) of a XZuFi document. name, description and relation are the Leistungsbezeichnung,
+        the Volltext and the Rechtsgrundlage text modules
+        :param element: the parsed xzufi:leistung
+        :param xzufi_parser: the parser of the document, used to resolve codelists and stammdatenschemas
+        """
+        self._xzufi_parser = xzufi_parser
+        identification = _child(element, "id")
+        self._id = self.set_none_if_empty(identification.cdata.strip()) if identification is not None else None
+        self._element_version = None
+        self._leika_keys = [code for code in (_code(reference) for reference in _children(element, "referenzLeiKa"))
+                            if code]
+        self._typification = [code for code in (_code(typification)
+                                                 for typification in _children(element, "typisierung")) if code]
+
+        self._texts = {}
+        self._text_module_urn = LEIKA_TEXT_MODULE_URN
+        for module in _children(element, "modulText"):
+            text_module = _child(module, "leikaTextmodul")
+            code, text = _code(text_module), self._text(module, xzufi_parser.language)
+            if code and text is not None:
+                self._texts[LeikaTextModule.from_code(code)] = text
+                self._text_module_urn = text_module.get_attribute("listURI") or self._text_module_urn
+
+        self._schema_ids = []
+        for module in _children(element, "modulFormular"):
+            self._find_schema_ids(module)
+
+        self._name = self._texts.get(LeikaTextModule.LEISTUNGSBEZEICHNUNG)
+        self._input_name = self._texts.get(LeikaTextModule.LEISTUNGSBEZEICHNUNG_II)
+        self._output_name = None
+        self._description = self._texts.get(LeikaTextModule.VOLLTEXT)
+        self._internal_definition = None
+        self._relation = self._texts.get(LeikaTextModule.RECHTSGRUNDLAGE)
+
+    def _text(self, module, language: str) -> Optional[str]:
+        # the content in the requested language, the first content otherwise
+        contents = _children(module, "inhalt")
+        for content in contents:
+            if (content.get_attribute("languageCode") or "").lower().startswith(language):
+                return self.set_none_if_empty(content.cdata.strip())
+        return self.set_none_if_empty(contents[0].cdata.strip()) if contents else None
+
+    def _find_schema_ids(self, element):
+        for schema_id in _SCHEMA_ID.findall(element.cdata):
+            if schema_id not in self._schema_ids:
+                self._schema_ids.append(schema_id)
+        for child in element.children:
+            self._find_schema_ids(child)
+
+    @property
+    def leika_key(self) -> Optional[str]:
+        """
+        :return: the (first) LeiKa Leistungsschlüssel of the Leistung
+        """
+        return self._leika_keys[0] if self._leika_keys else None
+
+    @property
+    def leika_keys(self) -> List[str]:
+        return list(self._leika_keys)
+
+    @property
+    def typification(self) -> List[str]:
+        """
+        :return: the codes of the Leistungstypisierung (e.g. 1, 2a)
+        """
+        return list(self._typification)
+
+    @property
+    def texts(self) -> Dict[str, str]:
+        """
+        :return: all texts by their LeikaTextModule code
+        """
+        return dict(self._texts)
+
+    def text(self, module: str) -> Optional[str]:
+        """
+        :param module: a LeikaTextModule (or its code)
+        """
+        return self._texts.get(module)
+
+    @property
+    def text_modules(self) -> Dict[str, str]:
+        """
+        :return: all texts by the label of their text module (from the leikatextmodul codelist, the code if the
+        codelist can not be resolved)
+        """
+        labels = dict(self._xzufi_parser.code_list(self._text_module_urn).dataset)
+        return {labels.get(code, str(code)): text for code, text in self._texts.items()}
+
+    @property
+    def schema_ids(self) -> List[str]:
+        """
+        :return: the ids of the xDatenfelder stammdatenschemas referenced by the forms of the Leistung
+        """
+        return list(self._schema_ids)
+
+    @property
+    def schemas(self) -> List[FIMParser]:
+        """
+        :return: the parsed stammdatenschemas of the Leistung (schemas that can not be found are left out)
+        """
+        schemas = [self._xzufi_parser.schema(schema_id) for schema_id in self._schema_ids]
+        return [schema for schema in schemas if schema is not None]
+
+    def __repr__(self):
+        return f"Leistung({self.id}: {self.name})"
+
+
+class XZuFiParser(object):
+    """
+    incremental parser for XZuFi documents (e.g. Leistung exports of the portals). the document is parsed in one
+    streaming pass and every Leistung is yielded as soon as it is complete, its xml is freed afterwards, so the
+    memory does not depend on the size of the export:
+
+        for leistung in XZuFiParser("export.xml", schemas="fim-catalogue/"):
+            print(leistung.leika_key, leistung.name, [schema.name for schema in leistung.schemas])
+    """
+
+    def __init__(self, source, schemas: SchemaSource = None, code_list_cache: CodeListCache = None,
+                 language: str = "de", schema_cache_size: int = 64, chunk_size: int = 64 * 1024, **parser_options):
+        """
+        :param source: xml as a string, a filename, an url or a file like object
+        :param schemas: where the referenced stammdatenschemas are read from: a directory of xDatenfelder files
+        (indexed by the ids in their headers), a dict of id -> xml/filename/url, an url/path template containing
+        {id} or a callable returning the xml/filename/url of an id (None if it is unknown)
+        :param code_list_cache: the CodeListCache used for all codelists (defaults to the global cache)
+        :param language: the language of the texts (texts in other languages are used if it is missing)
+        :param schema_cache_size: max number of parsed stammdatenschemas kept (Leistungen share their schemas)
+        :param chunk_size: number of bytes read from the source at once
+        :param parser_options: further options of FIMParser (e.g. backend, keep_xml)
+        """
+        self._source = source
+        self._schema_source = schemas
+        self._schema_index = None
+        self._code_list_cache = code_list_cache
+        self._language = language.lower()
+        self._schema_cache_size = schema_cache_size
+        self._chunk_size = chunk_size
+        self._parser_options = parser_options
+        self._schemas = OrderedDict()
+        self._code_lists = {}
+        self._version = None
+
+    @property
+    def language(self) -> str:
+        return self._language
+
+    @property
+    def version(self) -> Optional[str]:
+        """
+        :return: the XZuFi namespace of the document (known once parsing started)
+        """
+        return self._version
+
+    def __iter__(self) -> Iterator[Leistung]:
+        return self.iter_leistungen()
+
+    def iter_leistungen(self) -> Iterator[Leistung]:
+        """
+        :return: a generator over all Leistungen of the document (in document order)
+        :raises: XZuFiParserError if the document is no XZuFi document or the xml is invalid
+        """
+        document = streaming.StreamingElement(None)
+        completed = []
+        # number of open leistung elements, only their children are kept until the Leistung is complete
+        depth = 0
+
+        def start(element, parent):
+            nonlocal depth
+            if parent is document:
+                self._version = next((value for key, value in element._attributes.items()
+                                      if key.startswith("xmlns") and "xzufi" in value), None)
+                if self._version is None:
+                    raise XZuFiParserError("the document is no XZuFi document")
+            if _local_name(element) == "leistung":
+                depth += 1
+
+        def end(element, parent):
+            nonlocal depth
+            if _local_name(element) == "leistung":
+                depth -= 1
+                if depth == 0:
+                    completed.append(Leistung(element, self))
+                    return False
+            # everything outside of a Leistung (e.g. organisational units, in any wrapper) is freed as well
+            return depth > 0
+
+        parser = streaming.StreamingParser(document, start, end)
+        try:
+            for _ in parser.iterparse(self._source, self._chunk_size):
+                yield from completed
+                completed.clear()
+            parser.close()
+        except streaming.ElementTree.ParseError as e:
+            raise XZuFiParserError(f"invalid xml: {e}")
+        yield from completed
+
+    def code_list(self, urn: str) -> FimCodeList:
+        """
+        :return: the FimCodeList of the urn (resolved once per parser)
+        """
+        if urn not in self._code_lists:
+            self._code_lists[urn] = FimCodeList(urn, cache=self._code_list_cache)
+        return self._code_lists[urn]
+
+    def _schema_location(self, schema_id: str) -> Optional[str]:
+        if self._schema_source is None:
+            return None
+        if callable(self._schema_source):
+            return self._schema_source(schema_id)
+        if isinstance(self._schema_source, dict):
+            return self._schema_source.get(schema_id)
+        if "{id}" in self._schema_source:
+            return self._schema_source.format(id=schema_id)
+        if os.path.isdir(self._schema_source):
+            if self._schema_index is None:
+                # only the headers are read, the first file (by path) of an id is used
+                self._schema_index = {}
+                for result in scan_files(find_files([self._schema_source]), processes=1):
+                    if result.ok and result.header.element_type == "stammdatenschema":
+                        self._schema_index.setdefault(result.header.id, result.path)
+            return self._schema_index.get(schema_id)
+        raise XZuFiParserError(f"unknown stammdatenschema source {self._schema_source}")
+
+    def schema(self, schema_id: str) -> Optional[FIMParser]:
+        """
+        :param schema_id: the id of a stammdatenschema (e.g. S00000121)
+        :return: the parsed stammdatenschema or None if it can not be found
+        """
+        if schema_id in self._schemas:
+            self._schemas.move_to_end(schema_id)
+            return self._schemas[schema_id]
+
+        location = self._schema_location(schema_id)
+        schema = None
+        if location is not None:
+            options = dict(self._parser_options)
+            if self._code_list_cache is not None:
+                options.setdefault("code_list_cache", self._code_list_cache)
+            schema = FIMParser(location, **options)
+        self._schemas[schema_id] = schema
+        if len(self._schemas) > self._schema_cache_size:
+            self._schemas.popitem(last=False)
+        return schema
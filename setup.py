@@ -17,7 +17,18 @@ setuptools.setup(
     url="https://github.com/LilithWittmann/ozg  ",
     install_requires=[
         'untangle',
+        'requests',
     ],
+    extras_require={
+        'async': ['httpx'],
+        'orjson': ['orjson'],
+        'arrow': ['pyarrow'],
+    },
+    entry_points={
+        'console_scripts': [
+            'ozg=ozg.cli:main',
+        ],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
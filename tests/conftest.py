@@ -0,0 +1,118 @@
+import pytest
+
+from ozg.xdatenfelder import fim_code_lists
+from ozg.xdatenfelder.fim_code_lists import CodeListCache, MemoryCodeListStore
+from ozg.xdatenfelder.parser import DataType, FIMFieldGroup, FIMParser, FieldType
+from ozg.xdatenfelder.xrepository_server import XRepositoryServer
+
+# the codelists referenced by the fixtures
+CODE_LISTS = [
+    "Anrede",
+    "urn:de:bund:destatis:bevoelkerungsstatistik:schluessel:staat",
+    "urn:de:bund:destatis:bevoelkerungsstatistik:schluessel:staatsangehoerigkeit",
+    "urn:de:xoev:codeliste:erreichbarkeit",
+    "urn:de:xwaffe:codelisten:munitionsbezeichnungkaliber",
+    "urn:xpersonenstand:schluesseltabelle:geschlecht",
+]
+
+
+@pytest.fixture
+def xrepository(monkeypatch):
+    """
+    a local xrepository stand-in serving the codelists of the fixtures (version <urn>_1) and the fixtures themselves,
+    all codelists are resolved against it during the test
+    """
+    server = XRepositoryServer({urn: (f"{urn}_1", [("1", f"{urn} eins"), ("2", f"{urn} zwei")])
+                                for urn in CODE_LISTS})
+    server.add_directory("tests/fixtures")
+    server.add_directory("tests/fixtures/groups")
+    with server:
+        monkeypatch.setattr(fim_code_lists, "XREPOSITORY_API", server.api)
+        yield server
+
+
+# the values used for the fields of generated submissions by data type
+VALUES = {
+    DataType.TEXT: "Text",
+    DataType.DATE: "2020-01-31",
+    DataType.BOOL: True,
+    DataType.NUM: 1.5,
+    DataType.NUM_INT: 1,
+    DataType.NUM_CURRENCY: 10,
+}
+
+
+class FakeXRepository:
+    def __init__(self, versions):
+        self.versions = versions
+        self.calls = []
+
+    def resolve_version(self, urn):
+        self.calls.append(("version", urn))
+        return self.versions[urn]
+
+    def download_dataset(self, version):
+        self.calls.append(("dataset", version))
+        return [("1", f"{version} eins"), ("2", f"{version} zwei")]
+
+    def install(self, monkeypatch):
+        monkeypatch.setattr(fim_code_lists, "resolve_version", self.resolve_version)
+        monkeypatch.setattr(fim_code_lists, "download_dataset", self.download_dataset)
+        return self
+
+
+@pytest.fixture
+def fake_xrepository(monkeypatch):
+    """
+    replaces xrepository with a FakeXRepository serving the given versions (urn -> version), every code list
+    version has the entries ("1", "<version> eins") and ("2", "<version> zwei"). calls are recorded in calls
+    """
+    return lambda versions: FakeXRepository(versions).install(monkeypatch)
+
+
+@pytest.fixture
+def offline_cache():
+    """an offline CodeListCache with the codelists of the fixtures (and the LeiKa text modules of XZuFi)"""
+    store = MemoryCodeListStore()
+    for urn in ["urn:de:bund:destatis:bevoelkerungsstatistik:schluessel:staat",
+                "urn:de:bund:destatis:bevoelkerungsstatistik:schluessel:staatsangehoerigkeit",
+                "urn:de:xoev:codeliste:erreichbarkeit", "urn:xpersonenstand:schluesseltabelle:geschlecht"]:
+        store.set_version(urn, "1", 0)
+        store.set_dataset(urn, "1", [("000", "Deutschland"), ("001", "Frankreich")])
+    store.set_version("urn:xoev-de:fim:codeliste:leikatextmodul", "1.6", 0)
+    store.set_dataset("urn:xoev-de:fim:codeliste:leikatextmodul", "1.6",
+                      [("01", "Leistungsbezeichnung"), ("03", "Volltext"), ("12", "Rechtsgrundlage(n)")])
+    return CodeListCache(store=store, ttl=None, offline=True)
+
+
+@pytest.fixture
+def field_value():
+    """:return: a valid value of a field (select fields use the codelists of offline_cache)"""
+    def value(field):
+        if field.field_type == FieldType.SELECT:
+            return "Deutschland"
+        return VALUES.get(field.data_type, "Text")
+
+    return value
+
+
+@pytest.fixture
+def minimal_submission(field_value):
+    """:return: a builder of submissions of a form (or a field group) containing only the required values"""
+    def submission(element):
+        if isinstance(element, FIMParser):
+            structures = element.form
+        elif isinstance(element, FIMFieldGroup):
+            structures = element.fields
+        else:
+            return field_value(element)
+        return {structure.contains.id: structure_value(structure) for structure in structures
+                if structure.is_required}
+
+    def structure_value(structure):
+        value = submission(structure.contains)
+        if structure.max_items == 1 and structure.min_items <= 1:
+            return value
+        return [value] * structure.min_items
+
+    return submission
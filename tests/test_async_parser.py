@@ -0,0 +1,110 @@
+import asyncio
+import json
+import pickle
+
+import pytest
+
+from ozg.xdatenfelder.fim_code_lists import CodeListCache, FimCodeList, get_async_client, prefetch_code_lists_async
+from ozg.xdatenfelder.parser import FIMParser
+
+httpx = pytest.importorskip("httpx")
+from ozg.xdatenfelder.async_parser import AsyncFIMParser  # noqa: E402
+
+VERSION_XML = '<?xml version="1.0"?><dat:VersionCodeliste xmlns:dat="urn:test">' \
+              '<dat:kennung>{urn}_1</dat:kennung></dat:VersionCodeliste>'
+
+
+class FakeServer:
+    """serves the fixtures and answers xrepository requests"""
+
+    def __init__(self):
+        self.requests = []
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        self.requests.append(path)
+        if path.startswith("/fixtures/"):
+            with open(f"tests{path}", "rb") as fh:
+                return httpx.Response(200, content=fh.read())
+        if path.endswith("/gueltigeVersion"):
+            urn = path.split("/")[-2]
+            return httpx.Response(200, text=VERSION_XML.format(urn=urn))
+        if path.endswith("/genericode-daten"):
+            version = path.split("/")[-2]
+            return httpx.Response(200, json={"daten": [{"zelle": [{"wert": "1"}, {"wert": f"{version} eins"}]}]})
+        return httpx.Response(404)
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handle), base_url="http://test")
+
+
+class TestAsyncCodeLists:
+
+    def test_resolve_async(self):
+        server = FakeServer()
+
+        async def resolve():
+            async with server.client() as client:
+                return await FimCodeList.resolve_async("urn:test", cache=CodeListCache(), client=client)
+
+        code_list = asyncio.run(resolve())
+        assert code_list.version == "urn:test_1"
+        assert code_list.dataset == [("1", "urn:test_1 eins")]
+
+    def test_prefetch_code_lists_async_ignores_duplicates(self):
+        server = FakeServer()
+
+        async def prefetch():
+            async with server.client() as client:
+                return await prefetch_code_lists_async(["urn:a", "urn:b", "urn:a", None], cache=CodeListCache(),
+                                                       client=client, max_workers=1)
+
+        assert sorted(asyncio.run(prefetch())) == ["urn:a", "urn:b"]
+        assert len(server.requests) == 4
+
+
+    def test_default_client_is_closed_with_its_loop(self):
+        async def clients():
+            return get_async_client(), get_async_client()
+
+        client, same_client = asyncio.run(clients())
+        assert client is same_client
+        assert client.is_closed
+        # every loop gets its own client
+        assert asyncio.run(clients())[0] is not client
+
+
+class TestAsyncFIMParser:
+
+    def parse(self, server, path="/fixtures/BlaueKarte.xml", **kwargs):
+        async def parse():
+            async with server.client() as client:
+                parser = await AsyncFIMParser.from_url(f"http://test{path}", client=client,
+                                                       code_list_cache=CodeListCache(), **kwargs)
+                return parser, await parser.to_json_async()
+
+        return asyncio.run(parse())
+
+    def test_same_schema_as_sync_parser(self):
+        server = FakeServer()
+        parser, schema = self.parse(server)
+        expected = FIMParser("tests/fixtures/BlaueKarte.xml", code_list_cache=parser._code_list_cache).to_json
+        assert schema == expected
+        assert "urn:de:xoev:codeliste:erreichbarkeit_1 eins" in json.dumps(schema)
+        assert parser.backend == FIMParser.BACKEND_STREAMING
+
+    def test_code_lists_are_requested_once(self):
+        server = FakeServer()
+        parser, _ = self.parse(server)
+        assert len(server.requests) == 1 + 2 * len(parser.code_list_urns)
+
+    def test_unknown_document(self):
+        with pytest.raises(httpx.HTTPStatusError):
+            self.parse(FakeServer(), path="/missing.xml")
+
+    def test_dump_without_client(self):
+        parser, schema = self.parse(FakeServer(), keep_xml=False)
+        loaded = AsyncFIMParser.loads(parser.dumps())
+        assert loaded._client is None
+        assert loaded.to_json == schema
+        assert pickle.loads(pickle.dumps(loaded)).to_json == schema
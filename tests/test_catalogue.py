@@ -0,0 +1,84 @@
+import pytest
+
+from ozg.cli import main
+from ozg.xdatenfelder.catalogue import ElementCatalogue
+from ozg.xdatenfelder.fim_code_lists import CodeListCache
+from ozg.xdatenfelder.instrumentation import Instrumentation
+from ozg.xdatenfelder.parser import FIMParser, FIMParserError
+
+
+@pytest.fixture
+def catalogue(tmp_path):
+    catalogue, errors = ElementCatalogue.build(str(tmp_path / "catalogue.sqlite"),
+                                               ["tests/fixtures/BlaueKarte.xml", "tests/fixtures/WaBeKa.xml"])
+    assert errors == []
+    yield catalogue
+    catalogue.close()
+
+
+class TestElementCatalogue:
+
+    def test_lookup(self, catalogue):
+        assert "F00000035" in catalogue
+        entry = catalogue.get("G00000630")
+        assert (entry.version, entry.element_type) == ("1.0", "field_group")
+        assert catalogue.versions("F00000035") == ["1.0"]
+        assert catalogue.get("F99999999") is None
+
+    def test_usages(self, catalogue):
+        usages = catalogue.usages("F00000035", "1.0")
+        assert len(usages) > 1
+        assert {usage.schema_id for usage in usages} == {"S00000121"}
+        assert all(usage.parent_id for usage in usages)
+        assert catalogue.schemas_using("F00000035") == ["S00000036", "S00000121"]
+        assert catalogue.schemas_using("G00000630") == ["S00000121"]
+
+        # unversioned elements of xDatenfelder 1 are not indexed but their usages are
+        assert "G00000032" not in catalogue
+        assert catalogue.schemas_using("G00000032") == ["S00000036"]
+
+    def test_reindexing_replaces_usages(self, catalogue):
+        usages = len(catalogue.usages("F00000035"))
+        elements = len(catalogue)
+        catalogue.add_file("tests/fixtures/BlaueKarte.xml")
+        assert len(catalogue.usages("F00000035")) == usages
+        assert len(catalogue) == elements
+
+    def test_parser_uses_catalogue(self, catalogue):
+        instrumentation = Instrumentation()
+        parser = FIMParser("tests/fixtures/BlaueKarte.xml", catalogue=catalogue, instrumentation=instrumentation,
+                           code_list_cache=CodeListCache(offline=True))
+        expected = FIMParser("tests/fixtures/BlaueKarte.xml", code_list_cache=CodeListCache(offline=True))
+        assert parser.to_json == expected.to_json
+        assert instrumentation.stats.counters["catalogue_elements"] == len(parser.elements)
+
+        # shared elements are still shared
+        occurrences = [field for field in parser.iter_fields() if field.id == "F00000035"]
+        assert all(field is occurrences[0] for field in occurrences)
+
+    def test_fragment(self, catalogue):
+        cache = CodeListCache(offline=True)
+        parser = FIMParser("tests/fixtures/BlaueKarte.xml", code_list_cache=cache)
+        assert catalogue.fragment("G00000630", code_list_cache=cache) == parser.section_json("G00000630")
+        assert catalogue.fragment("F00000035", code_list_cache=cache)["type"] == "string"
+
+        with pytest.raises(FIMParserError):
+            catalogue.fragment("G99999999")
+
+    def test_from_catalogue(self, catalogue):
+        parser = FIMParser.from_catalogue(catalogue, "G00000630", code_list_cache=CodeListCache(offline=True))
+        assert parser.form[0].id == "G00000630"
+        assert parser.status is None
+        assert parser.metadata == dict.fromkeys(FIMParser.METADATA_ELEMENTS)
+
+
+class TestCatalogueCli:
+
+    def test_build_and_usages(self, tmp_path, capsys):
+        path = str(tmp_path / "catalogue.sqlite")
+        assert main(["catalogue", "build", path, "tests/fixtures"]) == 0
+        assert "indexed 2/2 files" in capsys.readouterr().out
+
+        assert main(["catalogue", "usages", path, "G00000630"]) == 0
+        assert capsys.readouterr().out.startswith("S00000121\t")
+        assert main(["catalogue", "usages", path, "G99999999"]) == 1
@@ -0,0 +1,100 @@
+import json
+
+from ozg.cli import main
+from ozg.xdatenfelder import fim_code_lists
+from ozg.xdatenfelder.code_list_index import CodeListIndex, CodeListLock
+from ozg.xdatenfelder.fim_code_lists import CodeListCache, FimCodeList
+from ozg.xdatenfelder.parser import FIMParser
+
+BLAUE_KARTE_URNS = {
+    "urn:xpersonenstand:schluesseltabelle:geschlecht": "geschlecht_1",
+    "urn:de:bund:destatis:bevoelkerungsstatistik:schluessel:staatsangehoerigkeit": "staatsangehoerigkeit_1",
+    "urn:de:bund:destatis:bevoelkerungsstatistik:schluessel:staat": "staat_1",
+    "urn:de:xoev:codeliste:erreichbarkeit": "erreichbarkeit_1",
+}
+
+
+class TestVersionPinning:
+
+    def test_pinned_version_is_not_resolved(self, fake_xrepository):
+        repository = fake_xrepository({"urn:test": "v2"})
+        cache = CodeListCache()
+        assert FimCodeList("urn:test", cache=cache, version="v1").version == "v1"
+        assert FimCodeList("urn:test", cache=cache, version="v1").dataset[0] == ("1", "v1 eins")
+        assert FimCodeList("urn:test", cache=cache).version == "v2"
+        assert repository.calls == [("dataset", "v1"), ("version", "urn:test"), ("dataset", "v2")]
+
+    def test_document_versions(self):
+        parser = FIMParser("tests/fixtures/BlaueKarte.xml")
+        versions = {field.reference_value_uri: field.reference_value_version for field in parser.iter_fields()
+                    if field.reference_value_uri}
+        assert versions["urn:xpersonenstand:schluesseltabelle:geschlecht"] == \
+               "urn:xpersonenstand:schluesseltabelle:geschlecht_2"
+        # the versions of the document are only used with pin_code_lists
+        assert set(parser.code_list_versions.values()) == {None}
+
+    def test_pin_code_lists(self, fake_xrepository):
+        repository = fake_xrepository(BLAUE_KARTE_URNS)
+        parser = FIMParser("tests/fixtures/BlaueKarte.xml", code_list_cache=CodeListCache(), pin_code_lists=True,
+                           code_list_lock=CodeListLock({"urn:de:xoev:codeliste:erreichbarkeit": "locked"}))
+        assert parser.code_list_versions["urn:de:xoev:codeliste:erreichbarkeit"] == "locked"
+        assert parser.code_list_versions["urn:de:bund:destatis:bevoelkerungsstatistik:schluessel:staat"] == \
+               "urn:de:bund:destatis:bevoelkerungsstatistik:schluessel:staat_2017-01-01"
+
+        parser.prefetch_code_lists()
+        assert ("dataset", "locked") in repository.calls
+        assert ("version", "urn:de:xoev:codeliste:erreichbarkeit") not in repository.calls
+        assert "locked eins" in json.dumps(parser.to_json)
+
+
+class TestCodeListLock:
+
+    def test_roundtrip(self, tmp_path):
+        lock = CodeListLock({"urn:b": "b_1"})
+        lock.pin("urn:a", "a_2")
+        lock.save(str(tmp_path / "ozg.lock"))
+        assert CodeListLock.load(str(tmp_path / "ozg.lock")) == lock
+        assert list(json.load(open(tmp_path / "ozg.lock"))["code_lists"]) == ["urn:a", "urn:b"]
+
+    def test_lock_code_lists(self, fake_xrepository):
+        fake_xrepository(BLAUE_KARTE_URNS)
+        parser = FIMParser("tests/fixtures/BlaueKarte.xml", code_list_cache=CodeListCache())
+        assert parser.lock_code_lists().versions == BLAUE_KARTE_URNS
+
+
+class TestCodeListIndex:
+
+    def test_lookups(self, fake_xrepository):
+        fake_xrepository({"urn:a": "a_1", "urn:b": "b_1"})
+        index = CodeListIndex.build(["urn:a", "urn:b", "urn:unknown"], cache=CodeListCache())
+        assert sorted(index) == ["urn:a", "urn:b"]
+        assert "urn:unknown" not in index
+        assert index["urn:a"].label("2") == "a_1 zwei"
+        assert index["urn:a"].key("a_1 zwei") == "2"
+        assert "1" in index["urn:b"] and "3" not in index["urn:b"]
+        assert index["urn:b"].has_label("b_1 eins")
+        assert index.get("urn:a", "a_0") is None
+
+    def test_offline_store(self, fake_xrepository, tmp_path):
+        repository = fake_xrepository(BLAUE_KARTE_URNS)
+        parser = FIMParser("tests/fixtures/BlaueKarte.xml", code_list_cache=CodeListCache())
+        expected = parser.to_json
+        CodeListIndex.build(parser.code_list_urns, cache=CodeListCache()).save(str(tmp_path / "index.json"))
+        calls = len(repository.calls)
+
+        index = CodeListIndex.load(str(tmp_path / "index.json"))
+        offline = FIMParser("tests/fixtures/BlaueKarte.xml",
+                            code_list_cache=CodeListCache(store=index, offline=True), code_list_lock=index.lock())
+        assert offline.to_json == expected
+        assert len(repository.calls) == calls
+
+    def test_cli(self, monkeypatch, fake_xrepository, tmp_path, capsys):
+        fake_xrepository(BLAUE_KARTE_URNS)
+        monkeypatch.setattr(fim_code_lists, "_default_cache", CodeListCache())
+        lock_path, index_path = str(tmp_path / "ozg.lock"), str(tmp_path / "index.json")
+        assert main(["lock", "tests/fixtures/BlaueKarte.xml", "-o", lock_path, "--index", index_path]) == 0
+        assert "locked 4/4 codelists" in capsys.readouterr().out
+
+        assert main(["convert", "tests/fixtures/BlaueKarte.xml", "-o", str(tmp_path / "out"), "-j", "1",
+                     "--offline", "--lock", lock_path, "--index", index_path]) == 0
+        assert "staat_1 eins" in (tmp_path / "out" / "BlaueKarte.json").read_text()
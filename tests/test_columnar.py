@@ -0,0 +1,100 @@
+import datetime
+import io
+
+import pytest
+
+from ozg.xdatenfelder.parser import FIMParser, FIMFieldGroup
+
+pyarrow = pytest.importorskip("pyarrow")
+pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+
+from ozg.xdatenfelder.columnar import ColumnarExporter  # noqa: E402
+
+
+@pytest.fixture
+def full_submission(field_value):
+    """:return: a builder of submissions of a form containing every value, repeated structures contain two items"""
+    def element_value(element):
+        if isinstance(element, FIMFieldGroup):
+            return {structure.contains.id: structure_value(structure) for structure in element.fields}
+        return field_value(element)
+
+    def structure_value(structure):
+        value = element_value(structure.contains)
+        if structure.max_items == 1 and structure.min_items <= 1:
+            return value
+        return [value, value]
+
+    return lambda parser: {structure.contains.id: structure_value(structure) for structure in parser.form}
+
+
+class TestColumnarExporter:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, offline_cache, full_submission):
+        self.code_list_cache = offline_cache
+        self.full_submission = full_submission
+        self.parser = FIMParser("tests/fixtures/WaBeKa.xml", code_list_cache=offline_cache)
+        self.exporter = ColumnarExporter(self.parser, batch_size=3)
+        self.submission = full_submission(self.parser)
+
+    def test_schema(self):
+        schema = self.exporter.schema
+        assert schema.metadata[b"fim_id"] == b"S00000036"
+        # field groups are flattened, the names are the paths of the fields
+        assert schema.field("F00000141").type == pyarrow.string()
+        assert schema.field("F00000057").type == pyarrow.float64()
+        assert schema.field("G00000067.G00000086.F00000073").type == \
+               pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+        # repeated structures are list columns
+        assert schema.field("G00000067.G00000086.F00000083").type == pyarrow.list_(pyarrow.string())
+
+    def test_record_batch(self):
+        batch = self.exporter.record_batch([self.submission, {}])
+        full, empty = batch.to_pylist()
+        assert full["F00000057"] == 1.5
+        assert full["G00000067.G00000086.F00000073"] == "Deutschland"
+        assert full["G00000067.G00000086.F00000083"] == ["Text", "Text"]
+        assert all(value is None for value in empty.values())
+
+    def test_typed_values(self):
+        parser = FIMParser("tests/fixtures/BlaueKarte.xml", code_list_cache=self.code_list_cache)
+        exporter = ColumnarExporter(parser)
+        date_columns = [field.name for field in exporter.schema if field.type == pyarrow.date32()]
+        assert date_columns
+        submission = self.full_submission(parser)
+        row = exporter.record_batch([submission]).to_pylist()[0]
+        assert row[date_columns[0]] == datetime.date(2020, 1, 31)
+
+        # values of the wrong type are null
+        invalid = exporter.record_batch([{"G00000630": {"F00001017": "viel"}}]).to_pylist()[0]
+        assert invalid["G00000630.F00001017"] is None
+
+    def test_list_of_groups(self):
+        parser = FIMParser("tests/fixtures/BlaueKarte.xml", code_list_cache=self.code_list_cache)
+        exporter = ColumnarExporter(parser)
+        structs = [field for field in exporter.schema if pyarrow.types.is_list(field.type)
+                   and pyarrow.types.is_struct(field.type.value_type)]
+        assert structs
+        name = structs[0].name
+        submission = self.full_submission(parser)
+        items = exporter.record_batch([submission]).to_pylist()[0][name]
+        assert len(items) == 2 and items[0] == items[1]
+
+    def test_write_parquet(self):
+        buffer = io.BytesIO()
+        assert self.exporter.write_parquet(iter([self.submission] * 7 + [{}]), buffer) == 8
+        buffer.seek(0)
+        parquet_file = pyarrow_parquet.ParquetFile(buffer)
+        # one row group per batch
+        assert parquet_file.num_row_groups == 3
+        table = parquet_file.read()
+        assert table.schema == self.exporter.schema
+        assert table.column("G00000067.G00000086.F00000073").to_pylist() == ["Deutschland"] * 7 + [None]
+
+    def test_write_arrow(self, tmp_path):
+        path = str(tmp_path / "submissions.arrow")
+        assert self.exporter.write_arrow([self.submission] * 4, path) == 4
+        table = pyarrow.ipc.open_file(path).read_all()
+        assert table.num_rows == 4
+        assert table.to_pylist()[0] == self.exporter.record_batch([self.submission]).to_pylist()[0]
@@ -0,0 +1,57 @@
+import json
+import os
+
+from ozg.cli import main
+from ozg.xdatenfelder.convert import convert_files, find_files
+
+
+class TestConvert:
+
+    def test_convert_files(self, tmp_path):
+        paths = find_files(["tests/fixtures"])
+        assert paths == ["tests/fixtures/BlaueKarte.xml", "tests/fixtures/WaBeKa.xml"]
+
+        results = list(convert_files(paths, str(tmp_path), processes=2, offline=True))
+        assert all(result.ok for result in results)
+        assert sorted(os.listdir(tmp_path)) == ["BlaueKarte.json", "WaBeKa.json"]
+        assert json.load(open(tmp_path / "BlaueKarte.json"))["title"] == "Antrag auf Blaue Karte EU"
+
+    def test_failures_do_not_abort(self, tmp_path):
+        broken = tmp_path / "broken.xml"
+        broken.write_text('<xdf:schema xmlns:xdf="urn:unknown"/>')
+        results = list(convert_files([str(broken), "tests/fixtures/WaBeKa.xml"], str(tmp_path / "out"), processes=1,
+                                     offline=True))
+        assert [result.ok for result in results] == [False, True]
+        assert results[0].error.startswith("FIMParserError")
+        assert results[1].fields == 46
+
+    def test_same_names_in_different_directories(self, tmp_path):
+        for directory in ["a", "b"]:
+            (tmp_path / "corpus" / directory).mkdir(parents=True)
+        (tmp_path / "corpus" / "a" / "S.xml").write_text(open("tests/fixtures/BlaueKarte.xml").read())
+        (tmp_path / "corpus" / "b" / "S.xml").write_text(open("tests/fixtures/WaBeKa.xml").read())
+        (tmp_path / "corpus" / "b" / "S.XML").write_text(open("tests/fixtures/WaBeKa.xml").read())
+
+        paths = find_files([str(tmp_path / "corpus" / "**" / "*.xml"), str(tmp_path / "corpus" / "b" / "S.XML")])
+        results = list(convert_files(paths, str(tmp_path / "out"), processes=2, offline=True))
+        assert sorted(result.ok for result in results) == [False, True, True]
+        assert "is written to" in next(result.error for result in results if not result.ok)
+        assert json.load(open(tmp_path / "out" / "a" / "S.json"))["title"] == "Antrag auf Blaue Karte EU"
+        assert json.load(open(tmp_path / "out" / "b" / "S.json"))["title"] != "Antrag auf Blaue Karte EU"
+
+    def test_cli(self, tmp_path, capsys):
+        assert main(["convert", "tests/fixtures/*.xml", "-o", str(tmp_path / "out"), "-j", "1", "--offline",
+                     "--cache-dir", str(tmp_path / "cache")]) == 0
+        assert "converted 2/2 files (0 failed)" in capsys.readouterr().out
+
+    def test_cli_offline_requires_code_lists(self, tmp_path, capsys):
+        assert main(["convert", "tests/fixtures/*.xml", "-o", str(tmp_path), "--offline"]) == 1
+        assert "--offline requires" in capsys.readouterr().err
+        assert os.listdir(tmp_path) == []
+
+    def test_cli_stats(self, tmp_path, capsys):
+        assert main(["convert", "tests/fixtures/WaBeKa.xml", "-o", str(tmp_path / "out"), "-j", "1", "--offline",
+                     "--cache-dir", str(tmp_path / "cache"), "--stats"]) == 0
+        stats = capsys.readouterr().out.splitlines()[-1]
+        assert stats.startswith("stats (summed over all files): xml ")
+        assert "fields 35" in stats
@@ -0,0 +1,122 @@
+import json
+
+import pytest
+
+from ozg.xdatenfelder.convert import convert_files
+from ozg.xdatenfelder.diff import ElementChange, diff, element_hashes, regenerate
+from ozg.xdatenfelder.fim_code_lists import CodeListCache
+from ozg.xdatenfelder.parser import FIMParser
+
+TITLE = '<xdf:anzahl>0:1</xdf:anzahl><xdf:bezug>§ 3 AufenthG&#13;\n§ 78 Abs.1 AufenthG</xdf:bezug><xdf:enthaelt>' \
+        '<xdf:datenfeld><xdf:identifikation><xdf:id>F00000043</xdf:id><xdf:version>1.0</xdf:version>' \
+        '</xdf:identifikation><xdf:name>Titel</xdf:name><xdf:bezeichnungEingabe>Titel</xdf:bezeichnungEingabe>'
+
+
+def release(title: str = TITLE) -> str:
+    xml = open("tests/fixtures/BlaueKarte.xml").read()
+    assert TITLE in xml
+    return xml.replace(TITLE, title)
+
+
+NEW_TITLE = TITLE.replace("0:1", "0:3").replace("<xdf:version>1.0</xdf:version>", "<xdf:version>1.1</xdf:version>") \
+    .replace("<xdf:bezeichnungEingabe>Titel<", "<xdf:bezeichnungEingabe>Akademischer Titel<")
+
+
+@pytest.fixture
+def cache():
+    return CodeListCache(offline=True)
+
+
+class TestDiff:
+
+    def test_identical_releases(self, cache):
+        assert not diff(FIMParser(release(), code_list_cache=cache), FIMParser(release(), code_list_cache=cache))
+
+    def test_changes(self, cache):
+        schema_diff = diff(FIMParser(release(), code_list_cache=cache),
+                           FIMParser(release(NEW_TITLE), code_list_cache=cache))
+        assert schema_diff.added == [] and schema_diff.removed == []
+        assert ElementChange("F00000043", "field", "1.0", "1.1", ["element_version", "input_name"]) \
+               in schema_diff.changed
+        # the group containing the field now refers to another version of it
+        assert ElementChange("G00000630", "field_group", "1.0", "1.0", ["fields"]) in schema_diff.changed
+        assert len(schema_diff.changed) == 2
+        assert [(change.element_id, change.old, change.new) for change in schema_diff.cardinalities] == \
+               [("F00000043", (0, 1), (0, 3))]
+
+    def test_added_and_removed(self, cache):
+        schema_diff = diff(FIMParser(release(), code_list_cache=cache),
+                           FIMParser(release(TITLE.replace("F00000043", "F00000999")), code_list_cache=cache))
+        assert [change.element_id for change in schema_diff.added] == ["F00000999"]
+        assert [change.element_id for change in schema_diff.removed] == ["F00000043"]
+        assert "fields" in schema_diff.changed[0].attributes
+        assert json.loads(json.dumps(schema_diff.to_dict()))["added"][0]["new_version"] == "1.0"
+
+    def test_versions_are_not_collapsed(self, cache):
+        xml = release()
+        ort = "<xdf:id>F00000035</xdf:id><xdf:version>1.0</xdf:version></xdf:identifikation><xdf:name>Ort"
+        position = xml.rindex(ort)
+        new = xml[:position] + ort.replace("1.0", "1.1") + "schaft" + xml[position + len(ort):]
+        schema_diff = diff(FIMParser(xml, code_list_cache=cache), FIMParser(new, code_list_cache=cache))
+        # both versions of the field are part of the new release, only the new one is added
+        assert schema_diff.added == [ElementChange("F00000035", "field", None, "1.1")]
+        assert schema_diff.removed == []
+        assert all(change.element_id != "F00000035" for change in schema_diff.changed)
+
+        reverse = diff(FIMParser(new, code_list_cache=cache), FIMParser(xml, code_list_cache=cache))
+        assert reverse.removed == [ElementChange("F00000035", "field", "1.1", None)]
+        assert reverse.added == []
+
+
+class TestIncrementalRegeneration:
+
+    def test_hashes(self, cache):
+        old, new = FIMParser(release(), code_list_cache=cache), FIMParser(release(NEW_TITLE), code_list_cache=cache)
+        old_hashes, new_hashes = element_hashes(old), element_hashes(new)
+        changed = {element_id for element_id in new_hashes if new_hashes[element_id] != old_hashes.get(element_id)}
+        assert "F00000043" in changed
+        assert "F00000013" not in changed
+        assert changed == {"F00000043"} | set(new._containing_group_ids("F00000043"))
+
+    def test_regenerate(self, cache):
+        old = FIMParser(release(), code_list_cache=cache)
+        previous_schema, previous_hashes = json.loads(json.dumps(old.to_json)), element_hashes(old)
+
+        new = FIMParser(release(NEW_TITLE), code_list_cache=cache)
+        schema, hashes = regenerate(new, previous_schema, previous_hashes)
+        assert schema == FIMParser(release(NEW_TITLE), code_list_cache=cache).to_json
+        assert schema["$defs"]["F00000043"]["title"] == "Akademischer Titel"
+        # unchanged definitions are taken from the previous schema
+        assert schema["$defs"]["F00000013"] is previous_schema["$defs"]["F00000013"]
+
+    def test_incremental_conversion(self, tmp_path):
+        source = tmp_path / "BlaueKarte.xml"
+        source.write_text(release(), encoding="utf-8")
+        first, = convert_files([str(source)], str(tmp_path / "out"), processes=1, offline=True, incremental=True)
+        assert len(first.changed_defs) > 1 and first.removed_defs == []
+
+        source.write_text(release(NEW_TITLE), encoding="utf-8")
+        second, = convert_files([str(source)], str(tmp_path / "out"), processes=1, offline=True, incremental=True)
+        assert "F00000043" in second.changed_defs
+        assert "F00000013" not in second.changed_defs
+
+        changes = json.load(open(tmp_path / "out" / "BlaueKarte.changes.json"))
+        assert sorted(changes["changed"]) == sorted(second.changed_defs)
+        assert json.load(open(tmp_path / "out" / "BlaueKarte.json"))["$defs"]["F00000043"]["title"] == \
+               "Akademischer Titel"
+
+    def test_hashes_of_another_schema_are_not_used(self, tmp_path):
+        source = tmp_path / "BlaueKarte.xml"
+        source.write_text(release(), encoding="utf-8")
+        list(convert_files([str(source)], str(tmp_path / "out"), processes=1, offline=True, incremental=True))
+
+        # a conversion without incremental rewrites the schema but not the hashes
+        source.write_text(release(NEW_TITLE), encoding="utf-8")
+        list(convert_files([str(source)], str(tmp_path / "out"), processes=1, offline=True))
+
+        source.write_text(release(), encoding="utf-8")
+        result, = convert_files([str(source)], str(tmp_path / "out"), processes=1, offline=True, incremental=True)
+        assert json.load(open(tmp_path / "out" / "BlaueKarte.json")) == \
+               FIMParser(release(), code_list_cache=CodeListCache(offline=True)).to_json
+        # everything was generated again
+        assert "F00000013" in result.changed_defs
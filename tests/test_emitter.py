@@ -0,0 +1,50 @@
+import io
+import json
+
+import pytest
+
+from ozg.xdatenfelder import emitter
+from ozg.xdatenfelder.fim_code_lists import CodeListCache
+from ozg.xdatenfelder.parser import FIMParser
+
+
+@pytest.fixture(params=["tests/fixtures/BlaueKarte.xml", "tests/fixtures/WaBeKa.xml"])
+def parser(request):
+    return FIMParser(request.param, code_list_cache=CodeListCache(offline=True))
+
+
+class TestEmitter:
+
+    def test_to_json_bytes(self, parser):
+        data = parser.to_json_bytes()
+        assert json.loads(data) == parser.to_json
+        assert parser.to_json_bytes() is data
+
+    def test_json_fallback_is_identical(self, parser, monkeypatch):
+        data = emitter.dumps(parser.to_json)
+        monkeypatch.setattr(emitter, "orjson", None)
+        assert emitter.dumps(parser.to_json) == data
+
+    def test_chunks(self, parser):
+        chunks = list(emitter.iter_chunks(parser.to_json, chunk_size=1024))
+        assert len(chunks) > 1
+        assert b"".join(chunks) == emitter.dumps(parser.to_json)
+
+    def test_write_json(self, parser):
+        streamed = io.BytesIO()
+        assert parser.write_json(streamed, chunk_size=512) == len(parser.to_json_bytes())
+        cached = io.BytesIO()
+        parser.write_json(cached, chunk_size=512)
+        assert streamed.getvalue() == cached.getvalue() == parser.to_json_bytes()
+
+    def test_etag(self):
+        parser = FIMParser("tests/fixtures/BlaueKarte.xml", code_list_cache=CodeListCache(offline=True))
+        etag = parser.etag
+        assert etag.startswith('"') and etag.endswith('"')
+
+        # the etag only changes if the schema changes
+        parser.invalidate("F00000043")
+        assert parser.etag == etag
+        parser.elements[("F00000043", "1.0")]._input_name = "Akademischer Titel"
+        parser.invalidate("F00000043")
+        assert parser.etag != etag
@@ -0,0 +1,80 @@
+import json
+
+from ozg.xdatenfelder.fim_code_lists import FimCodeList, CodeListCache, FileCodeListStore, MemoryCodeListStore, \
+    prefetch_code_lists
+from ozg.xdatenfelder.parser import FIMParser
+
+
+class TestCodeListCache:
+
+    def test_hit_needs_no_network(self, fake_xrepository):
+        repository = fake_xrepository({"urn:test": "urn:test_1"})
+        cache = CodeListCache()
+        assert FimCodeList("urn:test", cache=cache).dataset == [("1", "urn:test_1 eins"), ("2", "urn:test_1 zwei")]
+        assert FimCodeList("urn:test", cache=cache).version == "urn:test_1"
+        assert len(repository.calls) == 2
+
+    def test_lru_eviction(self, fake_xrepository):
+        repository = fake_xrepository({"urn:a": "a_1", "urn:b": "b_1"})
+        cache = CodeListCache(max_size=1)
+        FimCodeList("urn:a", cache=cache)
+        FimCodeList("urn:b", cache=cache)
+        FimCodeList("urn:a", cache=cache)
+        assert repository.calls.count(("dataset", "a_1")) == 2
+
+    def test_ttl_revalidation(self, fake_xrepository):
+        repository = fake_xrepository({"urn:test": "v1"})
+        cache = CodeListCache(ttl=0)
+        FimCodeList("urn:test", cache=cache)
+        FimCodeList("urn:test", cache=cache)
+        # same version: only the version is resolved again
+        assert repository.calls == [("version", "urn:test"), ("dataset", "v1"), ("version", "urn:test")]
+
+        repository.versions["urn:test"] = "v2"
+        assert FimCodeList("urn:test", cache=cache).version == "v2"
+        assert repository.calls[-1] == ("dataset", "v2")
+
+    def test_file_store_and_offline_mode(self, fake_xrepository, tmp_path):
+        repository = fake_xrepository({"urn:de:xoev:codeliste:erreichbarkeit": "v1"})
+        FimCodeList("urn:de:xoev:codeliste:erreichbarkeit", cache=CodeListCache(store=FileCodeListStore(str(tmp_path))))
+        calls = len(repository.calls)
+
+        offline_cache = CodeListCache(store=FileCodeListStore(str(tmp_path)), offline=True)
+        code_list = FimCodeList("urn:de:xoev:codeliste:erreichbarkeit", cache=offline_cache)
+        assert code_list.version == "v1"
+        assert code_list.dataset[0] == ("1", "v1 eins")
+        assert FimCodeList("urn:unknown", cache=offline_cache).version is None
+        assert len(repository.calls) == calls
+
+    def test_stale_entry_is_served_if_xrepository_is_unavailable(self, fake_xrepository):
+        fake_xrepository({"urn:test": "v1"})
+        cache = CodeListCache(store=MemoryCodeListStore(), ttl=0)
+        FimCodeList("urn:test", cache=cache)
+        fake_xrepository({})
+        assert FimCodeList("urn:test", cache=cache).version == "v1"
+
+
+class TestCodeListPrefetch:
+
+    def test_prefetch_before_to_json(self, fake_xrepository):
+        repository = fake_xrepository({
+            "urn:xpersonenstand:schluesseltabelle:geschlecht": "geschlecht_1",
+            "urn:de:bund:destatis:bevoelkerungsstatistik:schluessel:staatsangehoerigkeit": "staatsangehoerigkeit_1",
+            "urn:de:bund:destatis:bevoelkerungsstatistik:schluessel:staat": "staat_1",
+            "urn:de:xoev:codeliste:erreichbarkeit": "erreichbarkeit_1",
+        })
+        parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read(), code_list_cache=CodeListCache(), max_workers=2)
+        assert len(parser.code_list_urns) == 4
+
+        parser.prefetch_code_lists()
+        assert len(repository.calls) == 8
+
+        schema = parser.to_json
+        assert len(repository.calls) == 8
+        assert "staat_1 eins" in json.dumps(schema)
+
+    def test_prefetch_code_lists_ignores_duplicates(self, fake_xrepository):
+        repository = fake_xrepository({"urn:a": "a_1", "urn:b": "b_1"})
+        code_lists = prefetch_code_lists(["urn:a", "urn:b", "urn:a", None], cache=CodeListCache(), max_workers=4)
+        assert sorted(code_lists) == ["urn:a", "urn:b"]
+        assert len(repository.calls) == 4
@@ -1,5 +1,13 @@
-from ozg.xdatenfelder.parser import FIMParser
-from ozg.xdatenfelder.fim_code_lists import FimCodeList
+import copy
+import json
+import pickle
+
+import pytest
+
+from ozg.xdatenfelder import parser as parser_module
+from ozg.xdatenfelder.parser import FIMParser, FIMParserError, FieldType, ValidationConstraints, register_data_type
+from ozg.xdatenfelder.fim_code_lists import FimCodeList, CodeListCache
+from ozg.xdatenfelder.instrumentation import Instrumentation
 
 class TestFimParserInit:
 
@@ -32,6 +40,13 @@ class TestFimParserInit:
         assert parser.legal_definition == "§ 19a AufenthG"
         assert parser.internal_definition is None
 
+    def test_metadata(self):
+        parser = FIMParser("tests/fixtures/BlaueKarte.xml", code_list_cache=CodeListCache(offline=True))
+        assert parser.status == "inVorbereitung"
+        assert parser.metadata == {"status": "inVorbereitung", "valid_from": None, "valid_until": None,
+                                   "author": "BMI, Ref. M3", "version_note": None, "release_date": "2019-06-27",
+                                   "publication_date": "2019-06-27"}
+
     def test_form_parser_v1(self):
         parser = FIMParser(open("tests/fixtures/WaBeKa.xml").read())
 
@@ -50,17 +65,256 @@ class TestFimParserInit:
 
         print(parser.to_json)
 
-    def test_form_section_parser_v2(self):
-        parser = FIMParser("https://gist.githubusercontent.com/LilithWittmann/d8a7bb6c64a25e1dd1a0989d9042b856/raw/3742311b29388474464b6bab0833cffaf5b56d2c/G60000086V1.0.xml")
+    def test_form_section_parser_v2(self, xrepository):
+        parser = FIMParser(f"{xrepository.url}/G00000630.xml", code_list_cache=CodeListCache())
+        assert parser.form[0].id == "G00000630"
         print(parser.to_json)
 
-    def test_from_url(self):
-        parser = FIMParser("https://raw.githubusercontent.com/LilithWittmann/ozg/master/tests/fixtures/BlaueKarte.xml")
+    @pytest.mark.parametrize("backend", FIMParser.BACKENDS)
+    def test_from_url(self, xrepository, backend):
+        parser = FIMParser(f"{xrepository.url}/BlaueKarte.xml", code_list_cache=CodeListCache(), backend=backend)
+        assert parser.id == "S00000121"
         print(parser.to_json)
 
 
 class TestFimCodeLists:
     
-    def test_init(self):
-        FimCodeList("urn:de:bund:destatis:bevoelkerungsstatistik:schluessel:staat")
-        FimCodeList("urn:de:xoev:codeliste:erreichbarkeit")
+    def test_init(self, xrepository):
+        cache = CodeListCache()
+        assert FimCodeList("urn:de:bund:destatis:bevoelkerungsstatistik:schluessel:staat", cache=cache).version == \
+               "urn:de:bund:destatis:bevoelkerungsstatistik:schluessel:staat_1"
+        assert FimCodeList("urn:de:xoev:codeliste:erreichbarkeit", cache=cache).dataset[0] == \
+               ("1", "urn:de:xoev:codeliste:erreichbarkeit eins")
+
+
+class TestStreamingBackend:
+
+    def test_same_model_as_untangle(self):
+        cache = CodeListCache(offline=True)
+        for fixture in ["tests/fixtures/WaBeKa.xml", "tests/fixtures/BlaueKarte.xml"]:
+            xml = open(fixture).read()
+            parser = FIMParser(xml, code_list_cache=cache)
+            streaming_parser = FIMParser(xml, code_list_cache=cache, backend=FIMParser.BACKEND_STREAMING)
+            assert [str(i) for i in streaming_parser.form] == [str(i) for i in parser.form]
+            assert streaming_parser.to_json == parser.to_json
+            assert FIMParser(fixture, code_list_cache=cache, backend=FIMParser.BACKEND_STREAMING).to_json == parser.to_json
+
+    def test_header_v2(self):
+        parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read(), backend=FIMParser.BACKEND_STREAMING,
+                           keep_xml=True)
+        assert parser.id == "S00000121"
+        assert parser.input_name == "Antrag auf Blaue Karte EU"
+        assert parser.legal_definition == "§ 19a AufenthG"
+        assert parser.description is None
+        # the structures are freed after parsing
+        assert len(parser.parsed_xml.children[0].xdf_stammdatenschema.get_elements("xdf_struktur")) == 0
+
+
+class TestSchemaCache:
+
+    def test_to_json_is_memoized(self):
+        parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read(), code_list_cache=CodeListCache(offline=True))
+        assert parser.to_json is parser.to_json
+        # the memoized schema is read-only, changes have to be made on a copy
+        assert json.loads(parser.to_json_bytes()) == parser.to_json
+        etag = parser.etag
+        schema = copy.deepcopy(parser.to_json)
+        schema["$defs"]["G00000630"]["title"] = "changed"
+        assert parser.etag == etag
+        assert json.loads(parser.to_json_bytes()) == parser.to_json
+
+    def test_group_to_json_returns_copies(self):
+        parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read(), code_list_cache=CodeListCache(offline=True))
+        group = parser.elements[("G00000630", "1.0")]
+        schema, defs = group.to_json({})
+        assert schema == parser.to_json["$defs"]["G00000630"]
+        schema["title"] = "changed"
+        schema["properties"].clear()
+        defs["F00000043"]["title"] = "changed"
+        assert parser.to_json["$defs"]["G00000630"]["title"] != "changed"
+        assert parser.to_json["$defs"]["G00000630"]["properties"]
+        assert parser.to_json["$defs"]["F00000043"]["title"] != "changed"
+        assert group.to_json({})[0] == parser.to_json["$defs"]["G00000630"]
+
+    def test_invalidate_element(self):
+        parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read(), code_list_cache=CodeListCache(offline=True))
+        schema = parser.to_json
+        parser.invalidate("F00000043")
+        regenerated = parser.to_json
+        assert regenerated is not schema
+        assert regenerated == schema
+        # only the field and the groups containing it are regenerated
+        assert regenerated["$defs"]["F00000043"] is not schema["$defs"]["F00000043"]
+        assert regenerated["$defs"]["G00000630"] is not schema["$defs"]["G00000630"]
+        assert regenerated["$defs"]["F00000013"] is schema["$defs"]["F00000013"]
+
+
+class TestElementInterning:
+
+    def test_shared_elements_are_parsed_once(self):
+        parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read())
+        occurrences = [field for field in parser.iter_fields() if field.id == "F00000035"]
+        assert len(occurrences) > 1
+        assert all(field is occurrences[0] for field in occurrences)
+        assert parser.elements[("F00000035", "1.0")] is occurrences[0]
+        assert occurrences[0].element_version == "1.0"
+
+    def test_unversioned_elements_v1(self):
+        parser = FIMParser(open("tests/fixtures/WaBeKa.xml").read())
+        assert ("G00000032", None) in parser.elements
+
+
+class TestCompactModel:
+
+    def test_field_codes(self):
+        parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read())
+        field = parser.elements[("F00000043", "1.0")]
+        assert field.field_type is FieldType.INPUT
+        assert field.data_type == "text"
+        assert not hasattr(field, "__dict__")
+
+    def test_drop_xml(self):
+        parser = FIMParser(open("tests/fixtures/WaBeKa.xml").read(), code_list_cache=CodeListCache(offline=True))
+        # the document is dropped by default
+        assert parser.parsed_xml is None
+        schema = parser.to_json
+        parser._parse_structure()
+        assert parser.to_json == schema
+
+    def test_keep_xml(self):
+        parser = FIMParser(open("tests/fixtures/WaBeKa.xml").read(), keep_xml=True,
+                           code_list_cache=CodeListCache(offline=True))
+        assert parser.parsed_xml.children[0].xdf_stammdatenschema.xdf_id.cdata == "S00000036"
+
+
+class TestFieldTemplates:
+
+    def test_validation_constraints(self):
+        parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read())
+        field = parser.elements[("F00000175", "1.0")]
+        assert field.validation == ValidationConstraints(min_length=1, max_length=100)
+        assert field.validation.json_schema() == (("minLength", 1), ("maxLength", 100))
+        assert not ValidationConstraints.parse("{invalid")
+        assert not ValidationConstraints.parse('{"minLength": "1", "maxLength": "a lot"}')
+
+    def test_to_json_returns_copies(self):
+        parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read(), code_list_cache=CodeListCache(offline=True))
+        field = parser.elements[("F00000175", "1.0")]
+        schema = field.to_json()
+        assert schema == {"type": "string", "title": "Erteilende Behörde",
+                          "description": "Geben Sie den Namen der ausstellende Behörde an.",
+                          "minLength": 1, "maxLength": 100}
+        schema["title"] = "changed"
+        assert field.to_json()["title"] == "Erteilende Behörde"
+        assert parser.to_json["$defs"]["F00000175"]["title"] == "Erteilende Behörde"
+
+        select = parser.elements[("F00000065", "1.0")]
+        select.to_json()["enum"].append("changed")
+        assert "changed" not in parser.to_json["$defs"]["F00000065"]["enum"]
+
+    def test_invalidate_recompiles(self):
+        parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read(), code_list_cache=CodeListCache(offline=True))
+        field = parser.elements[("F00000175", "1.0")]
+        assert parser.to_json["$defs"]["F00000175"]["maxLength"] == 100
+        field._validation_details = '{"maxLength": "50"}'
+        parser.invalidate(field.id)
+        assert parser.to_json["$defs"]["F00000175"]["maxLength"] == 50
+        assert field.validation == ValidationConstraints(max_length=50)
+
+    def test_register_data_type(self, monkeypatch):
+        monkeypatch.setattr(parser_module, "DATA_TYPE_SCHEMAS", dict(parser_module.DATA_TYPE_SCHEMAS))
+        xml = open("tests/fixtures/BlaueKarte.xml").read().replace(
+            '<code>text</code></xdf:datentyp><xdf:praezisierung>{"minLength":"1","maxLength":"100"}',
+            '<code>time</code></xdf:datentyp><xdf:praezisierung>{"minLength":"1","maxLength":"100"}')
+        parser = FIMParser(xml, code_list_cache=CodeListCache(offline=True))
+        with pytest.raises(FIMParserError):
+            parser.to_json
+
+        # fields that were parsed before the data type was registered pick it up as well
+        register_data_type("time", {"type": "string", "format": "time"})
+        assert parser.to_json["$defs"]["F00000175"]["format"] == "time"
+
+
+class TestModelDump:
+
+    def test_dump_and_load(self, tmp_path):
+        parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read(), code_list_cache=CodeListCache(offline=True))
+        schema = parser.to_json
+        parser.dump(str(tmp_path / "model.pickle"))
+
+        loaded = FIMParser.load(str(tmp_path / "model.pickle"))
+        assert loaded.id == "S00000121"
+        assert loaded.parsed_xml is None
+        assert [str(i) for i in loaded.form] == [str(i) for i in parser.form]
+        assert loaded.to_json == schema
+
+    def test_incompatible_dump(self):
+        data = pickle.dumps((FIMParser.MODEL_FORMAT_VERSION + 1, None))
+        with pytest.raises(FIMParserError):
+            FIMParser.loads(data)
+
+
+class TestLazyParsing:
+
+    def test_groups_are_expanded_on_access(self):
+        parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read(), lazy=True,
+                           code_list_cache=CodeListCache(offline=True))
+        groups = [element for element in parser.elements.values() if hasattr(element, "is_expanded")]
+        assert groups and not any(group.is_expanded for group in groups)
+
+        eager = FIMParser(open("tests/fixtures/BlaueKarte.xml").read(), code_list_cache=CodeListCache(offline=True))
+        assert parser.to_json == eager.to_json
+        assert all(group.is_expanded for group in groups)
+
+    @pytest.mark.parametrize("backend", FIMParser.BACKENDS)
+    def test_section_json(self, backend):
+        parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read(), lazy=True, backend=backend,
+                           code_list_cache=CodeListCache(offline=True))
+        section = parser.section_json("G00000630")
+        schema = FIMParser(open("tests/fixtures/BlaueKarte.xml").read(),
+                           code_list_cache=CodeListCache(offline=True)).to_json
+
+        assert section["title"] == schema["$defs"]["G00000630"]["title"]
+        assert section["properties"] == schema["$defs"]["G00000630"]["properties"]
+        assert "F00000043" in section["$defs"]
+        assert set(section["$defs"]) < set(schema["$defs"])
+        # only the groups on the way to the section are parsed
+        assert not all(group.is_expanded for group in parser.elements.values() if hasattr(group, "is_expanded"))
+
+    def test_unknown_section(self):
+        parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read(), lazy=True)
+        with pytest.raises(FIMParserError):
+            parser.section_json("G99999999")
+
+    def test_dump_lazy_model(self):
+        parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read(), lazy=True,
+                           code_list_cache=CodeListCache(offline=True))
+        loaded = FIMParser.loads(parser.dumps(), code_list_cache=CodeListCache(offline=True))
+        assert loaded.to_json == parser.to_json
+
+
+class TestInstrumentation:
+
+    def test_disabled_by_default(self):
+        parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read())
+        assert parser.stats is None
+
+    @pytest.mark.parametrize("backend", FIMParser.BACKENDS)
+    def test_stats(self, backend):
+        spans = []
+        parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read(), backend=backend,
+                           code_list_cache=CodeListCache(offline=True),
+                           instrumentation=Instrumentation(callbacks=[lambda *span: spans.append(span)]))
+        parser.to_json
+
+        phases = ["parse", "code_lists", "code_list", "json"]
+        phases += ["stream"] if backend == FIMParser.BACKEND_STREAMING else ["xml", "model"]
+        assert set(parser.stats.timings) == set(phases)
+        assert parser.stats.counters["fields"] == len(set(parser.iter_fields()))
+        assert parser.stats.counters["code_list_failed"] == 4
+        assert ("code_list", {"urn": "urn:de:xoev:codeliste:erreichbarkeit"}) in [(name, attributes)
+                                                                                  for name, _, attributes in spans]
+
+    def test_dump_drops_instrumentation(self):
+        parser = FIMParser(open("tests/fixtures/WaBeKa.xml").read(), instrumentation=Instrumentation())
+        assert FIMParser.loads(parser.dumps()).stats is None
@@ -0,0 +1,61 @@
+import pytest
+
+from ozg.xdatenfelder.fim_code_lists import CodeListCache
+from ozg.xdatenfelder.parallel import ParallelFIMParser, merge_defs, split_document, read_source
+from ozg.xdatenfelder.parser import FIMParser, FIMParserError
+
+
+@pytest.fixture(params=["tests/fixtures/BlaueKarte.xml", "tests/fixtures/WaBeKa.xml"])
+def fixture(request):
+    return request.param
+
+
+@pytest.fixture(scope="module")
+def code_list_cache():
+    return CodeListCache(offline=True)
+
+
+class TestParallelFIMParser:
+
+    def test_split_document(self, fixture):
+        xml = read_source(fixture)
+        document = split_document(xml)
+        serial = FIMParser(fixture, code_list_cache=CodeListCache(offline=True))
+        assert len(document.structures) == len(serial.form)
+        assert "xdf:struktur" not in document.header.split("<xdf:stammdatenschema", 1)[1].split("<xdf:regel", 1)[0]
+        assert len(document.header) + sum(len(structure) for structure in document.structures) == len(xml)
+
+    @pytest.mark.parametrize("executor", ParallelFIMParser.EXECUTORS)
+    @pytest.mark.parametrize("backend", FIMParser.BACKENDS)
+    def test_same_as_serial(self, fixture, code_list_cache, executor, backend):
+        serial = FIMParser(fixture, code_list_cache=code_list_cache, backend=backend)
+        parser = ParallelFIMParser(fixture, code_list_cache=code_list_cache, backend=backend, workers=3,
+                                   executor=executor)
+        assert (parser.id, parser.name, parser._version) == (serial.id, serial.name, serial._version)
+        assert [str(structure) for structure in parser.form] == [str(structure) for structure in serial.form]
+        assert list(parser.elements) == list(serial.elements)
+        assert parser.to_json_bytes() == serial.to_json_bytes()
+        assert parser.etag == serial.etag
+
+    def test_adopted_elements(self, code_list_cache):
+        parser = ParallelFIMParser("tests/fixtures/WaBeKa.xml", code_list_cache=code_list_cache, workers=4)
+        for element in parser.elements.values():
+            assert element._fim_parser is parser
+        # elements used in several ranges are shared like FIMParser.intern does
+        for structure in parser.form:
+            assert parser.elements[(structure.contains.id, structure.contains.element_version)] \
+                   is structure.contains
+
+    def test_field_group_document(self, code_list_cache):
+        serial = FIMParser("tests/fixtures/groups/G00000630.xml", code_list_cache=code_list_cache)
+        parser = ParallelFIMParser("tests/fixtures/groups/G00000630.xml", code_list_cache=code_list_cache,
+                                   workers=2)
+        assert parser.to_json_bytes() == serial.to_json_bytes()
+
+    def test_unknown_executor(self):
+        with pytest.raises(FIMParserError):
+            ParallelFIMParser("tests/fixtures/BlaueKarte.xml", executor="gpu")
+
+    def test_merge_defs(self):
+        assert list(merge_defs([{"a": 1, "b": 2}, {"c": 3, "a": 4}, {"b": 5, "d": 6}]).items()) == \
+               [("a", 1), ("b", 2), ("c", 3), ("d", 6)]
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from ozg.xdatenfelder.code_list_index import CodeListIndex
+from ozg.xdatenfelder.fim_code_lists import CodeListCache, FimCodeList, prefetch_code_lists, \
+    prefetch_code_lists_async
+from ozg.xdatenfelder.parser import FIMParser
+from ozg.xdatenfelder.replay import Cassette, CassetteError, use_cassette
+from ozg.xdatenfelder.xrepository_server import XRepositoryServer
+
+from .conftest import CODE_LISTS
+
+
+class TestXRepositoryServer:
+
+    def test_concurrent_resolution(self, xrepository):
+        xrepository.latency = 0.1
+        start = time.perf_counter()
+        code_lists = prefetch_code_lists(CODE_LISTS, cache=CodeListCache(), max_workers=len(CODE_LISTS))
+        # every codelist needs two requests, all codelists are resolved at the same time
+        assert time.perf_counter() - start < 2 * 0.1 * len(CODE_LISTS)
+        assert xrepository.requests == 2 * len(CODE_LISTS)
+        assert xrepository.max_concurrency > 1
+        assert code_lists["Anrede"].dataset == [("1", "Anrede eins"), ("2", "Anrede zwei")]
+
+    def test_unknown_code_list(self, xrepository):
+        assert FimCodeList("urn:unknown", cache=CodeListCache()).version is None
+
+    def test_from_index(self, xrepository):
+        index = CodeListIndex.build(["Anrede"], cache=CodeListCache())
+        with XRepositoryServer.from_index(index) as server:
+            assert server.respond("/api/codeliste/Anrede/gueltigeVersion")[0] == 200
+            assert json.loads(server.respond("/api/version_codeliste/Anrede_1/genericode-daten")[2]) == \
+                   {"daten": [{"zelle": [{"wert": "1"}, {"wert": "Anrede eins"}]},
+                              {"zelle": [{"wert": "2"}, {"wert": "Anrede zwei"}]}]}
+
+
+class TestCassette:
+
+    def test_record_and_replay(self, xrepository, tmp_path):
+        path = str(tmp_path / "cassette.json")
+        url = f"{xrepository.url}/BlaueKarte.xml"
+        with use_cassette(path, Cassette.RECORD) as cassette:
+            schema = FIMParser(url, code_list_cache=CodeListCache()).to_json
+        # the document and two requests for each of its codelists
+        assert len(cassette) == 9
+        requests = xrepository.requests
+
+        with use_cassette(path, Cassette.REPLAY):
+            for backend in FIMParser.BACKENDS:
+                assert FIMParser(url, code_list_cache=CodeListCache(), backend=backend).to_json == schema
+        assert xrepository.requests == requests
+
+    def test_replay_unknown_request(self, xrepository, tmp_path):
+        with use_cassette(str(tmp_path / "cassette.json"), Cassette.REPLAY):
+            with pytest.raises(CassetteError):
+                FIMParser(f"{xrepository.url}/BlaueKarte.xml")
+            assert FimCodeList("Anrede", cache=CodeListCache()).version is None
+        assert xrepository.requests == 0
+
+    def test_once(self, xrepository, tmp_path):
+        path = str(tmp_path / "cassette.json")
+        with use_cassette(path):
+            FimCodeList("Anrede", cache=CodeListCache())
+        with use_cassette(path) as cassette:
+            FimCodeList("Anrede", cache=CodeListCache())
+            FimCodeList("urn:de:xoev:codeliste:erreichbarkeit", cache=CodeListCache())
+        assert xrepository.requests == 4
+        assert len(Cassette(path)) == len(cassette) == 4
+
+    def test_async_client(self, xrepository, tmp_path):
+        pytest.importorskip("httpx")
+        cassette = Cassette(str(tmp_path / "cassette.json"))
+
+        async def prefetch():
+            async with cassette.async_client() as client:
+                return await prefetch_code_lists_async(CODE_LISTS, cache=CodeListCache(), client=client)
+
+        recorded = asyncio.run(prefetch())
+        cassette.save()
+        cassette = Cassette(cassette.path, Cassette.REPLAY)
+        replayed = asyncio.run(prefetch())
+        assert xrepository.requests == 2 * len(CODE_LISTS)
+        assert {urn: code_list.dataset for urn, code_list in replayed.items()} == \
+               {urn: code_list.dataset for urn, code_list in recorded.items()}
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from ozg.cli import main
+from ozg.xdatenfelder.fim_code_lists import CodeListCache
+from ozg.xdatenfelder.parser import FIMParser, FIMParserError
+from ozg.xdatenfelder.scan import scan_file, scan_files, scan_header
+
+
+class TestScan:
+
+    @pytest.mark.parametrize("path", ["tests/fixtures/BlaueKarte.xml", "tests/fixtures/WaBeKa.xml"])
+    def test_same_as_parser(self, path):
+        parser = FIMParser(path, code_list_cache=CodeListCache(offline=True))
+        header = scan_file(path)
+        assert header.path == path
+        assert header.element_type == "stammdatenschema"
+        assert header.fim_version == parser._version
+        assert (header.id, header.element_version, header.name, header.input_name, header.output_name,
+                header.description, header.internal_definition, header.relation) == \
+               (parser.id, parser.element_version, parser.name, parser.input_name, parser.output_name,
+                parser.description, parser.internal_definition, parser.relation)
+        assert header.metadata == parser.metadata
+
+    def test_stops_at_the_first_structure(self):
+        xml = open("tests/fixtures/BlaueKarte.xml", encoding="utf-8").read()
+        # everything after the first structure is never read
+        truncated = xml[:xml.index("<xdf:struktur>") + len("<xdf:struktur>")] + "<broken"
+        header = scan_header(truncated)
+        assert header.id == "S00000121"
+        assert header.status == "inVorbereitung"
+        assert header.path is None
+
+    def test_field_group_document(self):
+        header = scan_file("tests/fixtures/groups/G00000630.xml")
+        assert header.element_type == "datenfeldgruppe"
+        assert header.id == "G00000630"
+        assert header.metadata["version_note"] == "Automatisch erzeugte Version"
+
+    def test_invalid_documents(self, tmp_path):
+        with pytest.raises(FIMParserError):
+            scan_header('<xdf:schema xmlns:xdf="urn:unknown"><xdf:stammdatenschema/></xdf:schema>')
+        with pytest.raises(FIMParserError):
+            scan_header("no xml")
+        empty = tmp_path / "empty.xml"
+        empty.write_bytes(b"")
+        with pytest.raises(FIMParserError):
+            scan_file(str(empty))
+
+    @pytest.mark.parametrize("processes", [1, 2])
+    def test_scan_files(self, tmp_path, processes):
+        broken = tmp_path / "broken.xml"
+        broken.write_text("<xdf:schema")
+        paths = ["tests/fixtures/BlaueKarte.xml", str(broken), "tests/fixtures/WaBeKa.xml"]
+        results = list(scan_files(paths, processes=processes, chunksize=1))
+        assert [result.path for result in results] == paths
+        assert [result.ok for result in results] == [True, False, True]
+        assert results[1].error.startswith("FIMParserError")
+        assert results[2].header.id == "S00000036"
+
+    def test_cli(self, capsys):
+        assert main(["list", "tests/fixtures", "-j", "1"]) == 0
+        assert capsys.readouterr().out.splitlines() == [
+            "S00000121\t1.0\tinVorbereitung\tAntrag Blaue Karte EU\ttests/fixtures/BlaueKarte.xml",
+            "S00000036\t-\tinVorbereitung\tWaffenbesitzkarte (WBK grün)\ttests/fixtures/WaBeKa.xml",
+        ]
+        assert main(["list", "tests/fixtures/WaBeKa.xml", "--json"]) == 0
+        assert json.loads(capsys.readouterr().out)["id"] == "S00000036"
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+import shutil
+
+from ozg.xdatenfelder.fim_code_lists import CodeListCache
+from ozg.xdatenfelder.parser import FIMParser
+from ozg.xdatenfelder.service import SchemaRepository, SchemaServer
+
+
+async def request(server: SchemaServer, path: str, headers: dict = None, method: str = "GET"):
+    """sends a request on a new connection and returns status, headers and body"""
+    host, port = server._server.sockets[0].getsockname()[:2]
+    reader, writer = await asyncio.open_connection(host, port)
+    lines = [f"{method} {path} HTTP/1.1", "Host: localhost", "Connection: close"]
+    lines += [f"{key}: {value}" for key, value in (headers or {}).items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+    response = await reader.read()
+    writer.close()
+    head, body = response.split(b"\r\n\r\n", 1)
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    headers = dict(line.split(": ", 1) for line in header_lines)
+    return int(status_line.split(" ")[1]), headers, body
+
+
+def copy_fixtures(directory, *names):
+    for name in names:
+        shutil.copy(os.path.join("tests/fixtures", name), str(directory))
+
+
+class TestSchemaRepository:
+
+    def test_reload_only_changed_files(self, tmp_path):
+        copy_fixtures(tmp_path, "BlaueKarte.xml", "WaBeKa.xml")
+        repository = SchemaRepository(str(tmp_path), code_list_cache=CodeListCache(offline=True))
+        assert len(repository.reload()[0]) == 2
+        routes = repository._routes
+        assert repository.reload() == ([], [])
+        assert repository._routes is routes
+
+        blaue_karte = str(tmp_path / "BlaueKarte.xml")
+        os.utime(blaue_karte, ns=(0, 0))
+        os.remove(str(tmp_path / "WaBeKa.xml"))
+        assert repository.reload() == ([blaue_karte], [str(tmp_path / "WaBeKa.xml")])
+        assert repository.lookup("/schemas/S00000036") is None
+
+    def test_broken_files_keep_the_previous_version(self, tmp_path):
+        copy_fixtures(tmp_path, "WaBeKa.xml")
+        repository = SchemaRepository(str(tmp_path), code_list_cache=CodeListCache(offline=True))
+        repository.reload()
+        schema = repository.lookup("/schemas/S00000036")
+
+        with open(str(tmp_path / "WaBeKa.xml"), "a") as fh:
+            fh.write("<broken")
+        assert repository.reload() == ([], [])
+        assert repository.lookup("/schemas/S00000036") is schema
+        assert list(repository.errors) == [str(tmp_path / "WaBeKa.xml")]
+
+        # the errors are a snapshot that is swapped, not changed, by the next reload
+        errors = repository._errors
+        copy_fixtures(tmp_path, "WaBeKa.xml")
+        assert repository.reload()[0] == [str(tmp_path / "WaBeKa.xml")]
+        assert repository.errors == {}
+        assert list(errors) == [str(tmp_path / "WaBeKa.xml")]
+
+
+class TestSchemaServer:
+
+    def test_responses(self, tmp_path):
+        copy_fixtures(tmp_path, "BlaueKarte.xml", "WaBeKa.xml")
+        parser = FIMParser("tests/fixtures/BlaueKarte.xml", code_list_cache=CodeListCache(offline=True))
+
+        async def run():
+            server = SchemaServer(str(tmp_path), port=0, reload_interval=0,
+                                  code_list_cache=CodeListCache(offline=True))
+            await server.start()
+            try:
+                status, _, body = await request(server, "/schemas")
+                assert status == 200
+                assert [(item["id"], item["path"]) for item in json.loads(body)] == \
+                       [("S00000036", "/schemas/S00000036"), ("S00000121", "/schemas/S00000121/1.0")]
+
+                status, headers, body = await request(server, "/schemas/S00000121")
+                assert status == 200
+                assert body == parser.to_json_bytes()
+                assert headers["ETag"] == parser.etag
+                assert (await request(server, "/schemas/S00000121/1.0"))[2] == body
+
+                status, _, body = await request(server, "/schemas/S00000121", {"If-None-Match": parser.etag})
+                assert (status, body) == (304, b"")
+                status, headers, body = await request(server, "/schemas/S00000121", method="HEAD")
+                assert (status, headers["Content-Length"], body) == (200, str(len(parser.to_json_bytes())), b"")
+
+                status, _, body = await request(server, "/codelists/urn:de:xoev:codeliste:erreichbarkeit")
+                assert status == 200 and json.loads(body)["urn"] == "urn:de:xoev:codeliste:erreichbarkeit"
+
+                assert (await request(server, "/schemas/S00000999"))[0] == 404
+                assert (await request(server, "/schemas", method="POST"))[0] == 405
+
+                status, _, body = await request(server, "/metrics")
+                metrics = json.loads(body)
+                assert metrics["counters"]["hits"] == 5
+                assert metrics["counters"]["not_modified"] == 1
+                assert metrics["counters"]["misses"] == 1
+                assert metrics["latency_ms"]["samples"] == 8
+                assert metrics["schemas"] == 2
+            finally:
+                await server.stop()
+
+        asyncio.run(run())
+
+    def test_keep_alive(self, tmp_path):
+        copy_fixtures(tmp_path, "WaBeKa.xml")
+
+        async def run():
+            server = SchemaServer(str(tmp_path), port=0, reload_interval=0,
+                                  code_list_cache=CodeListCache(offline=True))
+            await server.start()
+            host, port = server._server.sockets[0].getsockname()[:2]
+            reader, writer = await asyncio.open_connection(host, port)
+            try:
+                for _ in range(3):
+                    writer.write(b"GET /schemas HTTP/1.1\r\nHost: localhost\r\n\r\n")
+                    head = await reader.readuntil(b"\r\n\r\n")
+                    assert head.startswith(b"HTTP/1.1 200 OK")
+                    length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+                    await reader.readexactly(length)
+            finally:
+                writer.close()
+                await server.stop()
+
+        asyncio.run(run())
+
+    def test_hot_reload(self, tmp_path):
+        copy_fixtures(tmp_path, "WaBeKa.xml")
+
+        async def run():
+            server = SchemaServer(str(tmp_path), port=0, reload_interval=0.05,
+                                  code_list_cache=CodeListCache(offline=True))
+            await server.start()
+            try:
+                assert (await request(server, "/schemas/S00000121"))[0] == 404
+                copy_fixtures(tmp_path, "BlaueKarte.xml")
+                for _ in range(100):
+                    await asyncio.sleep(0.05)
+                    if (await request(server, "/schemas/S00000121"))[0] == 200:
+                        break
+                assert (await request(server, "/schemas/S00000121"))[0] == 200
+                assert server.metrics.stats.counters["reloaded_files"] == 2
+            finally:
+                await server.stop()
+
+        asyncio.run(run())
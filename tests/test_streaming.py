@@ -0,0 +1,64 @@
+from xml.etree import ElementTree as StdlibElementTree
+
+import pytest
+import untangle
+
+from ozg.xdatenfelder import streaming
+
+
+@pytest.fixture(params=["xml.etree", "lxml"])
+def element_tree(request, monkeypatch):
+    """runs the test with the stdlib parser and with lxml (if it is installed)"""
+    if request.param == "lxml":
+        module = pytest.importorskip("lxml.etree")
+    else:
+        module = StdlibElementTree
+    monkeypatch.setattr(streaming, "ElementTree", module)
+    return module
+
+
+def as_tuple(element):
+    return (element._name, dict(element._attributes or {}), element.cdata.strip(),
+            [as_tuple(child) for child in element.children])
+
+
+class TestStreamingParser:
+
+    @pytest.mark.parametrize("fixture", ["tests/fixtures/BlaueKarte.xml", "tests/fixtures/WaBeKa.xml"])
+    def test_same_tree_as_untangle(self, element_tree, fixture):
+        expected = as_tuple(untangle.parse(fixture))
+        assert as_tuple(streaming.parse(fixture)) == expected
+        assert as_tuple(streaming.parse(open(fixture, encoding="utf-8").read())) == expected
+        # the result does not depend on how the document is split into chunks
+        assert as_tuple(streaming.StreamingParser().parse(fixture, chunk_size=7)) == expected
+
+    def test_handlers(self, element_tree):
+        started, ended = [], []
+
+        def start(element, parent):
+            started.append((element._name, dict(element._attributes), parent._name))
+
+        def end(element, parent):
+            ended.append(element._name)
+            return element._name != "x_b"
+
+        document = streaming.parse('<x:a xmlns:x="urn:x" id="1"><x:b>one</x:b><x:c>two</x:c></x:a>',
+                                   start=start, end=end)
+        assert started == [("x_a", {"xmlns:x": "urn:x", "id": "1"}, None), ("x_b", {}, "x_a"), ("x_c", {}, "x_a")]
+        assert ended == ["x_b", "x_c", "x_a"]
+        # elements the end handler returns False for are not kept
+        assert [child._name for child in document.x_a.children] == ["x_c"]
+        assert document.x_a.x_c.cdata == "two"
+
+    def test_incremental_feeding(self, element_tree):
+        completed = []
+        parser = streaming.StreamingParser(end=lambda element, parent: completed.append(element._name))
+        parser.feed(b"<a><b/>")
+        assert completed == ["b"]
+        parser.feed(b"<c/></a>")
+        assert parser.close().a.get_elements() != []
+        assert completed == ["b", "c", "a"]
+
+    def test_invalid_xml(self, element_tree):
+        with pytest.raises(streaming.ElementTree.ParseError):
+            streaming.parse("<a><b></a>")
@@ -0,0 +1,42 @@
+import pytest
+
+from ozg.xdatenfelder.parser import FIMParser
+from ozg.xdatenfelder.validator import SubmissionValidator, ValidationError
+
+
+class TestSubmissionValidator:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, offline_cache, minimal_submission):
+        self.parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read(), code_list_cache=offline_cache)
+        self.validator = SubmissionValidator(self.parser)
+        self.submission = minimal_submission(self.parser)
+
+    def test_valid_submission(self):
+        assert self.validator.validate(self.submission) == []
+        assert self.validator.is_valid(self.submission)
+
+    def test_all_errors_are_reported(self):
+        self.submission["G00000630"]["F00000013"] = ""
+        self.submission["G00000630"]["F00000045"] = 3
+        del self.submission["G00000771"]
+        assert self.validator.validate(self.submission) == [
+            ValidationError(("G00000630", "F00000013"), "must be at least 1 characters long"),
+            ValidationError(("G00000630", "F00000045"), "must be a string"),
+            ValidationError(("G00000771",), "is required"),
+        ]
+
+    def test_code_list_choices(self):
+        self.submission["G00000630"]["F00000065"] = "Frankreich"
+        assert self.validator.validate(self.submission) == []
+        self.submission["G00000630"]["F00000065"] = "000"
+        assert self.validator.validate(self.submission) == [
+            ValidationError(("G00000630", "F00000065"), "is not a valid choice"),
+        ]
+
+    def test_validate_many(self):
+        results = list(self.validator.validate_many([self.submission, {}, []]))
+        assert results[0] == []
+        assert len(results[1]) > 0
+        assert results[2] == [ValidationError((), "must be an object")]
+        assert results[2][0].pointer == ""
@@ -0,0 +1,83 @@
+import io
+from xml.etree import ElementTree
+
+import pytest
+
+from ozg.xdatenfelder.parser import FIMParser, FIMParserError
+from ozg.xdatenfelder.xoev import XOEVSerializer
+
+
+class TestXOEVSerializer:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, offline_cache, minimal_submission):
+        self.code_list_cache = offline_cache
+        self.parser = FIMParser(open("tests/fixtures/BlaueKarte.xml").read(), code_list_cache=offline_cache)
+        self.serializer = XOEVSerializer(self.parser, namespace="urn:ozg:test")
+        self.submission = minimal_submission(self.parser)
+
+    def test_to_xml(self):
+        self.submission["G00000630"]["F00000013"] = "Müller & Söhne"
+        document = ElementTree.fromstring(self.serializer.to_xml(self.submission).encode("utf-8"))
+        namespace = "{urn:ozg:test}"
+        assert document.tag == f"{namespace}S00000121"
+        assert document.find(f"{namespace}G00000630/{namespace}F00000013").text == "Müller & Söhne"
+
+        # code lists are serialized with their key
+        code = document.find(f"{namespace}G00000630/{namespace}F00000065")
+        assert code.get("listURI") == "urn:xpersonenstand:schluesseltabelle:geschlecht"
+        assert code.get("listVersionID") == "1"
+        assert code.find(f"{namespace}code").text == "000"
+
+    def test_repeated_structures(self):
+        parser = FIMParser(open("tests/fixtures/WaBeKa.xml").read(), code_list_cache=self.code_list_cache)
+        structure = next(structure for structure in parser.form if structure.max_items > 1)
+        xml = XOEVSerializer(parser).to_xml({structure.contains.id: [{}, {}, {}]})
+        assert xml.count(f"<{structure.contains.id}>") == 3
+
+    def test_invalid_choice(self):
+        self.submission["G00000630"]["F00000065"] = "Atlantis"
+        with pytest.raises(FIMParserError):
+            self.serializer.to_xml(self.submission)
+
+    def test_null_values(self):
+        self.submission["G00000630"]["F00000013"] = None
+        xml = self.serializer.to_xml(self.submission)
+        assert "F00000013" not in xml
+        assert "None" not in xml
+
+        self.submission["G00000630"] = None
+        assert "G00000630" not in self.serializer.to_xml(self.submission)
+
+        parser = FIMParser(open("tests/fixtures/WaBeKa.xml").read(), code_list_cache=self.code_list_cache)
+        structure = next(structure for structure in parser.form if structure.max_items > 1)
+        xml = XOEVSerializer(parser).to_xml({structure.contains.id: [{}, None, {}]})
+        assert xml.count(f"<{structure.contains.id}>") == 2
+
+    def test_invalid_types(self):
+        for value in ["Müller", ["Müller"]]:
+            with pytest.raises(FIMParserError):
+                self.serializer.to_xml(dict(self.submission, G00000630=value))
+
+        self.submission["G00000630"]["F00000013"] = {"name": "Müller"}
+        with pytest.raises(FIMParserError):
+            self.serializer.to_xml(self.submission)
+        self.submission["G00000630"]["F00000013"] = "Müller"
+        self.submission["G00000630"]["F00000065"] = ["männlich"]
+        with pytest.raises(FIMParserError):
+            self.serializer.to_xml(self.submission)
+
+        parser = FIMParser(open("tests/fixtures/WaBeKa.xml").read(), code_list_cache=self.code_list_cache)
+        structure = next(structure for structure in parser.form if structure.max_items > 1)
+        with pytest.raises(FIMParserError):
+            XOEVSerializer(parser).to_xml({structure.contains.id: {}})
+
+    def test_write_many(self):
+        def submissions():
+            for _ in range(3):
+                yield self.submission
+
+        fh = io.BytesIO()
+        self.serializer.write_many(submissions(), fh)
+        document = ElementTree.fromstring(fh.getvalue())
+        assert len(document) == 3
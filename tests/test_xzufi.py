@@ -0,0 +1,95 @@
+import pytest
+
+from ozg.xdatenfelder import streaming
+from ozg.xdatenfelder.fim_code_lists import CodeListCache
+from ozg.xzufi.parser import LeikaTextModule, XZuFiParser, XZuFiParserError
+
+LEISTUNGEN = "tests/fixtures/xzufi/leistungen.xml"
+
+
+class TestXZuFiParser:
+
+    def test_leistungen(self, offline_cache):
+        parser = XZuFiParser(LEISTUNGEN, code_list_cache=offline_cache)
+        leistungen = list(parser)
+        assert parser.version == "http://xoev.de/schemata/xzufi/2_2_0"
+        assert [leistung.id for leistung in leistungen] == \
+               ["L100001_99010003001000", "L100001_99089001001000", "L100001_99102013000000"]
+
+        blaue_karte = leistungen[0]
+        assert blaue_karte.leika_key == "99010003001000"
+        assert blaue_karte.name == "Aufenthaltstitel Blaue Karte EU Erteilung"
+        assert blaue_karte.description == "Die Blaue Karte EU ist ein Aufenthaltstitel für Hochqualifizierte."
+        assert blaue_karte.relation == "§ 19a AufenthG"
+        assert blaue_karte.text(LeikaTextModule.RECHTSGRUNDLAGE) == "§ 19a AufenthG"
+        assert blaue_karte.typification == ["1"]
+        assert blaue_karte.schema_ids == ["S00000121"]
+
+        # texts in other languages are used if there is no german one
+        assert leistungen[2].name == "Only in english"
+        assert leistungen[2].leika_key is None
+        assert leistungen[2].schema_ids == []
+
+    def test_language(self):
+        leistung = next(iter(XZuFiParser(LEISTUNGEN, language="en")))
+        assert leistung.name == "EU Blue Card issuance"
+
+    def test_text_modules(self, offline_cache):
+        leistung = next(iter(XZuFiParser(LEISTUNGEN, code_list_cache=offline_cache)))
+        assert leistung.text_modules == {"Leistungsbezeichnung": "Aufenthaltstitel Blaue Karte EU Erteilung",
+                                         "Volltext": leistung.description, "Rechtsgrundlage(n)": "§ 19a AufenthG"}
+
+    def test_incremental(self):
+        # every Leistung is yielded as soon as it is parsed and its xml is freed
+        parser = XZuFiParser(LEISTUNGEN, chunk_size=512)
+        leistungen = parser.iter_leistungen()
+        first = next(leistungen)
+        assert first.id == "L100001_99010003001000"
+        assert len(list(leistungen)) == 2
+
+    def test_frees_other_elements(self, monkeypatch):
+        # organisational units and other elements next to the Leistungen are not kept in the wrapper
+        documents = []
+
+        class StreamingParser(streaming.StreamingParser):
+            def __init__(self, document, *args):
+                documents.append(document)
+                super().__init__(document, *args)
+
+        monkeypatch.setattr(streaming, "StreamingParser", StreamingParser)
+        units = "<xzufi:organisationseinheit><xzufi:id>O1</xzufi:id></xzufi:organisationseinheit>" * 1000
+        xml = ('<xzufi:transfer.operation.initiieren xmlns:xzufi="http://xoev.de/schemata/xzufi/2_2_0">'
+               '<xzufi:schreibe><xzufi:leistung><xzufi:id>L1</xzufi:id></xzufi:leistung>' + units +
+               '<xzufi:leistung><xzufi:id>L2</xzufi:id></xzufi:leistung>' + units + '</xzufi:schreibe>'
+               '</xzufi:transfer.operation.initiieren>')
+
+        leistungen = XZuFiParser(xml, chunk_size=512).iter_leistungen()
+        assert next(leistungen).id == "L1"
+        wrapper = documents[0].children[0].children[0]
+        assert len(wrapper.children) < 10
+        assert next(leistungen).id == "L2"
+        assert len(wrapper.children) < 10
+        assert list(leistungen) == []
+        assert len(wrapper.children) == 0
+
+    def test_schemas_from_directory(self):
+        parser = XZuFiParser(LEISTUNGEN, schemas="tests/fixtures", code_list_cache=CodeListCache(offline=True))
+        blaue_karte, waffenbesitzkarte, _ = list(parser)
+        assert [schema.id for schema in blaue_karte.schemas] == ["S00000121"]
+        # S00000999 is not part of the directory
+        assert waffenbesitzkarte.schema_ids == ["S00000036", "S00000999"]
+        assert [schema.name for schema in waffenbesitzkarte.schemas] == ["Waffenbesitzkarte (WBK grün)"]
+        # schemas are parsed once per parser
+        assert parser.schema("S00000121") is blaue_karte.schemas[0]
+
+    def test_schemas_from_mapping(self):
+        parser = XZuFiParser(LEISTUNGEN, schemas={"S00000036": "tests/fixtures/WaBeKa.xml"},
+                             code_list_cache=CodeListCache(offline=True), schema_cache_size=1)
+        assert parser.schema("S00000036").id == "S00000036"
+        assert parser.schema("S00000121") is None
+
+    def test_invalid_documents(self):
+        with pytest.raises(XZuFiParserError):
+            list(XZuFiParser('<xdf:schema xmlns:xdf="urn:xoev-de:fim:standard:xdatenfelder_2"/>'))
+        with pytest.raises(XZuFiParserError):
+            list(XZuFiParser('<xzufi:leistungen xmlns:xzufi="http://xoev.de/schemata/xzufi/2_2_0"><broken'))